@@ -0,0 +1,270 @@
+"""
+Benchmarks for the parsers and pinout generators in this repository.
+
+Each benchmark times one path over fixed inputs from the repository:
+
+    afdb-parse        parse pinout/pybv10b/stm32f4xx_af.csv
+    afdb-load         load the same table from the on-disk cache
+    gerber-<name>     parse each Gerber layer in gerber/
+    excellon-<name>   parse each drill file in gerber/
+    eagle-<name>      parse each Eagle file in eagle/
+    pybv10b-render    a make_pinout() for pybv10b, reusing the static layer
+    pybv10b-render-cold
+                      the same with the static layer and decoded pngs
+                      dropped first, so the board photo is drawn each time
+    pybv3-render      the pybv3 do_work()
+    draw-text-box     draw_text_box with a plain, rotated and detail label
+
+The render benchmarks need pycairo and are skipped without it, and
+pybv10b-render is also skipped without pybv10b-front-trans.png.  A
+benchmark that raises is reported as failed and the others still run.
+Results (median, min and samples in seconds) are written as JSON; the exit
+status is 1 if any benchmark failed or, given a baseline from an earlier
+run, if any median is slower than the baseline by more than the tolerance.
+Everything runs offline, with the cache in a temporary directory so runs
+do not depend on each other.
+
+    python bench.py -o results.json
+    python bench.py --baseline results.json --tolerance 0.2
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+top_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(top_dir, 'tools'))
+
+# name -> function returning the callable to time, or None to skip
+benchmarks = {}
+
+def benchmark(func):
+    benchmarks[func.__name__.replace('_', '-')] = func
+    return func
+
+def have_cairo():
+    return importlib.util.find_spec('cairo') is not None
+
+def load_script(name, path):
+    # import a generator script by path; it is run from its own directory
+    # because it reads its assets relative to the current directory
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+@benchmark
+def afdb_parse():
+    import afdb
+    filename = os.path.join(top_dir, 'pinout', 'pybv10b', 'stm32f4xx_af.csv')
+    return lambda: afdb.parse(filename)
+
+@benchmark
+def afdb_load():
+    import afdb
+    filename = os.path.join(top_dir, 'pinout', 'pybv10b', 'stm32f4xx_af.csv')
+    afdb.load(filename)
+    return lambda: afdb.load(filename)
+
+def _gerber_files(exts):
+    d = os.path.join(top_dir, 'gerber')
+    return sorted(f for f in os.listdir(d) if os.path.splitext(f)[1] in exts)
+
+def _add_file_benchmarks():
+    import eagle
+    import excellon
+    import gerber
+    import xml.etree.ElementTree as ET
+    for f in _gerber_files(('.bot', '.top', '.mil', '.smb', '.smt', '.sst')):
+        path = os.path.join(top_dir, 'gerber', f)
+        benchmarks['gerber-' + f] = lambda path=path: (lambda: gerber.read(path))
+    for f in _gerber_files(('.drd',)):
+        path = os.path.join(top_dir, 'gerber', f)
+        benchmarks['excellon-' + f] = lambda path=path: (lambda: excellon.read(path))
+    for f in sorted(os.listdir(os.path.join(top_dir, 'eagle'))):
+        path = os.path.join(top_dir, 'eagle', f)
+        if f.endswith('.sch'):
+            parse = eagle.parse_schematic
+        elif f.endswith('.brd'):
+            parse = eagle.parse_board
+        else:
+            # libraries are only read as XML; nothing indexes them
+            parse = ET.parse
+        benchmarks['eagle-' + f] = lambda path=path, parse=parse: (lambda: parse(path))
+
+def _pybv10b_script():
+    # the loaded pybv10b generator and a file to render into, or None
+    board_dir = os.path.join(top_dir, 'pinout', 'pybv10b')
+    # the board photo is not in the repository; it has to be supplied
+    if not have_cairo() or not os.path.exists(os.path.join(board_dir, 'pybv10b-front-trans.png')):
+        return None
+    os.chdir(board_dir)
+    sys.path.insert(0, board_dir)
+    mod = load_script('pybv10b_pinout', os.path.join(board_dir, 'pinout.py'))
+    return mod, os.path.join(tempfile.mkdtemp(), 'pinout.png')
+
+@benchmark
+def pybv10b_render():
+    script = _pybv10b_script()
+    if script is None:
+        return None
+    mod, out = script
+    return lambda: mod.make_pinout(out)
+
+@benchmark
+def pybv10b_render_cold():
+    script = _pybv10b_script()
+    if script is None:
+        return None
+    mod, out = script
+    def run():
+        mod._static_layers.clear()
+        mod._png_cache.clear()
+        mod.make_pinout(out)
+    return run
+
+@benchmark
+def pybv3_render():
+    if not have_cairo():
+        return None
+    # do_work() writes pinout.png to the current directory, so run it in a
+    # copy of the assets
+    board_dir = os.path.join(top_dir, 'pinout', 'pybv3')
+    work = tempfile.mkdtemp()
+    for f in ('trans-logo-sml.png', 'pybv3.png'):
+        shutil.copy(os.path.join(board_dir, f), work)
+    os.chdir(work)
+    mod = load_script('pybv3_pinout', os.path.join(board_dir, 'pinout.py'))
+    return mod.do_work
+
+@benchmark
+def draw_text_box():
+    if not have_cairo():
+        return None
+    import cairo
+    board_dir = os.path.join(top_dir, 'pinout', 'pybv10b')
+    os.chdir(board_dir)
+    sys.path.insert(0, board_dir)
+    mod = load_script('pybv10b_pinout', os.path.join(board_dir, 'pinout.py'))
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 400, 400)
+    cr = cairo.Context(surface)
+    def run():
+        mod.draw_text_box(cr, 'X1', (), (100, 100, 70, 40), (0.9, 0.8, 0.3))
+        mod.draw_text_box(cr, 'C13 (3mA)', ('c90',), (200, 200, 40, 120), (1.0, 1.0, 1.0), font_size=20)
+        mod.draw_text_box(cr, 'SPI(1)', ('r', 'MOSI', 'MISO', 'SCK', '/SS'), (300, 200, 80, 170), (0.4, 0.9, 0.4))
+    return run
+
+def measure(func, repeat, min_time):
+    # like timeit: find a loop count that runs for at least min_time, then
+    # take repeat samples of the time per call
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            func()
+        t = time.perf_counter() - t0
+        if t >= min_time:
+            break
+        loops *= 2 if t == 0 else max(2, min(10, int(min_time / t) + 1))
+    samples = [t / loops]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - t0) / loops)
+    return {'median': statistics.median(samples), 'min': min(samples), 'loops': loops, 'samples': samples}
+
+def run(patterns, repeat, min_time):
+    # returns the results, and the names of benchmarks that raised
+    results = {}
+    failed = []
+    cwd = os.getcwd()
+    for name in sorted(benchmarks):
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        try:
+            func = benchmarks[name]()
+            if func is None:
+                print('%-28s skipped' % name)
+                continue
+            # anything the code under test prints is not part of the report
+            with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+                results[name] = measure(func, repeat, min_time)
+        except Exception as er:
+            print('%-28s FAILED: %s: %s' % (name, type(er).__name__, er))
+            failed.append(name)
+            continue
+        finally:
+            os.chdir(cwd)
+        print('%-28s %10.3f ms' % (name, 1e3 * results[name]['median']))
+    return results, failed
+
+def compare(results, baseline, tolerance):
+    # returns the names of benchmarks whose median regressed
+    regressed = []
+    for name, r in sorted(results.items()):
+        b = baseline.get(name)
+        if b is None:
+            continue
+        ratio = r['median'] / b['median'] if b['median'] else 1.0
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSED'
+            regressed.append(name)
+        print('%-28s %10.3f ms  baseline %10.3f ms  %+6.1f%%%s' % (
+            name, 1e3 * r['median'], 1e3 * b['median'], 100 * (ratio - 1), flag))
+    return regressed
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Benchmark the parsers and pinout generators.')
+    cmd_parser.add_argument('pattern', nargs='*', help='only run benchmarks matching these glob patterns')
+    cmd_parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    cmd_parser.add_argument('-b', '--baseline', help='compare against the results in this JSON file')
+    cmd_parser.add_argument('-t', '--tolerance', type=float, default=0.2, help='allowed slowdown of the median before failing (default 0.2 = 20%%)')
+    cmd_parser.add_argument('-r', '--repeat', type=int, default=7, help='samples per benchmark')
+    cmd_parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per sample')
+    args = cmd_parser.parse_args()
+
+    # a private cache, so that parse timings do not depend on earlier runs
+    cache_dir = tempfile.mkdtemp(prefix='pyboard-bench-')
+    os.environ['PYBOARD_CACHE_DIR'] = cache_dir
+    try:
+        _add_file_benchmarks()
+        results, failed = run(args.pattern, args.repeat, args.min_time)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results}, f, indent=1)
+            f.write('\n')
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressed = compare(results, baseline, args.tolerance)
+        if regressed:
+            print('%d benchmark%s regressed by more than %.0f%%' % (
+                len(regressed), '' if len(regressed) == 1 else 's', 100 * args.tolerance))
+            status = 1
+    if failed:
+        print('%d benchmark%s failed: %s' % (len(failed), '' if len(failed) == 1 else 's', ', '.join(failed)))
+        status = 1
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
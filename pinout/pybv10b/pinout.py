@@ -8,118 +8,134 @@ Copyright (c) 2013, 2014 Damien P. George
 
 import argparse
 import math
-import re
+import multiprocessing
+import os
+import sys
+from collections import OrderedDict
 import cairo
 
-board_unit_x = 0
-board_unit_y = 0
-
-class Pin:
-    def __init__(self, name, label, pos, cpu):
-        self.name = name
-        self.label = label
-        self.pos = pos
-        self.cpu = cpu
-        self.tim = [None, None, None]
-
-# pos is from top left, which is (1,1)
-pin_info = [
-    Pin('X1', 'X1', (12, 16), 'A0'),
-    Pin('X2', 'X2', (12, 15), 'A1'),
-    Pin('X3', 'X3', (12, 14), 'A2'),
-    Pin('X4', 'X4', (12, 13), 'A3'),
-    Pin('X5', 'X5', (12, 12), 'A4'),
-    Pin('X6', 'X6', (12, 11), 'A5'),
-    Pin('X7', 'X7', (12, 10), 'A6'),
-    Pin('X8', 'X8', (12, 9), 'A7'),
-
-    Pin('X9', 'X9', (1, 9), 'B6'),
-    Pin('X10', 'X10', (1, 10), 'B7'),
-    Pin('X11', 'X11', (1, 11), 'C4'),
-    Pin('X12', 'X12', (1, 12), 'C5'),
-    Pin('X13', 'RST', (1, 13), None),
-    Pin('X14', 'GND', (1, 14), None),
-    Pin('X15', '3V3', (1, 15), None),
-    Pin('X16', 'VIN', (1, 16), None),
-
-    Pin('X17', 'X17', (2, 16), 'B3'),
-    Pin('X18', 'X18', (3, 16), 'C13'),
-    Pin('X19', 'X19', (4, 16), 'C0'),
-    Pin('X20', 'X20', (5, 16), 'C1'),
-    Pin('X21', 'X21', (6, 16), 'C2'),
-    Pin('X22', 'X22', (7, 16), 'C3'),
-    Pin('X23', 'A3V3', (8, 16), None),
-    Pin('X24', 'AGND', (9, 16), None),
-
-    Pin('P1', 'BOOT0', (2, 15), None),
-    Pin('P2', 'P2', (3, 15), 'B4'),
-    Pin('P3', 'P3', (4, 15), 'A15'),
-    Pin('P4', 'P4', (5, 15), 'A14'),
-    Pin('P5', 'P5', (6, 15), 'A13'),
-    Pin('P6', 'VBAT', (7, 15), None),
-    Pin('P7', 'VIN', (8, 15), None),
-    Pin('P8', 'GND', (9, 15), None),
-
-    Pin('Y1', 'Y1', (1, 1), 'C6'),
-    Pin('Y2', 'Y2', (1, 2), 'C7'),
-    Pin('Y3', 'Y3', (1, 3), 'B8'),
-    Pin('Y4', 'Y4', (1, 4), 'B9'),
-    Pin('Y5', 'Y5', (1, 5), 'B12'),
-    Pin('Y6', 'Y6', (1, 6), 'B13'),
-    Pin('Y7', 'Y7', (1, 7), 'B14'),
-    Pin('Y8', 'Y8', (1, 8), 'B15'),
-
-    Pin('Y9', 'Y9', (12, 8), 'B10'),
-    Pin('Y10', 'Y10', (12, 7), 'B11'),
-    Pin('Y11', 'Y11', (12, 6), 'B0'),
-    Pin('Y12', 'Y12', (12, 5), 'B1'),
-    Pin('Y13', 'RST', (12, 4), None),
-    Pin('Y14', 'GND', (12, 3), None),
-    Pin('Y15', '3V3', (12, 2), None),
-    Pin('Y16', 'VIN', (12, 1), None),
-]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+import afdb
+import buildcache
+import phasetime
+import surfaces
+import textcache
 
-# parse af from csv
-with open('stm32f4xx_af.csv') as f:
-    tim_idx = {
-        1:0, 2:0,
-        4:1, 5:1, 6:1, 7:1, 8:1,
-        9:2, 10:2, 11:2, 12:2, 13:2, 14:2
-    }
-    f.readline() # skip header
-    for line in f:
-        port, pin_name, *afs = line.strip().split(',')
-        pin_name = pin_name[1:] # skip letter "P"
-        pin = None
-        for p in pin_info:
-            if p.cpu == pin_name:
-                pin = p
-                break
-        if pin is None:
-            continue
-        afs2 = []
-        for af in afs:
-            afs2.extend(af.split('/'))
-        for af in afs2:
-            m = re.match(r'TIM(\d{1,2})_CH\dN?', af)
-            if m and int(m.group(1)) in tim_idx:
-                pin.tim[tim_idx[int(m.group(1))]] = af
+from pins import pin_info
 
-def make_pinout():
-    global board_unit_x, board_unit_y
+def load_af_db():
+    # fill in timers from the af database
+    global af_db
+    with phasetime.phase('af parse'):
+        af_db = afdb.load('stm32f4xx_af.csv')
+    for pin in pin_info:
+        pin.tim = [sig for tim, sig in af_db.timer_channels(pin.cpu)]
 
-    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 2000, 1500)
+load_af_db()
 
-    cr = cairo.Context(surface)
+# size of the drawing, in the units of all the layout below; outputs are
+# scaled from this
+width, height = 2000, 1500
+
+# layout of the labels, relative to the top-left pin of the board
+board_unit_x = 43.6
+board_unit_y = 43.4
+
+board_left = 0 * board_unit_x
+board_top = 0 * board_unit_y
+board_right = 11 * board_unit_x
+board_bottom = 15 * board_unit_y
+
+line_left = board_left - 15.5 * board_unit_x
+line_right = board_right + 15.5 * board_unit_x
+end_point_offset = 1.5 * board_unit_x
+end_point_radius = 8
+
+# peripherals drawn next to the left and right pins: name, detail labels,
+# first and last header position (1-16 left, 26-41 right), slot, and kind
+periph_info = [
+    ("I2C(1)", ("l", "SCL", "SDA"), 9, 10, 1, 'i2c'), # SCL,SDA=X9,X10
+    ("I2C(2)", ("r", "SDA", "SCL"), 34, 35, 1, 'i2c'), # SCL,SDA=Y9,Y10
+
+    ("SPI(1)", ("r", "MOSI", "MISO", "SCK", "/SS"), 30, 33, 1, 'spi'),
+    ("SPI(2)", ("l", "/SS", "SCK", "MISO", "MOSI"), 5, 8, 1, 'spi'),
+
+    ("CAN(1)", ("l", "RX", "TX"), 3, 4, 2, 'can'),
+    ("CAN(2)", ("l", "RX", "TX"), 5, 6, 2, 'can'),
+
+    ("UART(1)", ("l", "TX", "RX"), 9, 10, 2, 'uart'),
+    ("UART(2)", ("r", "RX", "TX"), 28, 29, 2, 'uart'),
+    ("UART(3)", ("r", "RX", "TX"), 34, 35, 2, 'uart'),
+    ("UART(4)", ("r", "RX", "TX"), 26, 27, 2, 'uart'),
+    ("UART(6)", ("l", "TX", "RX"), 1, 2, 2, 'uart'),
+
+    ("DAC", (), 30, 31, 2, 'dac'),
+
+    ("ADC", (), 11, 12, 3, 'adc'), # C4-C5
+    ("ADC", (), 26, 33, 3, 'adc'), # A0-A7
+    ("ADC", (), 36, 37, 3, 'adc'), # B0-B1
+]
+
+# pins of the "shielded ADC" group on the inner row
+shielded_adc_pins = ('X19', 'X20', 'X21', 'X22')
+
+def header_pins(pin_from, pin_to):
+    # names of the pins at the given header positions, as used by make_box_pos
+    pos = set()
+    for i in range(min(pin_from, pin_to), max(pin_from, pin_to) + 1):
+        if 1 <= i <= 16:
+            pos.add((1, i))
+        else:
+            pos.add((12, 16 - (i - 26)))
+    return frozenset(pin.name for pin in pin_info if pin.pos in pos)
+
+def periph_groups():
+    # map of peripheral name to the pins it uses, in drawing order
+    groups = {}
+    for name, detail, pin_from, pin_to, xslot, kind in periph_info:
+        groups.setdefault(name, set()).update(header_pins(pin_from, pin_to))
+    groups["ADC"].update(shielded_adc_pins)
+    return groups
+
+def fade(rgb):
+    # blend a colour towards the background, for pins that are not highlighted
+    return tuple(c + 0.75 * (0.9 - c) for c in rgb)
+
+# decoded png assets, and rendered static layers keyed on output kind and
+# scale; a raster layer is a full-size image, so only the most recently
+# used few are kept
+_png_cache = {}
+_static_layers = OrderedDict()
+MAX_STATIC_LAYERS = 3
+
+# set by --profile/--timings-json to time labels by call site
+time_label_sites = False
+
+def load_png(filename):
+    img = _png_cache.get(filename)
+    if img is None:
+        with phasetime.phase('png decode'):
+            img = cairo.ImageSurface.create_from_png(filename)
+        _png_cache[filename] = img
+    return img
+
+def label_origin(cr, width, height):
+    cr.identity_matrix()
+    cr.translate(width / 2, 0.35 * height)
+    cr.translate(-238, -363)
+
+def draw_static_layer(cr, width, height):
+    # everything that does not depend on the pins: background, logo, skin
+    # shadows, board image, and pin lines with their end points
 
     # clear background
     cr.set_source_rgb(0.9, 0.9, 0.9)
     cr.paint()
 
     # draw the logo!
-    img = cairo.ImageSurface.create_from_png('trans-logo-sml.png')
+    img = load_png('trans-logo-sml.png')
     cr.identity_matrix()
-    cr.translate(0.01 * surface.get_width(), 0.01 * surface.get_height())
+    cr.translate(0.01 * width, 0.01 * height)
     cr.move_to(120, 1400)
     cr.set_source_rgb(0, 0, 0)
     cr.set_font_size(80)
@@ -136,39 +152,10 @@ def make_pinout():
     cr.paint()
 
     # coordinates for drawing labels
-    cr.identity_matrix()
-    cr.translate(surface.get_width() / 2, 0.35 * surface.get_height())
-    cr.translate(-238, -363)
-    board_unit_x = 43.6
-    board_unit_y = 43.4
-
-    board_left = 0 * board_unit_x
-    board_top = 0 * board_unit_y
-    board_right = 11 * board_unit_x
-    board_bottom = 15 * board_unit_y
-
-    line_left = board_left - 15.5 * board_unit_x
-    line_right = board_right + 15.5 * board_unit_x
-    end_point_offset = 1.5 * board_unit_x
-    end_point_radius = 8
+    label_origin(cr, width, height)
 
     cr.set_font_size(20)
 
-    v33_rgb = (1.0, 0.1, 0.1)
-    vin_rgb = (1.0, 0.2, 0.2)
-    vbat_rgb = (1.0, 0.5, 0.5)
-    gnd_rgb = (0.2, 0.2, 0.2)
-    port_rgb = (0.9, 0.8, 0.3)
-    cpu_rgb = (1.0, 1.0, 1.0)
-    tim_rgb = (0.8, 0.6, 1.0)
-    adc_rgb = (0.6, 0.6, 0.6)
-    dac_rgb = (0.4, 0.4, 0.4)
-    boot0_rgb = (0.4, 0.4, 0.4)
-    can_rgb = (0.9, 0.9, 0.6)
-    i2c_rgb = (0.4, 0.4, 0.9)
-    spi_rgb = (0.4, 0.9, 0.4)
-    uart_rgb = (0.9, 0.4, 0.4)
-
     # Y skin shadow
     cr.set_source_rgba(0, 0.5, 0, 0.2)
     cr.move_to(board_right + 2.0 * board_unit_x, board_top - 1.5 * board_unit_y)
@@ -200,39 +187,16 @@ def make_pinout():
 
     # draw the board image
     cr.save()
-    img = cairo.ImageSurface.create_from_png('pybv10b-front-trans.png')
+    img = load_png('pybv10b-front-trans.png')
     board_scale = 0.28
     cr.identity_matrix()
-    cr.translate(surface.get_width() / 2, 0.35 * surface.get_height())
+    cr.translate(width / 2, 0.35 * height)
     cr.scale(board_scale, board_scale)
     cr.set_source_surface(img, -img.get_width() / 2, -img.get_height() / 2 - 130)
-    cr.paint()
+    with phasetime.phase('board scale'):
+        cr.paint()
     cr.restore()
 
-    def make_box_pos(pin_from, pin_to, xslot):
-        xslot += 3.38
-        slot_w = 1.9 * board_unit_x
-        w = 0.9 * slot_w
-        h = (0.9 + abs(pin_from - pin_to)) * board_unit_y 
-        if 1 <= pin_to <= 16:
-            # left
-            pin_from -= 1
-            pin_to -= 1
-            x = line_left + xslot * slot_w
-            y = board_top + 0.5 * (pin_from + pin_to) * board_unit_y
-        elif 26 <= pin_to <= 42:
-            # right
-            pin_from -= 26
-            pin_to -= 26
-            x = line_right - xslot * slot_w
-            y = board_top + (15 - 0.5 * (pin_from + pin_to)) * board_unit_y
-        else:
-            assert False
-        return (x, y, w, h)
-
-    def make_box_pos_inner_row(x, y, w, h):
-        return (board_left + (x - 1 + 0.5 * (w - 1)) * board_unit_x, board_bottom + (4 + 0.5 * (y + y + h - 1)) * board_unit_y, (0.9 + w - 1) * board_unit_x, (y + h - 1 - y + 0.9) * board_unit_y)
-
     # draw left and right lines
     cr.set_source_rgb(0, 0, 0)
     for i in range(16):
@@ -282,9 +246,127 @@ def make_pinout():
             y += 0.3333 * board_unit_y
     cr.fill()
 
+def static_layer(vector, scale):
+    # the static layer is rendered once per output resolution (or once for
+    # all vector outputs, as a recording) and then reused, so the board
+    # image is only decoded and resampled once
+    key = ('vector',) if vector else ('raster', scale)
+    layer = _static_layers.get(key)
+    if layer is not None:
+        _static_layers.move_to_end(key)
+        return layer
+    layer = surfaces.layer(vector, width, height, scale)
+    cr = cairo.Context(layer)
+    draw_static_layer(cr, width, height)
+    layer.flush()
+    _static_layers[key] = layer
+    while len(_static_layers) > MAX_STATIC_LAYERS:
+        _static_layers.popitem(last=False)
+    return layer
+
+def refresh(changed):
+    # for --watch: the given data files have changed
+    names = {os.path.basename(f) for f in changed}
+    if 'stm32f4xx_af.csv' in names:
+        load_af_db()
+    pngs = [n for n in names if n.endswith('.png')]
+    for name in pngs:
+        _png_cache.pop(name, None)
+    if pngs:
+        _static_layers.clear()
+
+def static_key():
+    # what the static layer is drawn by, to tell if a reloaded module can
+    # use the layer drawn by the old one
+    import watch
+    return watch.code_key(draw_static_layer, globals())
+
+def adopt(old, changed=()):
+    # for --watch, when this file has been edited and loaded again: keep
+    # the decoded pngs, and the static layers if they are drawn the same.
+    # static_key() only sees the code in this file, so a change to any
+    # other module (pins.py, or tools/ that the drawing calls into) drops
+    # the layers
+    _png_cache.update(old._png_cache)
+    others = [p for p in changed if os.path.abspath(p) != os.path.abspath(__file__)]
+    if not others and static_key() == old.static_key():
+        _static_layers.update(old._static_layers)
+
+def make_pinout(filename='pinout.png', highlight=None, fmt=None, scale=1.0):
+    # highlight, if given, is a set of pin names; everything else is faded.
+    # filename may be a file object; fmt is png, svg or pdf (default: from
+    # the file name), and scale multiplies the 2000x1500 drawing size
+    if fmt is None:
+        fmt = surfaces.format_for(filename)
+    target = surfaces.open_target(filename)
+    surface = surfaces.create(fmt, target, width, height, scale)
+
+    cr = cairo.Context(surface)
+
+    # static background layer
+    cr.set_source_surface(static_layer(surfaces.is_vector(surface), scale), 0, 0)
+    cr.paint()
+
+    # coordinates for drawing labels
+    label_origin(cr, width, height)
+
+    cr.set_font_size(20)
+
+    v33_rgb = (1.0, 0.1, 0.1)
+    vin_rgb = (1.0, 0.2, 0.2)
+    vbat_rgb = (1.0, 0.5, 0.5)
+    gnd_rgb = (0.2, 0.2, 0.2)
+    port_rgb = (0.9, 0.8, 0.3)
+    cpu_rgb = (1.0, 1.0, 1.0)
+    tim_rgb = (0.8, 0.6, 1.0)
+    adc_rgb = (0.6, 0.6, 0.6)
+    dac_rgb = (0.4, 0.4, 0.4)
+    boot0_rgb = (0.4, 0.4, 0.4)
+    can_rgb = (0.9, 0.9, 0.6)
+    i2c_rgb = (0.4, 0.4, 0.9)
+    spi_rgb = (0.4, 0.9, 0.4)
+    uart_rgb = (0.9, 0.4, 0.4)
+
+    periph_rgb = {
+        'i2c': i2c_rgb, 'spi': spi_rgb, 'can': can_rgb, 'uart': uart_rgb,
+        'dac': dac_rgb, 'adc': adc_rgb,
+    }
+
+    def box(text, detail, geom, rgb, pins=(), font_size=24):
+        if highlight is not None and highlight.isdisjoint(pins):
+            rgb = fade(rgb)
+        draw_text_box(cr, text, detail, geom, rgb, font_size=font_size)
+
+    if time_label_sites:
+        box = phasetime.timings.count_sites(box, 'label')
+
+    def make_box_pos(pin_from, pin_to, xslot):
+        xslot += 3.38
+        slot_w = 1.9 * board_unit_x
+        w = 0.9 * slot_w
+        h = (0.9 + abs(pin_from - pin_to)) * board_unit_y 
+        if 1 <= pin_to <= 16:
+            # left
+            pin_from -= 1
+            pin_to -= 1
+            x = line_left + xslot * slot_w
+            y = board_top + 0.5 * (pin_from + pin_to) * board_unit_y
+        elif 26 <= pin_to <= 42:
+            # right
+            pin_from -= 26
+            pin_to -= 26
+            x = line_right - xslot * slot_w
+            y = board_top + (15 - 0.5 * (pin_from + pin_to)) * board_unit_y
+        else:
+            assert False
+        return (x, y, w, h)
+
+    def make_box_pos_inner_row(x, y, w, h):
+        return (board_left + (x - 1 + 0.5 * (w - 1)) * board_unit_x, board_bottom + (4 + 0.5 * (y + y + h - 1)) * board_unit_y, (0.9 + w - 1) * board_unit_x, (y + h - 1 - y + 0.9) * board_unit_y)
+
     # top ports
-    draw_text_box(cr, "micro SD slot", (), (board_left + 3.1 * board_unit_x, board_top - 2.2 * board_unit_y, 4 * board_unit_x, 1 * board_unit_y), port_rgb)
-    draw_text_box(cr, "USB micro-AB", (), (board_left + 8.25 * board_unit_x, board_top - 2.2 * board_unit_y, 4 * board_unit_x, 1 * board_unit_y), port_rgb)
+    box("micro SD slot", (), (board_left + 3.1 * board_unit_x, board_top - 2.2 * board_unit_y, 4 * board_unit_x, 1 * board_unit_y), port_rgb)
+    box("USB micro-AB", (), (board_left + 8.25 * board_unit_x, board_top - 2.2 * board_unit_y, 4 * board_unit_x, 1 * board_unit_y), port_rgb)
 
     # left and right pins
     for pin in pin_info:
@@ -299,7 +381,6 @@ def make_pinout():
             rgb = boot0_rgb
         else:
             rgb = port_rgb
-        print(pin.name, pin.tim)
         if pin.pos[0] == 1:
             box_pos_x = line_left
             box_pos_x_delta = 1
@@ -317,7 +398,7 @@ def make_pinout():
             box_pos_x - box_pos_x_delta * 0 * board_unit_x, box_pos_y,
             1.6 * board_unit_x, 0.9 * board_unit_y
         )
-        draw_text_box(cr, pin.label, (), box_pos, rgb)
+        box(pin.label, (), box_pos, rgb, (pin.name,))
 
         # pin cpu name
         if pin.cpu is not None:
@@ -325,38 +406,21 @@ def make_pinout():
                 box_pos_x - box_pos_x_delta * (-1.8) * board_unit_x, box_pos_y,
                 box_pos[2], box_pos[3]
             )
-            draw_text_box(cr, pin.cpu, (), box_pos, cpu_rgb)
+            box(pin.cpu, (), box_pos, cpu_rgb, (pin.name,))
 
-        # timers
-        for i in range(3):
-            if pin.tim[i] is None:
-                continue
+        # timers; up to 3 fit in the column, more are packed into the
+        # same width with smaller boxes
+        n = max(3, len(pin.tim))
+        pitch = 3 * 1.55 / n
+        for i, tim in enumerate(pin.tim):
             box_pos = (
-                box_pos_x - box_pos_x_delta * (-3.5 - 1.55 * i) * board_unit_x, box_pos_y,
-                1.35 * board_unit_x, box_pos[3]
+                box_pos_x - box_pos_x_delta * (-3.5 - 0.5 * (pitch - 1.55) - pitch * i) * board_unit_x, box_pos_y,
+                (pitch - 0.2) * board_unit_x, box_pos[3]
             )
-            draw_text_box(cr, pin.tim[i].split('_'), (), box_pos, tim_rgb, font_size=18)
-
-    draw_text_box(cr, "I2C(1)", ("l", "SCL", "SDA"), make_box_pos(9, 10, 1), i2c_rgb) # SCL,SDA=X9,X10
-    draw_text_box(cr, "I2C(2)", ("r", "SDA", "SCL"), make_box_pos(34, 35, 1), i2c_rgb) # SCL,SDA=Y9,Y10
-
-    draw_text_box(cr, "SPI(1)", ("r", "MOSI", "MISO", "SCK", "/SS"), make_box_pos(30, 33, 1), spi_rgb)
-    draw_text_box(cr, "SPI(2)", ("l", "/SS", "SCK", "MISO", "MOSI"), make_box_pos(5, 8, 1), spi_rgb)
-
-    draw_text_box(cr, "CAN(1)", ("l", "RX", "TX"), make_box_pos(3, 4, 2), can_rgb)
-    draw_text_box(cr, "CAN(2)", ("l", "RX", "TX"), make_box_pos(5, 6, 2), can_rgb)
+            box(tim.split('_'), (), box_pos, tim_rgb, (pin.name,), font_size=18 if n == 3 else 14)
 
-    draw_text_box(cr, "UART(1)", ("l", "TX", "RX"), make_box_pos(9, 10, 2), uart_rgb)
-    draw_text_box(cr, "UART(2)", ("r", "RX", "TX"), make_box_pos(28, 29, 2), uart_rgb)
-    draw_text_box(cr, "UART(3)", ("r", "RX", "TX"), make_box_pos(34, 35, 2), uart_rgb)
-    draw_text_box(cr, "UART(4)", ("r", "RX", "TX"), make_box_pos(26, 27, 2), uart_rgb)
-    draw_text_box(cr, "UART(6)", ("l", "TX", "RX"), make_box_pos(1, 2, 2), uart_rgb)
-
-    draw_text_box(cr, "DAC", (), make_box_pos(30, 31, 2), dac_rgb)
-
-    draw_text_box(cr, "ADC", (), make_box_pos(11, 12, 3), adc_rgb) # C4-C5
-    draw_text_box(cr, "ADC", (), make_box_pos(26, 33, 3), adc_rgb) # A0-A7
-    draw_text_box(cr, "ADC", (), make_box_pos(36, 37, 3), adc_rgb) # B0-B1
+    for name, detail, pin_from, pin_to, xslot, kind in periph_info:
+        box(name, detail, make_box_pos(pin_from, pin_to, xslot), periph_rgb[kind], header_pins(pin_from, pin_to))
 
     # bottom rows
     for pin in pin_info:
@@ -376,16 +440,16 @@ def make_pinout():
             rgb = port_rgb
         x = pin.pos[0] + 0.3 * (pin.pos[1] - 16)
         y = 2 + 6.5 * (pin.pos[1] - 15)
-        draw_text_box(cr, pin.label, ("c90",), make_box_pos_inner_row(x, y, 1, 2.2), rgb)
+        box(pin.label, ("c90",), make_box_pos_inner_row(x, y, 1, 2.2), rgb, (pin.name,))
         if pin.cpu is not None:
             y = 0.25 + 6.5 * (pin.pos[1] - 15)
-            draw_text_box(cr, pin.cpu, ("c90",), make_box_pos_inner_row(x, y, 1, 1.6), cpu_rgb)
+            box(pin.cpu, ("c90",), make_box_pos_inner_row(x, y, 1, 1.6), cpu_rgb, (pin.name,))
 
-    draw_text_box(cr, "B3 (USR)", ("c90",), make_box_pos_inner_row(2, 5.4, 1, 2.95), cpu_rgb)
-    draw_text_box(cr, "C13 (3mA)", ("c90",), make_box_pos_inner_row(3, 5.4, 1, 2.95), cpu_rgb, font_size=20)
-    draw_text_box(cr, "shielded ADC", (), make_box_pos_inner_row(4, 5.4, 4, 1.2), adc_rgb)
-    draw_text_box(cr, "GND", ("c90",), make_box_pos_inner_row(10, 0.25, 1, 10.45), gnd_rgb)
-    draw_text_box(cr, "VIN", ("c90",), make_box_pos_inner_row(11, 0.25, 1, 10.45), vin_rgb)
+    box("B3 (USR)", ("c90",), make_box_pos_inner_row(2, 5.4, 1, 2.95), cpu_rgb, ("X17",))
+    box("C13 (3mA)", ("c90",), make_box_pos_inner_row(3, 5.4, 1, 2.95), cpu_rgb, ("X18",), font_size=20)
+    box("shielded ADC", (), make_box_pos_inner_row(4, 5.4, 4, 1.2), adc_rgb, shielded_adc_pins)
+    box("GND", ("c90",), make_box_pos_inner_row(10, 0.25, 1, 10.45), gnd_rgb)
+    box("VIN", ("c90",), make_box_pos_inner_row(11, 0.25, 1, 10.45), vin_rgb)
 
     # extra text
 
@@ -421,15 +485,15 @@ def make_pinout():
     draw_text(cr, text, text_pos_x, text_pos_y, "l")
 
 
-    surface.write_to_png('pinout.png')
-    surface.finish()
+    with phasetime.phase('png write' if fmt == 'png' else fmt + ' finish'):
+        surfaces.finish(surface, fmt, target)
 
 def draw_text(cr, text, x, y, alignment):
     if not isinstance(text, list):
         text = [text]
-    ext_x_bear, ext_y_bear, ext_w, ext_h, _, _ = cr.text_extents(text[0])
+    ext_x_bear, ext_y_bear, ext_w, ext_h, _, _ = textcache.text_extents(cr, text[0])
     for i in range(1, len(text)):
-        ext = cr.text_extents(text[i])
+        ext = textcache.text_extents(cr, text[i])
         ext_w = max(ext_w, ext[2])
     if alignment == "c":
         x = x - 0.5 * ext_w - ext_x_bear
@@ -451,7 +515,7 @@ def draw_text(cr, text, x, y, alignment):
         if alignment == "c90":
             cr.save()
             cr.rotate(-1.570796)
-        cr.show_text(t)
+        textcache.show_text(cr, t)
         if alignment == "c90":
             cr.restore()
         y += 1.15 * ext_h
@@ -493,13 +557,118 @@ def draw_text_box(cr, text, detail, geom, rgb, font_size=24):
         for i in range(1, len(detail)):
             draw_text(cr, detail[i], x_detail, y_detail + i * board_unit_y, align)
 
+def build_sources():
+    # everything that affects the rendered image, for the build cache
+    board_dir = os.path.dirname(os.path.abspath(__file__))
+    tools_dir = os.path.join(board_dir, '..', '..', 'tools')
+    return [
+        os.path.join(board_dir, 'pinout.py'), os.path.join(board_dir, 'pins.py'),
+        os.path.join(tools_dir, 'afdb.py'), os.path.join(tools_dir, 'buildcache.py'),
+        os.path.join(tools_dir, 'cache.py'), os.path.join(tools_dir, 'phasetime.py'),
+        os.path.join(tools_dir, 'surfaces.py'), os.path.join(tools_dir, 'textcache.py'),
+        'stm32f4xx_af.csv', 'trans-logo-sml.png', 'pybv10b-front-trans.png',
+    ]
+
+def build_key(sources_hash, highlight, fmt='png', scale=1.0):
+    return buildcache.key(sources_hash, (None if highlight is None else sorted(highlight), fmt, scale))
+
+def build_pinout(filename='pinout.png', highlight=None, fmt=None, scale=1.0, force=False):
+    # make_pinout, unless the same inputs were rendered before; returns
+    # True if the image was rendered.  Output to stdout is always rendered
+    if fmt is None:
+        fmt = surfaces.format_for(filename)
+    if filename == '-':
+        make_pinout(filename, highlight, fmt, scale)
+        return True
+    key = build_key(buildcache.hash_sources(build_sources()), highlight, fmt, scale)
+    if not force and buildcache.fetch(key, filename):
+        return False
+    make_pinout(filename, highlight, fmt, scale)
+    buildcache.record(key, filename)
+    return True
+
+def batch_variants(outdir, fmt='png'):
+    # (filename, highlight) for the overview, each pin, and each peripheral
+    variants = [(os.path.join(outdir, 'pinout.' + fmt), None)]
+    for pin in pin_info:
+        variants.append((os.path.join(outdir, 'pin-%s.%s' % (pin.name, fmt)), frozenset((pin.name,))))
+    for name, pins in periph_groups().items():
+        fname = 'periph-%s.%s' % (name.replace('(', '').replace(')', ''), fmt)
+        variants.append((os.path.join(outdir, fname), frozenset(pins)))
+    return variants
+
+def render_variant(variant):
+    # returns the timings of this render, to be merged in the parent
+    filename, highlight, fmt, scale, key = variant
+    phasetime.timings.clear()
+    make_pinout(filename, highlight, fmt, scale)
+    buildcache.record(key, filename)
+    return filename, phasetime.timings.as_dict()
+
+def make_batch(outdir, jobs, force=False, fmt='png', scale=1.0):
+    # variants already in the build cache are copied (or left alone if they
+    # are up to date); the rest are rendered by the pool.  Each worker keeps
+    # its own static layer, so the board image is decoded and scaled once
+    # per worker rather than once per variant
+    os.makedirs(outdir, exist_ok=True)
+    sources_hash = buildcache.hash_sources(build_sources())
+    variants = batch_variants(outdir, fmt)
+    todo = []
+    for filename, highlight in variants:
+        key = build_key(sources_hash, highlight, fmt, scale)
+        if not force and buildcache.fetch(key, filename):
+            continue
+        todo.append((filename, highlight, fmt, scale, key))
+    print('%d variants up to date, %d to render' % (len(variants) - len(todo), len(todo)))
+    if not todo:
+        return
+    with multiprocessing.Pool(jobs) as pool:
+        for filename, timings in pool.imap_unordered(render_variant, todo):
+            phasetime.timings.merge(timings)
+            print('wrote', filename)
+
 def main():
     # command line arguments
     cmd_parser = argparse.ArgumentParser(description='Generate pyboard pinout.')
+    cmd_parser.add_argument('-o', '--output', default='pinout.png', help='output file, or - for stdout (default pinout.png)')
+    cmd_parser.add_argument('--format', choices=surfaces.formats, help='output format (default: from the output file name, else png)')
+    cmd_parser.add_argument('--scale', type=float, default=None, help='scale of the output relative to 2000x1500')
+    cmd_parser.add_argument('--width', type=int, default=None, help='width of the output, in pixels (png) or points; sets the scale')
+    cmd_parser.add_argument('--batch', metavar='DIR', help='render the overview and a highlighted variant for each pin and peripheral into DIR')
+    cmd_parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes for --batch (default: number of cores)')
+    cmd_parser.add_argument('-f', '--force', action='store_true', help='render even if the build cache has the output')
+    cmd_parser.add_argument('--profile', action='store_true', help='print the time spent in each phase')
+    cmd_parser.add_argument('--timings-json', metavar='FILE', help='write the phase timings to FILE as JSON')
+    cmd_parser.add_argument('--cprofile', metavar='FILE', help='write cProfile stats of the render to FILE')
+    cmd_parser.add_argument('--watch', action='store_true', help='keep running and render again when an input changes')
     args = cmd_parser.parse_args()
 
-    # make the pinout
-    make_pinout()
+    scale = 1.0
+    if args.width is not None:
+        scale = args.width / width
+    elif args.scale is not None:
+        scale = args.scale
+    fmt = args.format or surfaces.format_for(args.output)
+
+    if args.watch:
+        import watch
+        watch.run(sys.modules[__name__], lambda mod, f: mod.make_pinout(f, None, fmt, scale), args.output)
+        return
+
+    global time_label_sites
+    time_label_sites = args.profile or args.timings_json is not None
+
+    with phasetime.profiled(args.cprofile):
+        if args.batch:
+            make_batch(args.batch, args.jobs, args.force, fmt, scale)
+        else:
+            # make the pinout
+            build_pinout(args.output, None, fmt, scale, args.force)
+
+    if args.profile:
+        phasetime.timings.report()
+    if args.timings_json:
+        phasetime.timings.write_json(args.timings_json)
 
 if __name__ == '__main__':
     main()
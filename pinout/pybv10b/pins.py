@@ -0,0 +1,76 @@
+"""
+Header pins of the PYBv1.0, and the CPU pin each one connects to.
+
+This is kept apart from pinout.py so that tools can use the table without
+importing cairo.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+Copyright (c) 2013, 2014 Damien P. George
+"""
+
+class Pin:
+    def __init__(self, name, label, pos, cpu):
+        self.name = name
+        self.label = label
+        self.pos = pos
+        self.cpu = cpu
+        # every timer channel the cpu pin can carry, eg "TIM2_CH1"
+        self.tim = []
+
+# pos is from top left, which is (1,1)
+pin_info = [
+    Pin('X1', 'X1', (12, 16), 'A0'),
+    Pin('X2', 'X2', (12, 15), 'A1'),
+    Pin('X3', 'X3', (12, 14), 'A2'),
+    Pin('X4', 'X4', (12, 13), 'A3'),
+    Pin('X5', 'X5', (12, 12), 'A4'),
+    Pin('X6', 'X6', (12, 11), 'A5'),
+    Pin('X7', 'X7', (12, 10), 'A6'),
+    Pin('X8', 'X8', (12, 9), 'A7'),
+
+    Pin('X9', 'X9', (1, 9), 'B6'),
+    Pin('X10', 'X10', (1, 10), 'B7'),
+    Pin('X11', 'X11', (1, 11), 'C4'),
+    Pin('X12', 'X12', (1, 12), 'C5'),
+    Pin('X13', 'RST', (1, 13), None),
+    Pin('X14', 'GND', (1, 14), None),
+    Pin('X15', '3V3', (1, 15), None),
+    Pin('X16', 'VIN', (1, 16), None),
+
+    Pin('X17', 'X17', (2, 16), 'B3'),
+    Pin('X18', 'X18', (3, 16), 'C13'),
+    Pin('X19', 'X19', (4, 16), 'C0'),
+    Pin('X20', 'X20', (5, 16), 'C1'),
+    Pin('X21', 'X21', (6, 16), 'C2'),
+    Pin('X22', 'X22', (7, 16), 'C3'),
+    Pin('X23', 'A3V3', (8, 16), None),
+    Pin('X24', 'AGND', (9, 16), None),
+
+    Pin('P1', 'BOOT0', (2, 15), None),
+    Pin('P2', 'P2', (3, 15), 'B4'),
+    Pin('P3', 'P3', (4, 15), 'A15'),
+    Pin('P4', 'P4', (5, 15), 'A14'),
+    Pin('P5', 'P5', (6, 15), 'A13'),
+    Pin('P6', 'VBAT', (7, 15), None),
+    Pin('P7', 'VIN', (8, 15), None),
+    Pin('P8', 'GND', (9, 15), None),
+
+    Pin('Y1', 'Y1', (1, 1), 'C6'),
+    Pin('Y2', 'Y2', (1, 2), 'C7'),
+    Pin('Y3', 'Y3', (1, 3), 'B8'),
+    Pin('Y4', 'Y4', (1, 4), 'B9'),
+    Pin('Y5', 'Y5', (1, 5), 'B12'),
+    Pin('Y6', 'Y6', (1, 6), 'B13'),
+    Pin('Y7', 'Y7', (1, 7), 'B14'),
+    Pin('Y8', 'Y8', (1, 8), 'B15'),
+
+    Pin('Y9', 'Y9', (12, 8), 'B10'),
+    Pin('Y10', 'Y10', (12, 7), 'B11'),
+    Pin('Y11', 'Y11', (12, 6), 'B0'),
+    Pin('Y12', 'Y12', (12, 5), 'B1'),
+    Pin('Y13', 'RST', (12, 4), None),
+    Pin('Y14', 'GND', (12, 3), None),
+    Pin('Y15', '3V3', (12, 2), None),
+    Pin('Y16', 'VIN', (12, 1), None),
+]
@@ -4,15 +4,61 @@ Generate pinout.
 
 import argparse
 import math
+import os
+import sys
 import cairo
 
+top_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, os.path.join(top_dir, 'tools'))
+import buildcache
+import phasetime
+import pinmap
+import surfaces
+import textcache
+
 board_pin_sep_x = 0
 board_pin_sep_y = 0
 
-def do_work():
+# header pin at each make_box_pos position: 1-15 left, 26-40 right
+header_pins = {}
+for i in range(1, 15):
+    header_pins[i] = ('JLEFT', str(i))
+header_pins[15] = ('JBL', '1')
+for i in range(1, 12):
+    header_pins[41 - i] = ('JRIGHT', str(i))
+for i in range(1, 5):
+    header_pins[30 - i] = ('JBR%d' % i, '1')
+
+# decoded png assets
+_png_cache = {}
+
+def load_png(filename):
+    img = _png_cache.get(filename)
+    if img is None:
+        with phasetime.phase('png decode'):
+            img = cairo.ImageSurface.create_from_png(filename)
+        _png_cache[filename] = img
+    return img
+
+def port_names():
+    # cpu port name (eg "PB13") at each header position, traced through the
+    # Eagle netlist; positions that are not cpu pins are left out
+    with phasetime.phase('pin map'):
+        table = pinmap.derive(
+            os.path.join(top_dir, 'eagle', 'pyboard.sch'), sorted(header_pins.values()),
+            os.path.join(top_dir, 'eagle', 'pyboard.brd'))
+    return {pos: table[hdr][1] for pos, hdr in header_pins.items() if table[hdr][1] is not None}
+
+def do_work(filename='pinout.png', fmt=None, scale=1.0):
+    # filename may also be a file object; fmt is png, svg or pdf (default:
+    # from the file name), and scale multiplies the 1600x1150 drawing size
     global board_pin_sep_x, board_pin_sep_y
 
-    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1600, 1150)
+    if fmt is None:
+        fmt = surfaces.format_for(filename)
+    target = surfaces.open_target(filename)
+    width, height = 1600, 1150
+    surface = surfaces.create(fmt, target, width, height, scale)
 
     cr = cairo.Context(surface)
 
@@ -21,9 +67,9 @@ def do_work():
     cr.paint()
 
     # draw the logo!
-    img = cairo.ImageSurface.create_from_png('trans-logo-sml.png')
+    img = load_png('trans-logo-sml.png')
     cr.identity_matrix()
-    cr.translate(0.01 * surface.get_width(), 0.01 * surface.get_height())
+    cr.translate(0.01 * width, 0.01 * height)
     cr.move_to(100, 40)
     cr.set_source_rgb(1, 1, 1)
     cr.set_font_size(40)
@@ -33,17 +79,18 @@ def do_work():
     cr.paint()
 
     # draw the board image
-    img = cairo.ImageSurface.create_from_png('pybv3.png')
+    img = load_png('pybv3.png')
     board_scale = 0.963
     cr.identity_matrix()
-    cr.translate(surface.get_width() / 2, surface.get_height() / 2)
+    cr.translate(width / 2, height / 2)
     cr.scale(board_scale, board_scale)
     cr.set_source_surface(img, -img.get_width() / 2, -img.get_height() / 2 - 130)
-    cr.paint()
+    with phasetime.phase('board scale'):
+        cr.paint()
 
     # coordinates for drawing labels
     cr.identity_matrix()
-    cr.translate(surface.get_width() / 2, surface.get_height() / 2)
+    cr.translate(width / 2, height / 2)
 
     board_left = board_scale * (-img.get_width() / 2) - 10
     board_top = board_scale * (-img.get_height() / 2) - 120
@@ -53,8 +100,8 @@ def do_work():
     board_scale = 0.4
     board_left_pin_x = board_left + board_scale * 168
     board_top_pin_y = board_top + board_scale * 156
-    line_left = -0.45 * surface.get_width()
-    line_right = 0.45 * surface.get_width()
+    line_left = -0.45 * width
+    line_right = 0.45 * width
     board_pin_sep_x = board_scale * 114
     board_pin_sep_y = board_scale * 114
     end_point_radius = 6
@@ -141,9 +188,9 @@ def do_work():
 
     draw_text_box(cr, "3.3v", (), make_box_pos(1, 1, 0), (1.0, 0.1, 0.1))
     draw_text_box(cr, "GND", (), make_box_pos(2, 2, 0), gnd_rgb)
-    port_names = (None, None, 'PB13', 'PB14', 'PB15', 'PC6', 'PC7', 'PA13', 'PA14', 'PA15', 'PB3', 'PB4', 'PB6', 'PB7', None)
+    ports = port_names()
     for i in range(1, 16):
-        pname = port_names[i - 1]
+        pname = ports.get(i)
         if pname:
             draw_text_box(cr, pname, (), make_box_pos(i, i, 0), port_rgb, triangle=(None if pname in ['PA13', 'PA14'] else timer_rgb))
     draw_text_box(cr, "3.3v", (), make_box_pos(15, 15, 0), (1.0, 0.1, 0.1))
@@ -172,9 +219,8 @@ def do_work():
     # bottom right special function
     draw_text_box(cr, "ADC", (), make_box_pos(20, 23, 3), adc_rgb)
 
-    port_names = ('PA0', 'PA1', 'PA2', 'PA3', 'PA4', 'PA5', 'PA6', 'PA7', 'PB0', 'PB1', 'PB10', 'PB11', 'PB12', None, None)
     for i in range(26, 41):
-        pname = port_names[i - 26]
+        pname = ports.get(i)
         if pname:
             draw_text_box(cr, pname, (), make_box_pos(i, i, 0), port_rgb, triangle=(None if pname in ['PB12', 'PA4'] else timer_rgb))
     draw_text_box(cr, "GND", (), make_box_pos(39, 39, 0), gnd_rgb)
@@ -202,18 +248,40 @@ def do_work():
         cr.show_text(kw)
         cr.fill()
 
-    surface.write_to_png('pinout.png')
-    surface.finish()
+    with phasetime.phase('png write' if fmt == 'png' else fmt + ' finish'):
+        surfaces.finish(surface, fmt, target)
+
+def build_sources():
+    # everything that affects the rendered image, for the build cache
+    return [
+        os.path.abspath(__file__),
+        os.path.join(top_dir, 'tools', 'pinmap.py'), os.path.join(top_dir, 'tools', 'eagle.py'),
+        os.path.join(top_dir, 'tools', 'buildcache.py'), os.path.join(top_dir, 'tools', 'cache.py'),
+        os.path.join(top_dir, 'tools', 'phasetime.py'),
+        os.path.join(top_dir, 'tools', 'surfaces.py'), os.path.join(top_dir, 'tools', 'textcache.py'),
+        os.path.join(top_dir, 'eagle', 'pyboard.sch'), os.path.join(top_dir, 'eagle', 'pyboard.brd'),
+        'trans-logo-sml.png', 'pybv3.png',
+    ]
+
+def refresh(changed):
+    # for --watch: the given data files have changed; the pin map is
+    # cached on the content of the Eagle files, so only pngs are dropped
+    for f in changed:
+        _png_cache.pop(os.path.basename(f), None)
+
+def adopt(old, changed=()):
+    # for --watch, when this file has been edited and loaded again
+    _png_cache.update(old._png_cache)
 
 def text_centre(cr, text, x, y):
-    ext = cr.text_extents(text)
+    ext = textcache.text_extents(cr, text)
     cr.move_to(x - 0.5 * ext[2] - ext[0], y - 0.5 * ext[3] - ext[1])
-    cr.show_text(text)
+    textcache.show_text(cr, text)
 
 def text_left(cr, text, x, y):
-    ext = cr.text_extents(text)
+    ext = textcache.text_extents(cr, text)
     cr.move_to(x - ext[0], y - 0.5 * ext[3] - ext[1])
-    cr.show_text(text)
+    textcache.show_text(cr, text)
 
 def draw_text_box(cr, text, detail, geom, rgb, triangle=None):
     x, y, w, h = geom
@@ -241,10 +309,40 @@ def draw_text_box(cr, text, detail, geom, rgb, triangle=None):
 def main():
     # command line arguments
     cmd_parser = argparse.ArgumentParser(description='Generate pyboard pinout.')
+    cmd_parser.add_argument('-o', '--output', default='pinout.png', help='output file, or - for stdout (default pinout.png)')
+    cmd_parser.add_argument('--format', choices=surfaces.formats, help='output format (default: from the output file name, else png)')
+    cmd_parser.add_argument('--scale', type=float, default=1.0, help='scale of the output relative to 1600x1150')
+    cmd_parser.add_argument('--profile', action='store_true', help='print the time spent in each phase')
+    cmd_parser.add_argument('--timings-json', metavar='FILE', help='write the phase timings to FILE as JSON')
+    cmd_parser.add_argument('--cprofile', metavar='FILE', help='write cProfile stats of the render to FILE')
+    cmd_parser.add_argument('-f', '--force', action='store_true', help='render even if the build cache has the output')
+    cmd_parser.add_argument('--watch', action='store_true', help='keep running and render again when an input changes')
     args = cmd_parser.parse_args()
 
-    # do the work
-    do_work()
+    fmt = args.format or surfaces.format_for(args.output)
+    if args.watch:
+        import watch
+        watch.run(sys.modules[__name__], lambda mod, f: mod.do_work(f, fmt, args.scale), args.output)
+        return
+
+    if args.profile or args.timings_json:
+        # time each draw_text_box call site separately
+        global draw_text_box
+        draw_text_box = phasetime.timings.count_sites(draw_text_box, 'label')
+
+    # do the work, unless the same inputs were rendered before; output to
+    # stdout is always rendered
+    key = buildcache.key(buildcache.hash_sources(build_sources()), (fmt, args.scale))
+    if args.output == '-' or args.force or not buildcache.fetch(key, args.output):
+        with phasetime.profiled(args.cprofile):
+            do_work(args.output, fmt, args.scale)
+        if args.output != '-':
+            buildcache.record(key, args.output)
+
+    if args.profile:
+        phasetime.timings.report()
+    if args.timings_json:
+        phasetime.timings.write_json(args.timings_json)
 
 if __name__ == '__main__':
     main()
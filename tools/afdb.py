@@ -0,0 +1,166 @@
+"""
+Alternate-function database for STM32 AF tables (eg stm32f4xx_af.csv).
+
+The CSV is parsed once into hash indexes (CPU pin to AFs, signal and
+peripheral to pins, AF number to signals).  The parsed database is kept in
+the on-disk cache keyed on the CSV content, so loading an unchanged table
+does no CSV or regex work.
+
+Alongside the dict indexes the full table is kept as a dense NumPy array,
+matrix[pin, af, k] = signal number (or -1), with an inverted index from
+signal number to the (pin, af) cells that carry it, so capability queries
+over many pins are array operations.
+
+CPU pins are named without the leading "P", as in pin_info (eg "A0").
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import csv
+import re
+
+import numpy as np
+
+import cache
+
+NUM_AF = 16
+
+_af_re = re.compile(r'AF(\d+)$')
+_tim_re = re.compile(r'TIM(\d{1,2})_CH\dN?')
+
+class AFDatabase:
+    def __init__(self, afs, extra):
+        # afs maps cpu pin to a tuple of NUM_AF tuples of signals, one per AF;
+        # extra maps cpu pin to the signals in the non-AF columns (eg ADC)
+        self.afs = afs
+        self.extra = extra
+        self.by_signal = {}
+        self.by_peripheral = {}
+        self.by_af = {}
+        self.timers = {}
+        for pin, row in afs.items():
+            tims = []
+            for af, signals in enumerate(row):
+                for sig in signals:
+                    self.by_signal.setdefault(sig, []).append((pin, af))
+                    self.by_peripheral.setdefault(peripheral(sig), []).append((pin, af, sig))
+                    self.by_af.setdefault(af, set()).add(sig)
+                    m = _tim_re.match(sig)
+                    if m:
+                        tims.append((int(m.group(1)), sig))
+            self.timers[pin] = sorted(tims)
+        for pin, signals in extra.items():
+            for sig in signals:
+                self.by_signal.setdefault(sig, []).append((pin, None))
+                self.by_peripheral.setdefault(peripheral(sig), []).append((pin, None, sig))
+        self._build_matrix()
+
+    def _build_matrix(self):
+        # pin and signal numbering, sorted so the arrays are reproducible
+        self.pin_names = sorted(self.afs)
+        self.pin_index = {pin: i for i, pin in enumerate(self.pin_names)}
+        self.signal_names = sorted(sig for sig in self.by_signal if any(af is not None for _, af in self.by_signal[sig]))
+        self.signal_index = {sig: i for i, sig in enumerate(self.signal_names)}
+        depth = max([len(signals) for row in self.afs.values() for signals in row] + [1])
+        self.matrix = np.full((len(self.pin_names), NUM_AF, depth), -1, dtype=np.int16)
+        for pin, row in self.afs.items():
+            p = self.pin_index[pin]
+            for af, signals in enumerate(row):
+                for k, sig in enumerate(signals):
+                    self.matrix[p, af, k] = self.signal_index[sig]
+        # inverted index: cells of signal s are cells[start[s]:start[s + 1]],
+        # each a (pin number, af) row
+        p, af, k = np.nonzero(self.matrix >= 0)
+        sig = self.matrix[p, af, k]
+        order = np.argsort(sig, kind='stable')
+        self.cells = np.stack((p[order], af[order]), axis=1).astype(np.int16)
+        self.cell_start = np.searchsorted(sig[order], np.arange(len(self.signal_names) + 1)).astype(np.int32)
+
+    def pins(self):
+        return self.afs.keys()
+
+    def pin_afs(self, pin):
+        # list of (af, signal) for the given cpu pin, in AF order
+        return [(af, sig) for af, signals in enumerate(self.afs.get(pin, ())) for sig in signals]
+
+    def pins_for(self, signal):
+        # list of (cpu pin, af) that can provide the signal; af is None for
+        # a non-AF function such as an ADC input
+        return self.by_signal.get(signal, [])
+
+    def signals_for_af(self, af):
+        return self.by_af.get(af, set())
+
+    def timer_channels(self, pin):
+        # list of (timer number, signal) for every timer channel on the pin,
+        # in timer order
+        return self.timers.get(pin, [])
+
+    def signal_cells(self, signal):
+        # (n, 2) array of (pin number, af) for an AF signal; empty if unknown
+        s = self.signal_index.get(signal)
+        if s is None:
+            return self.cells[:0]
+        return self.cells[self.cell_start[s]:self.cell_start[s + 1]]
+
+    def capability(self, signals, pins=None):
+        # boolean array (pins x NUM_AF) of where any of the signals can be
+        # routed; pins, if given, selects and orders the rows by cpu pin name
+        ids = [self.signal_index[s] for s in signals if s in self.signal_index]
+        cap = np.isin(self.matrix, ids).any(axis=2)
+        if pins is not None:
+            cap = cap[[self.pin_index[p] for p in pins]]
+        return cap
+
+    def pins_with(self, signal, pins=None):
+        # list of (cpu pin, af) that can carry the signal, restricted to the
+        # given cpu pins if any, eg pins_with('TIM8_CH1N', x_skin_cpu_pins)
+        names = self.pin_names if pins is None else list(pins)
+        rows, afs = np.nonzero(self.capability((signal,), names))
+        return [(names[r], int(af)) for r, af in zip(rows, afs)]
+
+def peripheral(signal):
+    # "TIM2_CH1" -> "TIM2", "EVENTOUT" -> "EVENTOUT"
+    return signal.split('_', 1)[0]
+
+def parse(filename):
+    afs = {}
+    extra = {}
+    with open(filename, newline='') as f:
+        rows = csv.reader(f)
+        header = next(rows)
+        af_cols = {}
+        for i, name in enumerate(header):
+            m = _af_re.match(name)
+            if m:
+                af_cols[i] = int(m.group(1))
+        for row in rows:
+            if len(row) < 2 or not row[1]:
+                # second header row, or blank line
+                continue
+            pin_name = row[1][1:] # skip letter "P"
+            pin_afs = [[] for _ in range(NUM_AF)]
+            pin_extra = []
+            for i in range(2, len(row)):
+                if not row[i]:
+                    continue
+                signals = row[i].split('/')
+                if i in af_cols:
+                    pin_afs[af_cols[i]].extend(signals)
+                else:
+                    pin_extra.extend(signals)
+            afs[pin_name] = tuple(tuple(s) for s in pin_afs)
+            extra[pin_name] = tuple(pin_extra)
+    return AFDatabase(afs, extra)
+
+def load(filename):
+    key = cache.hash_files(filename)
+    state = cache.load('afdb', key)
+    if state is None:
+        db = parse(filename)
+        cache.store('afdb', key, db.__dict__)
+    else:
+        db = AFDatabase.__new__(AFDatabase)
+        db.__dict__.update(state)
+    return db
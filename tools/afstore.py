@@ -0,0 +1,290 @@
+"""
+Alternate-function store for many MCUs, for queries across families.
+
+AF tables (CSV, one per MCU family, eg stm32f4xx_af.csv) are normalised,
+parsed in parallel in a process pool, and written to one file holding a
+columnar array:
+
+    matrix[mcu, pin, af, k] = signal number, or -1
+
+where pin is port * 16 + number (PA0 is 0, PK15 is 175), af is 0-15 for
+AF0-AF15 and 16 for the other functions in the table (eg ADC inputs), and
+k counts the signals that share a cell.  present[mcu, pin] says whether the
+MCU has the pin at all.  The file is a JSON header (MCU and signal names,
+array layout) followed by the arrays, aligned so they are memory-mapped
+straight from the file when it is opened; a query reads only what it
+touches and never parses a CSV.
+
+The tables do not need the same layout: the AF columns are found by their
+AF0-AF15 headings and the pin column by its values (PA0, PC14-OSC32_IN),
+and any other column with values in it gives the other functions.
+
+    python afstore.py -s af.store ingest stm32f4xx_af.csv f7=stm32f7xx_af.csv
+    python afstore.py info
+    python afstore.py signal CAN2_TX
+    python afstore.py compare CAN2 --ref stm32f4xx --pins X
+
+The last asks which MCUs have the CAN2 signals on the same pins as the
+reference MCU does, over the CPU pins of the pyboard X skin (a letter picks
+the board pins starting with it; a comma list picks pins by name).
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import csv
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import sys
+
+import numpy as np
+
+import afdb
+
+MAGIC = b'AFSTORE1'
+NUM_PORTS = 11
+NUM_PINS = NUM_PORTS * 16
+# AF0-AF15, then the other functions
+NUM_SLOTS = afdb.NUM_AF + 1
+OTHER = afdb.NUM_AF
+ALIGN = 64
+
+_af_head_re = re.compile(r'\s*AF\s*(\d+)\s*$', re.I)
+_pin_re = re.compile(r'\s*P([A-K])(\d{1,2})(?![0-9])')
+_port_re = re.compile(r'\s*Port\s*[A-K]\s*$', re.I)
+
+def pin_slot(name):
+    # "A6", "PA6" or "PC14-OSC32_IN" -> 38; None if it is not a pin name
+    m = _pin_re.match(name if name.upper().startswith('P') else 'P' + name)
+    if m is None or int(m.group(2)) > 15:
+        return None
+    return (ord(m.group(1)) - ord('A')) * 16 + int(m.group(2))
+
+def slot_name(slot):
+    return '%s%d' % (chr(ord('A') + slot // 16), slot % 16)
+
+def mcu_name(path):
+    # stm32f4xx_af.csv -> stm32f4xx
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name[:-3] if name.endswith('_af') else name
+
+def parse_table(job):
+    # worker: (name, path) -> (name, {pin slot: [signals per slot]}), with
+    # plain lists so it is cheap to send back
+    name, path = job
+    pins = {}
+    af_cols = None
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if af_cols is None:
+                cols = {i: int(m.group(1)) for i, m in ((i, _af_head_re.match(c)) for i, c in enumerate(row)) if m}
+                if cols:
+                    af_cols = cols
+                continue
+            slot = None
+            pin_col = None
+            for i, cell in enumerate(row):
+                if i not in af_cols and _pin_re.match(cell):
+                    slot, pin_col = pin_slot(cell), i
+                    break
+            if slot is None:
+                # a second heading row, a comment or a blank line
+                continue
+            cells = pins.setdefault(slot, [[] for _ in range(NUM_SLOTS)])
+            for i, cell in enumerate(row):
+                if i == pin_col or not cell.strip() or _port_re.match(cell):
+                    continue
+                af = af_cols.get(i, OTHER)
+                if af >= afdb.NUM_AF:
+                    af = OTHER
+                for sig in cell.split('/'):
+                    sig = sig.strip()
+                    if sig and sig != '-' and sig not in cells[af]:
+                        cells[af].append(sig)
+    if af_cols is None:
+        raise ValueError('%s: no AF0-AF15 columns' % path)
+    return name, pins
+
+def build(tables):
+    # tables is a list of (name, pins) from parse_table; returns the header
+    # and the arrays
+    names = [name for name, _ in tables]
+    signals = sorted({sig for _, pins in tables for cells in pins.values() for cell in cells for sig in cell})
+    if len(signals) >= 1 << 15:
+        raise ValueError('too many signals')
+    index = {sig: i for i, sig in enumerate(signals)}
+    depth = max([len(cell) for _, pins in tables for cells in pins.values() for cell in cells] + [1])
+    matrix = np.full((len(tables), NUM_PINS, NUM_SLOTS, depth), -1, dtype=np.int16)
+    present = np.zeros((len(tables), NUM_PINS), dtype=bool)
+    for m, (_, pins) in enumerate(tables):
+        for slot, cells in pins.items():
+            present[m, slot] = True
+            for af, cell in enumerate(cells):
+                for k, sig in enumerate(cell):
+                    matrix[m, slot, af, k] = index[sig]
+    return {'mcus': names, 'signals': signals}, {'matrix': matrix, 'present': present}
+
+def write(path, header, arrays):
+    # magic, header length, JSON header, then each array at an aligned offset
+    layout = {}
+    offset = 0
+    for name, a in arrays.items():
+        layout[name] = [a.dtype.str, list(a.shape), offset]
+        offset += -(-a.nbytes // ALIGN) * ALIGN
+    header = dict(header, arrays=layout)
+    head = json.dumps(header, sort_keys=True).encode()
+    start = -(-(len(MAGIC) + 4 + len(head)) // ALIGN) * ALIGN
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(head)) + head)
+        for name, a in arrays.items():
+            f.seek(start + layout[name][2])
+            f.write(np.ascontiguousarray(a).tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+
+class Store:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not an AF store' % path)
+        (n,) = struct.unpack_from('<I', self._map, len(MAGIC))
+        header = json.loads(self._map[len(MAGIC) + 4:len(MAGIC) + 4 + n])
+        start = -(-(len(MAGIC) + 4 + n) // ALIGN) * ALIGN
+        self.mcus = header['mcus']
+        self.signals = header['signals']
+        self.signal_index = {sig: i for i, sig in enumerate(self.signals)}
+        for name, (dtype, shape, offset) in header['arrays'].items():
+            a = np.frombuffer(self._map, dtype=dtype, count=int(np.prod(shape)), offset=start + offset)
+            setattr(self, name, a.reshape(shape))
+
+    def mcu_index(self, name):
+        try:
+            return self.mcus.index(name)
+        except ValueError:
+            raise KeyError('unknown MCU %s' % name)
+
+    def signal_ids(self, name):
+        # the signal, or every signal of the peripheral if it is not one
+        if name in self.signal_index:
+            return [self.signal_index[name]]
+        return [i for i, sig in enumerate(self.signals) if afdb.peripheral(sig) == name]
+
+    def where(self, signal):
+        # [(mcu, cpu pin, af or None, signal)] for a signal or peripheral
+        ids = self.signal_ids(signal)
+        m, p, af, k = np.nonzero(np.isin(self.matrix, ids))
+        sig = self.matrix[m, p, af, k]
+        return [(self.mcus[a], slot_name(b), None if c == OTHER else int(c), self.signals[d])
+            for a, b, c, d in zip(m, p, af, sig)]
+
+    def has_signals(self, ids, slots):
+        # bool (mcus, len(ids), len(slots)): whether the pin carries the signal
+        sub = self.matrix[:, slots]
+        return (sub[:, None] == np.array(ids, dtype=np.int16)[None, :, None, None, None]).any(axis=(3, 4))
+
+    def compare(self, peripheral, ref, slots):
+        # for each MCU, the (signal, pin) pairs of the peripheral that the
+        # reference MCU has on the given pins and this MCU does not
+        ids = self.signal_ids(peripheral)
+        has = self.has_signals(ids, slots)
+        want = has[self.mcu_index(ref)]
+        out = {}
+        for m, name in enumerate(self.mcus):
+            s, p = np.nonzero(want & ~has[m])
+            out[name] = [(self.signals[ids[a]], slot_name(slots[b])) for a, b in zip(s, p)]
+        return want, out
+
+def resolve_pins(spec, board):
+    # pin slots for a skin letter (X) or a comma list of board or cpu pins
+    import pyb_pins
+    table = pyb_pins.load_table(board)
+    if len(spec) == 1 and spec.isalpha():
+        names = [cpu for name, (label, cpu) in table['board'].items() if name.startswith(spec.upper()) and cpu]
+    else:
+        names = []
+        for name in spec.split(','):
+            name = name.strip()
+            board_pin = table['board'].get(name.upper())
+            names.append(board_pin[1] if board_pin else name)
+    slots = [pin_slot(n) for n in names if n]
+    if None in slots:
+        raise ValueError('unknown pin in %r' % spec)
+    return slots
+
+def cmd_ingest(args):
+    jobs = []
+    for item in args.tables:
+        name, _, path = item.rpartition('=')
+        jobs.append((name or mcu_name(path), path))
+    with multiprocessing.Pool(min(args.jobs or os.cpu_count() or 1, len(jobs))) as pool:
+        tables = pool.map(parse_table, jobs)
+    header, arrays = build(tables)
+    write(args.store, header, arrays)
+    print('%d MCUs, %d signals, %d bytes in %s' % (len(header['mcus']), len(header['signals']), os.path.getsize(args.store), args.store))
+
+def cmd_info(args):
+    store = Store(args.store)
+    for m, name in enumerate(store.mcus):
+        used = np.unique(store.matrix[m])
+        print('%-12s %3d pins %4d signals' % (name, store.present[m].sum(), (used >= 0).sum()))
+
+def cmd_signal(args):
+    store = Store(args.store)
+    found = store.where(args.signal)
+    if args.mcu:
+        found = [f for f in found if f[0] in args.mcu]
+    for mcu, pin, af, sig in sorted(found):
+        print('%-12s %-4s %-5s %s' % (mcu, pin, '' if af is None else 'AF%d' % af, sig))
+    if not found:
+        sys.exit(1)
+
+def cmd_compare(args):
+    store = Store(args.store)
+    try:
+        slots = resolve_pins(args.pins, args.board)
+        want, missing = store.compare(args.peripheral, args.ref, slots)
+    except (KeyError, ValueError) as er:
+        # an unknown reference MCU or pin
+        print('error:', er.args[0], file=sys.stderr)
+        sys.exit(1)
+    if not want.any():
+        print('%s has no %s signals on those pins' % (args.ref, args.peripheral))
+        sys.exit(1)
+    for name, miss in missing.items():
+        if not miss:
+            print('%-12s same' % name)
+        else:
+            print('%-12s missing %s' % (name, ', '.join('%s on %s' % m for m in miss)))
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='AF tables of many MCUs in one store.')
+    cmd_parser.add_argument('-s', '--store', default='af.store', help='store file (default af.store)')
+    sub = cmd_parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('ingest', help='parse AF tables into the store, replacing it')
+    p.add_argument('tables', nargs='+', help='CSV files, as path or mcu=path')
+    p.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of cores)')
+    p.set_defaults(func=cmd_ingest)
+    p = sub.add_parser('info', help='list the MCUs in the store')
+    p.set_defaults(func=cmd_info)
+    p = sub.add_parser('signal', help='pins carrying a signal or peripheral on each MCU')
+    p.add_argument('signal')
+    p.add_argument('--mcu', action='append', help='only these MCUs')
+    p.set_defaults(func=cmd_signal)
+    p = sub.add_parser('compare', help='MCUs with a peripheral on the same pins as a reference MCU')
+    p.add_argument('peripheral', help='peripheral (CAN2) or signal (CAN2_TX)')
+    p.add_argument('--ref', required=True, help='reference MCU')
+    p.add_argument('--pins', default='X', help='skin letter or comma list of pins (default X)')
+    p.add_argument('--board', default='pybv10b', help='board for board pin names (default pybv10b)')
+    p.set_defaults(func=cmd_compare)
+    args = cmd_parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
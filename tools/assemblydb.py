@@ -0,0 +1,344 @@
+"""
+Assembly database: BOM and placement data from the Eagle board and
+schematic, kept in SQLite.
+
+    part      schematic parts: name, library, deviceset, device, value
+    element   board elements: name, library, package, value, x, y (mm),
+              rotation, side (top/bottom), mount (smd/tht)
+    pad       the pads of each element in board coordinates
+    outline   the board outline, as line segments (mm)
+    source    content hash of the .sch and .brd last loaded
+    output    content hash of each generated file
+
+From the database it writes:
+
+    bom.csv               one line per value and package, with quantity
+                          and designators, for the parts on the board
+    pnp.csv               pick-and-place: designator, value, package,
+                          x, y, rotation, side, mount
+    placement-top.png     placement drawings of each side, the bottom
+    placement-bottom.png  seen from below (png, svg or pdf with --format)
+
+Updates are incremental: if neither input file has changed nothing is
+read; otherwise only rows that differ are inserted, updated or deleted,
+and an output is only written again if its content has changed, so
+moving one part on the bottom redraws the bottom drawing and not the top.
+The drawings need pycairo; without it they are skipped.
+
+    python assemblydb.py                 update the database and outputs
+    python assemblydb.py --summary       part counts, as in assembly.tex
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import csv
+import io
+import os
+import re
+import sqlite3
+import sys
+
+import cache
+import eagle
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS source (file TEXT PRIMARY KEY, hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS output (file TEXT PRIMARY KEY, hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS part (
+    name TEXT PRIMARY KEY, library TEXT, deviceset TEXT, device TEXT, value TEXT);
+CREATE TABLE IF NOT EXISTS element (
+    name TEXT PRIMARY KEY, library TEXT, package TEXT, value TEXT,
+    x REAL, y REAL, rotation REAL, side TEXT, mount TEXT);
+CREATE TABLE IF NOT EXISTS outline (
+    n INTEGER PRIMARY KEY, x1 REAL, y1 REAL, x2 REAL, y2 REAL);
+CREATE TABLE IF NOT EXISTS pad (
+    element TEXT, pad TEXT, x REAL, y REAL, drill REAL, dx REAL, dy REAL, layer INTEGER,
+    PRIMARY KEY (element, pad));
+CREATE INDEX IF NOT EXISTS element_side ON element (side);
+CREATE INDEX IF NOT EXISTS element_bom ON element (value, package);
+CREATE INDEX IF NOT EXISTS part_value ON part (value);
+'''
+
+# bump this when a table is added, so that an older database loads the
+# inputs again to fill it
+SCHEMA_VERSION = 1
+
+# pixels per mm of the placement drawings at scale 1
+PX_PER_MM = 20
+MARGIN = 2.0
+
+def natural_key(name):
+    # R2 before R10
+    return [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', name)]
+
+def open_db(filename):
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    db = sqlite3.connect(filename)
+    db.executescript(SCHEMA)
+    if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        db.execute('DELETE FROM source')
+        db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        db.commit()
+    return db
+
+def sync(db, table, keys, rows):
+    # make table hold exactly rows, {key tuple: value tuple}, touching only
+    # the rows that differ; returns the set of keys that changed
+    cols = [r[1] for r in db.execute('PRAGMA table_info(%s)' % table)]
+    where = ' AND '.join('%s = ?' % k for k in keys)
+    old = {}
+    for r in db.execute('SELECT %s FROM %s' % (', '.join(cols), table)):
+        old[r[:len(keys)]] = r[len(keys):]
+    changed = {k for k, v in rows.items() if old.get(k) != v}
+    gone = set(old) - set(rows)
+    db.executemany('DELETE FROM %s WHERE %s' % (table, where), list(gone))
+    db.executemany('INSERT OR REPLACE INTO %s VALUES (%s)' % (table, ', '.join('?' * len(cols))),
+        [k + rows[k] for k in changed])
+    return changed | gone
+
+def update(db, sch_file, brd_file):
+    # load the inputs into the database; returns {table: changed keys}, or
+    # None if neither input has changed
+    hashes = {f: cache.hash_files(f) for f in (sch_file, brd_file)}
+    stored = dict(db.execute('SELECT file, hash FROM source'))
+    if all(stored.get(f) == h for f, h in hashes.items()):
+        return None
+
+    sch = eagle.load(sch_file)
+    brd = eagle.load(brd_file)
+    parts = {(name,): tuple(p) for name, p in sch.parts.items()}
+    elements = {}
+    pads = {}
+    for name, (library, package, value, x, y, rot) in brd.elements.items():
+        mirror, angle = eagle.parse_rot(rot)
+        el_pads = brd.element_pads(name)
+        smd = any(p[2] is None for p in el_pads.values())
+        elements[(name,)] = (library, package, value, x, y, angle, 'bottom' if mirror else 'top', 'smd' if smd else 'tht')
+        for pad, p in el_pads.items():
+            pads[(name, pad)] = tuple(p)
+    changed = {
+        'part': sync(db, 'part', ('name',), parts),
+        'element': sync(db, 'element', ('name',), elements),
+        'pad': sync(db, 'pad', ('element', 'pad'), pads),
+        'outline': sync(db, 'outline', ('n',), {(n,): tuple(o) for n, o in enumerate(brd.outline)}),
+    }
+    db.execute('DELETE FROM source')
+    db.executemany('INSERT INTO source VALUES (?, ?)', list(hashes.items()))
+    db.commit()
+    return changed
+
+def bom_rows(db):
+    # (value, package, device, mount, quantity, designators) for the parts
+    # that are on the board
+    groups = {}
+    q = '''SELECT e.name, e.value, e.package, p.deviceset || p.device, e.mount
+        FROM element e LEFT JOIN part p ON p.name = e.name'''
+    for name, value, package, device, mount in db.execute(q):
+        groups.setdefault((value or '', package, device or '', mount), []).append(name)
+    rows = []
+    for (value, package, device, mount), names in groups.items():
+        names.sort(key=natural_key)
+        rows.append((value, package, device, mount, len(names), ' '.join(names)))
+    rows.sort(key=lambda r: (r[1], natural_key(r[5])))
+    return rows
+
+def outline_rows(db):
+    return db.execute('SELECT x1, y1, x2, y2 FROM outline ORDER BY n').fetchall()
+
+def pnp_rows(db):
+    rows = db.execute('SELECT name, value, package, x, y, rotation, side, mount FROM element').fetchall()
+    rows.sort(key=lambda r: natural_key(r[0]))
+    return rows
+
+def csv_text(header, rows):
+    out = io.StringIO()
+    w = csv.writer(out, lineterminator='\n')
+    w.writerow(header)
+    w.writerows(rows)
+    return out.getvalue()
+
+def write_if_changed(db, filename, key, write):
+    # write(filename) only if the output for this key is not already there
+    stored = db.execute('SELECT hash FROM output WHERE file = ?', (filename,)).fetchone()
+    if stored and stored[0] == key and os.path.exists(filename):
+        return False
+    write(filename)
+    db.execute('INSERT OR REPLACE INTO output VALUES (?, ?)', (filename, key))
+    db.commit()
+    return True
+
+def write_text(filename, text):
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, filename)
+
+def side_data(db, side):
+    # what a placement drawing is made from: the elements on the side with
+    # their pads, and the board outline
+    elements = db.execute('SELECT name, x, y FROM element WHERE side = ? ORDER BY name', (side,)).fetchall()
+    pads = db.execute('''SELECT p.element, p.x, p.y, p.drill, p.dx, p.dy FROM pad p
+        JOIN element e ON e.name = p.element WHERE e.side = ? ORDER BY p.element, p.pad''', (side,)).fetchall()
+    return elements, pads
+
+def draw_side(filename, fmt, side, elements, pads, outline, scale):
+    import cairo
+    import surfaces
+    xs = [v for o in outline for v in (o[0], o[2])] or [0, 0]
+    ys = [v for o in outline for v in (o[1], o[3])] or [0, 0]
+    x0, y0 = min(xs) - MARGIN, min(ys) - MARGIN
+    w_mm, h_mm = max(xs) - min(xs) + 2 * MARGIN, max(ys) - min(ys) + 2 * MARGIN
+    width, height = w_mm * PX_PER_MM, h_mm * PX_PER_MM
+
+    def at(x, y):
+        # board mm to drawing units; the bottom is seen from below
+        px = (x - x0) * PX_PER_MM
+        if side == 'bottom':
+            px = width - px
+        return px, height - (y - y0) * PX_PER_MM
+
+    target = surfaces.open_target(filename)
+    surface = surfaces.create(fmt, target, width, height, scale)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(1, 1, 1)
+    cr.paint()
+
+    cr.set_line_width(2)
+    cr.set_source_rgb(0, 0, 0)
+    for ax, ay, bx, by in outline:
+        cr.move_to(*at(ax, ay))
+        cr.line_to(*at(bx, by))
+    cr.stroke()
+
+    by_element = {}
+    cr.set_source_rgb(0.75, 0.6, 0.2)
+    for element, x, y, drill, dx, dy in pads:
+        px, py = at(x, y)
+        if drill is not None:
+            cr.arc(px, py, 0.9 * drill * PX_PER_MM, 0, 6.2832)
+            cr.close_path()
+            pad_box = (x - 0.9 * drill, y - 0.9 * drill, x + 0.9 * drill, y + 0.9 * drill)
+        else:
+            cr.rectangle(px - dx * PX_PER_MM / 2, py - dy * PX_PER_MM / 2, dx * PX_PER_MM, dy * PX_PER_MM)
+            pad_box = (x - dx / 2, y - dy / 2, x + dx / 2, y + dy / 2)
+        cr.fill()
+        b = by_element.get(element)
+        by_element[element] = pad_box if b is None else (min(b[0], pad_box[0]), min(b[1], pad_box[1]),
+            max(b[2], pad_box[2]), max(b[3], pad_box[3]))
+
+    cr.select_font_face('Sans', cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_BOLD)
+    cr.set_font_size(14)
+    for name, x, y in elements:
+        b = by_element.get(name)
+        if b is not None:
+            (ax, ay), (bx, by) = at(b[0] - 0.2, b[1] - 0.2), at(b[2] + 0.2, b[3] + 0.2)
+            cr.set_source_rgb(0.2, 0.3, 0.8)
+            cr.set_line_width(1)
+            cr.rectangle(min(ax, bx), min(ay, by), abs(bx - ax), abs(by - ay))
+            cr.stroke()
+        px, py = at(x, y)
+        ext = cr.text_extents(name)
+        cr.set_source_rgb(0, 0, 0)
+        cr.move_to(px - ext[2] / 2 - ext[0], py - ext[3] / 2 - ext[1])
+        cr.show_text(name)
+
+    cr.move_to(10, 24)
+    cr.set_font_size(18)
+    cr.show_text('%s side (%d parts)' % (side, len(elements)))
+    surfaces.finish(surface, fmt, target)
+
+def write_outputs(db, outdir, outline, fmt='png', scale=1.0):
+    # returns the names of the files that were written
+    written = []
+    bom = csv_text(('value', 'package', 'device', 'mount', 'quantity', 'designators'), bom_rows(db))
+    pnp = csv_text(('designator', 'value', 'package', 'x_mm', 'y_mm', 'rotation', 'side', 'mount'), pnp_rows(db))
+    for name, text in (('bom.csv', bom), ('pnp.csv', pnp)):
+        filename = os.path.join(outdir, name)
+        if write_if_changed(db, filename, cache.hash_bytes(text.encode()), lambda f, t=text: write_text(f, t)):
+            written.append(filename)
+
+    try:
+        import cairo
+    except ImportError:
+        print('pycairo is not installed, placement drawings skipped', file=sys.stderr)
+        return written
+    for side in ('top', 'bottom'):
+        elements, pads = side_data(db, side)
+        filename = os.path.join(outdir, 'placement-%s.%s' % (side, fmt))
+        key = cache.hash_bytes(repr((elements, pads, outline, scale, cairo.cairo_version_string())).encode())
+
+        def draw(f, side=side, elements=elements, pads=pads):
+            tmp = '%s.%d.tmp' % (f, os.getpid())
+            draw_side(tmp, fmt, side, elements, pads, outline, scale)
+            os.replace(tmp, f)
+
+        if write_if_changed(db, filename, key, draw):
+            written.append(filename)
+    return written
+
+# kinds of part for the summary, in the order of the notes in assembly.tex:
+# the first whose pattern matches the deviceset and package of a part
+part_kinds = [
+    ('resistors', r'R-(EU|US)_'),
+    ('capacitors', r'C-(EU|US)'),
+    ('crystals', r'CRYSTAL'),
+    ('switches', r'SWITCH|TACTILE'),
+    ('LEDs', r'LED'),
+    ('other', r''),
+]
+
+def part_kind(deviceset, package, value):
+    # 0R resistors are links, and are counted apart from the resistors
+    text = '%s %s' % (deviceset or '', package or '')
+    for kind, pattern in part_kinds:
+        if re.search(pattern, text):
+            if kind == 'resistors' and value in ('0', '0R'):
+                return '0R links'
+            return kind
+    return 'other'
+
+def summary(db):
+    # counts by kind of part and value, like the notes in assembly.tex
+    groups = {}
+    q = """SELECT e.name, e.value, e.package, p.deviceset
+        FROM element e LEFT JOIN part p ON p.name = e.name WHERE e.mount = 'smd'"""
+    for name, value, package, deviceset in db.execute(q):
+        kind = part_kind(deviceset, package, value)
+        groups.setdefault(kind, {}).setdefault((package, value), []).append(name)
+    order = [kind for kind, _ in part_kinds] + ['0R links']
+    for kind in sorted(groups, key=order.index):
+        values = groups[kind]
+        print('%d %s' % (sum(len(v) for v in values.values()), kind))
+        for (package, value), names in sorted(values.items(), key=lambda i: (i[0][0], natural_key(i[0][1] or ''))):
+            names.sort(key=natural_key)
+            print('  %2dx %-12s %-12s %s' % (len(names), value, package, ' '.join(names)))
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='BOM and placement database from the Eagle files.')
+    cmd_parser.add_argument('--sch', default='../eagle/pyboard.sch', help='Eagle schematic')
+    cmd_parser.add_argument('--brd', default='../eagle/pyboard.brd', help='Eagle board')
+    cmd_parser.add_argument('-d', '--db', default='../assembly/pyboard.db', help='SQLite database (default ../assembly/pyboard.db)')
+    cmd_parser.add_argument('-o', '--outdir', default='../assembly', help='directory for the generated files')
+    cmd_parser.add_argument('--format', default='png', choices=('png', 'svg', 'pdf'), help='format of the placement drawings')
+    cmd_parser.add_argument('--scale', type=float, default=1.0, help='scale of the placement drawings')
+    cmd_parser.add_argument('--summary', action='store_true', help='print part counts')
+    args = cmd_parser.parse_args()
+
+    db = open_db(args.db)
+    changed = update(db, args.sch, args.brd)
+    if changed is None:
+        print('inputs unchanged')
+    else:
+        print('updated %s' % ', '.join('%d %s rows' % (len(v), t) for t, v in changed.items()))
+    os.makedirs(args.outdir, exist_ok=True)
+    for filename in write_outputs(db, args.outdir, outline_rows(db), args.format, args.scale):
+        print('wrote', filename)
+    if args.summary:
+        summary(db)
+    db.close()
+
+if __name__ == '__main__':
+    main()
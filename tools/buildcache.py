@@ -0,0 +1,134 @@
+"""
+Content-addressed build cache for generated artwork.
+
+A build is identified by a key: the hash of every input that affects the
+output (generator source, data files, image assets), the options, and the
+cairo version.  After a build the output is copied into the cache under
+that key, so later builds with the same key either do nothing (the output
+file is already the cached one) or just copy the cached file into place.
+
+    key = buildcache.key(buildcache.hash_sources(sources), options)
+    if not buildcache.fetch(key, 'pinout.png'):
+        render('pinout.png')
+        buildcache.record(key, 'pinout.png')
+
+The copies are kept in the cache directory as build-<key>.out and take at
+most MAX_MB megabytes (PYBOARD_BUILD_CACHE_MB to change it, default 512)
+between them; after each record() the least recently used copies are
+removed until they fit.  A fetch counts as a use.  The small index entry
+of a removed copy is left behind, and only lets fetch() see that an
+output already in place is up to date.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import os
+import shutil
+
+import cache
+
+MAX_MB = 512
+
+def max_bytes():
+    return int(float(os.environ.get('PYBOARD_BUILD_CACHE_MB', MAX_MB)) * 1024 * 1024)
+
+def cairo_version():
+    try:
+        import cairo
+    except ImportError:
+        return 'none'
+    return '%s/%s' % (cairo.version, cairo.cairo_version_string())
+
+def hash_sources(sources):
+    # sources are paths of everything the output is made from; their names
+    # are hashed as well as their content, so swapping two files changes
+    # the hash.  A missing file hashes as missing, and it is left to the
+    # build to complain about it.  Many outputs from the same sources can
+    # share this hash.
+    chunks = []
+    for s in sources:
+        chunks.append(os.path.basename(s).encode())
+        chunks.append(cache.hash_files(s).encode() if os.path.exists(s) else b'missing')
+    return cache.hash_bytes(cairo_version().encode(), *chunks)
+
+def key(sources_hash, options=()):
+    return cache.hash_bytes(sources_hash.encode(), repr(options).encode())
+
+def _blob(key):
+    return os.path.join(cache.cache_dir(), 'build-%s.out' % key)
+
+def fetch(key, output):
+    # make output the result of the build with this key; returns False if
+    # the build has not been done (or its result was removed)
+    entry = cache.load('build', key)
+    if entry is None:
+        return False
+    try:
+        # mark the copy as used, for prune()
+        os.utime(_blob(key))
+    except OSError:
+        pass
+    try:
+        if os.path.getsize(output) == entry['size'] and cache.hash_files(output) == entry['hash']:
+            return True
+    except OSError:
+        pass
+    tmp = '%s.%d.tmp' % (output, os.getpid())
+    try:
+        shutil.copyfile(_blob(key), tmp)
+        if cache.hash_files(tmp) != entry['hash']:
+            os.remove(tmp)
+            return False
+        os.replace(tmp, output)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+def record(key, output):
+    # keep a copy of a freshly built output under its key; as with the rest
+    # of the cache, failing to store is not an error
+    blob = _blob(key)
+    tmp = '%s.%d.tmp' % (blob, os.getpid())
+    try:
+        os.makedirs(cache.cache_dir(), exist_ok=True)
+        shutil.copyfile(output, tmp)
+        os.replace(tmp, blob)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    cache.store('build', key, {'hash': cache.hash_files(output), 'size': os.path.getsize(output)})
+    prune(max_bytes())
+
+def prune(limit):
+    # remove the least recently used copies until the rest take at most
+    # limit bytes; another process may be pruning too, so a copy that has
+    # gone already is skipped
+    blobs = []
+    try:
+        with os.scandir(cache.cache_dir()) as it:
+            for e in it:
+                if e.name.startswith('build-') and e.name.endswith('.out'):
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    blobs.append((st.st_mtime, st.st_size, e.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in blobs)
+    for _, size, path in sorted(blobs):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
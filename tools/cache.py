@@ -0,0 +1,71 @@
+"""
+On-disk cache for data derived from the files in this repository.
+
+Entries are pickled and keyed on a hash of the input content, so a stale
+entry is never returned: if the input changes the key changes with it.
+Store plain data (dicts, lists, tuples, arrays) rather than instances of
+classes defined in a script, which may be __main__ when it is pickled.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import hashlib
+import os
+import pickle
+
+# bump this when the layout of any cached object changes
+CACHE_VERSION = 3
+
+def cache_dir():
+    d = os.environ.get('PYBOARD_CACHE_DIR')
+    if d is None:
+        d = os.path.join(os.path.expanduser('~'), '.cache', 'pyboard')
+    return d
+
+def hash_bytes(*chunks):
+    h = hashlib.sha1()
+    h.update(str(CACHE_VERSION).encode())
+    # prefix each chunk with its length, so the split between chunks is
+    # part of the key: ('ab', 'c') and ('a', 'bc') must not collide
+    for c in chunks:
+        h.update(b'%d:' % len(c))
+        h.update(c)
+    return h.hexdigest()
+
+def hash_files(*paths):
+    h = hashlib.sha1()
+    h.update(str(CACHE_VERSION).encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(b'%d:' % os.fstat(f.fileno()).st_size)
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _path(kind, key):
+    return os.path.join(cache_dir(), '%s-%s.pickle' % (kind, key))
+
+def load(kind, key):
+    try:
+        with open(_path(kind, key), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # missing, partial, or written by an incompatible version
+        return None
+
+def store(kind, key, obj):
+    # write to a temporary file and rename, so a concurrent reader never
+    # sees a partial entry; failing to cache is not an error
+    path = _path(kind, key)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
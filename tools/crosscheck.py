@@ -0,0 +1,169 @@
+"""
+Cross-check the fabrication outputs in gerber/ against the Eagle board.
+
+Checks that:
+
+    every via and through-hole pad in the board has a drill hit of the
+    same size at the same place, and every drill hit has a via or pad
+    every copper wire in the board is a track of the same width in the
+    Gerber layer for its side (top or bottom)
+
+Gerber tracks without a board wire are not reported, as polygon fills are
+also drawn as tracks.  The board is in mm and the CAM output in inches
+with the board outline moved away from the origin; the offset is found by
+lining up the board outline with the zero-width outline in the copper
+layer, or can be given with --offset.
+
+The drill hits and the track end points are put in spatial indexes once,
+and each board item is matched with a query around it.  Mismatches that
+are close together are reported as one region, so a stale Gerber shows up
+as the few places that changed rather than a list of every item.
+
+    python crosscheck.py ../eagle/pyboard.brd ../gerber/pybv3
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import drc
+import eagle
+import excellon
+import gerber
+import spatial
+
+MM = 1 / 25.4
+
+# Eagle copper layers -> Gerber layer extension
+copper_layers = {1: 'top', 16: 'bot'}
+
+def board_holes(brd):
+    # (x, y, drill, description) in mm for every via and through-hole pad
+    holes = []
+    for signal, x, y, drill, extent in brd.vias:
+        holes.append((x, y, drill, 'via %s' % signal))
+    for element in sorted(brd.elements):
+        for pad, (x, y, drill, dx, dy, layer) in sorted(brd.element_pads(element).items()):
+            if drill is not None:
+                holes.append((x, y, drill, 'pad %s.%s' % (element, pad)))
+    return holes
+
+def outline_offset(brd, layer):
+    # offset in inches from board to Gerber coordinates, from the lower left
+    # corners of the two outlines
+    if not brd.outline:
+        return None
+    o = np.array(brd.outline) * MM
+    zero = np.array([layer.aperture_size(int(d)) == 0 for d in layer.aperture], dtype=bool)
+    sel = zero & (layer.op == gerber.OP_DRAW)
+    if not sel.any():
+        return None
+    gx = min(layer.x0[sel].min(), layer.x1[sel].min())
+    gy = min(layer.y0[sel].min(), layer.y1[sel].min())
+    return (gx - min(o[:, 0].min(), o[:, 2].min()), gy - min(o[:, 1].min(), o[:, 3].min()))
+
+def check_drills(holes, drill, offset, tol):
+    # returns a list of (x, y, message), in Gerber coordinates
+    xy, tool = drill.all_hits()
+    dia = np.array([drill.tools[t] for t in tool.tolist()]).reshape(-1)
+    index = spatial.GridIndex(spatial.points(xy), max(10 * tol, 0.01))
+    used = np.zeros(len(xy), dtype=bool)
+    diffs = []
+    for x, y, d, what in holes:
+        x, y, d = x * MM + offset[0], y * MM + offset[1], d * MM
+        idx = index.query(x - tol, y - tol, x + tol, y + tol)
+        if len(idx):
+            idx = idx[np.hypot(xy[idx, 0] - x, xy[idx, 1] - y) <= tol]
+        if not len(idx):
+            diffs.append((x, y, '%s: no drill hit (%.4f)' % (what, d)))
+            continue
+        same = idx[np.abs(dia[idx] - d) <= tol]
+        if len(same):
+            used[same] = True
+        else:
+            used[idx] = True
+            diffs.append((x, y, '%s: drill %.4f in the board, %.4f in the drill file' % (what, d, dia[idx[0]])))
+    for i in np.nonzero(~used)[0]:
+        diffs.append((xy[i, 0], xy[i, 1], 'drill hit T%02d (%.4f) with no via or pad' % (tool[i], dia[i])))
+    return diffs
+
+def check_wires(brd, layer_num, layer, offset, tol):
+    # returns a list of (x, y, message), in Gerber coordinates
+    sel = np.nonzero(layer.op == gerber.OP_DRAW)[0]
+    p0 = np.column_stack((layer.x0[sel], layer.y0[sel]))
+    p1 = np.column_stack((layer.x1[sel], layer.y1[sel]))
+    width = np.array([layer.aperture_size(int(d)) for d in layer.aperture[sel]]).reshape(-1)
+    # tracks may run either way, so index both ends
+    ends = np.concatenate((p0, p1))
+    other = np.concatenate((p1, p0))
+    ends_width = np.concatenate((width, width))
+    index = spatial.GridIndex(spatial.points(ends), max(10 * tol, 0.01))
+    diffs = []
+    for signal, x1, y1, x2, y2, w, wl in brd.wires:
+        if wl != layer_num:
+            continue
+        a = (x1 * MM + offset[0], y1 * MM + offset[1])
+        b = (x2 * MM + offset[0], y2 * MM + offset[1])
+        w = w * MM
+        idx = index.query(a[0] - tol, a[1] - tol, a[0] + tol, a[1] + tol)
+        if len(idx):
+            idx = idx[(np.hypot(ends[idx, 0] - a[0], ends[idx, 1] - a[1]) <= tol)
+                & (np.hypot(other[idx, 0] - b[0], other[idx, 1] - b[1]) <= tol)]
+        mid = (0.5 * (a[0] + b[0]), 0.5 * (a[1] + b[1]))
+        if not len(idx):
+            diffs.append((mid[0], mid[1], 'wire %s (%.4f,%.4f)-(%.4f,%.4f): no track' % (signal, a[0], a[1], b[0], b[1])))
+        elif not (np.abs(ends_width[idx] - w) <= tol).any():
+            diffs.append((mid[0], mid[1], 'wire %s: width %.4f in the board, %.4f in the Gerber' % (signal, w, ends_width[idx[0]])))
+    return diffs
+
+def regions(diffs, join):
+    # group differences closer than join into regions; returns a list of
+    # (xmin, ymin, xmax, ymax, [messages]) sorted by position
+    if not diffs:
+        return []
+    xy = np.array([(x, y) for x, y, _ in diffs])
+    ii, jj = spatial.GridIndex(spatial.points(xy), join).pairs(join)
+    group = drc.find_nets(len(xy), ii, jj)
+    out = []
+    for g in np.unique(group):
+        idx = np.nonzero(group == g)[0]
+        out.append((xy[idx, 0].min(), xy[idx, 1].min(), xy[idx, 0].max(), xy[idx, 1].max(),
+            [diffs[i][2] for i in idx]))
+    out.sort(key=lambda r: (r[1], r[0]))
+    return out
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Check that the Gerber and drill files match an Eagle board.')
+    cmd_parser.add_argument('board', nargs='?', default='../eagle/pyboard.brd', help='Eagle .brd file')
+    cmd_parser.add_argument('prefix', nargs='?', default='../gerber/pybv3', help='path and basename of the Gerber files')
+    cmd_parser.add_argument('-d', '--drill', default=None, help='drill file (default: <prefix>.drd)')
+    cmd_parser.add_argument('--offset', type=float, nargs=2, metavar=('X', 'Y'), help='board to Gerber offset in inches (default: from the outlines)')
+    cmd_parser.add_argument('-t', '--tolerance', type=float, default=0.002, help='position and size tolerance in inches (default 0.002)')
+    cmd_parser.add_argument('--join', type=float, default=0.1, help='report differences closer than this as one region (default 0.1)')
+    args = cmd_parser.parse_args()
+
+    brd = eagle.load(args.board)
+    layers = {num: gerber.read('%s.%s' % (args.prefix, ext)) for num, ext in copper_layers.items()}
+    offset = args.offset or outline_offset(brd, layers[1]) or (0.0, 0.0)
+    print('offset %.4f %.4f' % tuple(offset))
+
+    drill = excellon.read(args.drill or args.prefix + '.drd')
+    diffs = check_drills(board_holes(brd), drill, offset, args.tolerance)
+    for num, layer in layers.items():
+        diffs += check_wires(brd, num, layer, offset, args.tolerance)
+
+    found = regions(diffs, args.join)
+    for x0, y0, x1, y1, messages in found:
+        print('region %.4f,%.4f - %.4f,%.4f: %d difference%s' % (x0, y0, x1, y1, len(messages), '' if len(messages) == 1 else 's'))
+        for msg in messages:
+            print('   ', msg)
+    if found:
+        sys.exit(1)
+    print('board and fabrication files match')
+
+if __name__ == '__main__':
+    main()
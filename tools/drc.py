@@ -0,0 +1,313 @@
+"""
+Design-rule check of the Gerber and drill outputs in gerber/.
+
+Checks:
+
+    clearance   copper of different nets on the same layer closer than the
+                minimum clearance (top and bottom)
+    annular     drill hits whose copper pad leaves less than the minimum
+                ring around the hole, or that have no pad at all
+    silk        silkscreen (sst) over solder-mask openings (smt), ie over
+                pads
+
+Every draw and flash becomes a convex core (a point, segment, rectangle or
+octagon) and a radius, so a round-aperture track is a segment of radius
+w/2 and a rectangular pad a rectangle of radius 0.  The distance between
+two shapes is the distance between their cores less both radii.  Shapes
+are bucketed in a uniform grid (spatial.GridIndex) and only pairs in
+nearby cells are measured, in vectorised batches.
+
+Gerbers have no netlist, so nets are found from the copper itself: shapes
+that touch are joined (union-find) and a clearance error is a pair of
+shapes from different nets that is closer than the limit.
+
+The checks run in parallel, one task per check and layer.  Distances are
+in the units of the files (inches for the Eagle CAM output).  Zero-width
+draws (the board outline that Eagle adds to each layer) are ignored.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+import excellon
+import gerber
+import spatial
+
+# vertices per core; smaller cores repeat their vertices
+NV = 8
+
+# pairs measured per batch, to bound memory
+BATCH = 20000
+
+# distances at or below this are touching
+EPS = 1e-6
+
+class Shapes:
+    # the shapes of a layer as arrays: core vertices (n, NV, 2), radius
+    # (n,), whether the core is a polygon with area (n,), the index of the
+    # Gerber operation (n,) and the bounding box including the radius (n, 4)
+    def __init__(self, cores, radius, area, op):
+        self.cores = np.asarray(cores, dtype=float).reshape(-1, NV, 2)
+        self.radius = np.asarray(radius, dtype=float)
+        self.area = np.asarray(area, dtype=bool)
+        self.op = np.asarray(op, dtype=np.int64)
+        lo = self.cores.min(axis=1) - self.radius[:, None]
+        hi = self.cores.max(axis=1) + self.radius[:, None]
+        self.boxes = np.hstack((lo, hi))
+
+    def __len__(self):
+        return len(self.radius)
+
+def _repeat(points):
+    # NV vertices from a list of 1 to NV points, repeating them in order
+    return [points[i % len(points)] for i in range(NV)]
+
+def aperture_core(layer, dcode, x, y):
+    # (core points, radius, has area) for a flash of the aperture at (x, y)
+    template, params = layer.apertures[dcode]
+    if template == 'C':
+        return [(x, y)], params[0] / 2, False
+    if template == 'R':
+        w, h = params[0] / 2, params[1] / 2
+        return [(x - w, y - h), (x + w, y - h), (x + w, y + h), (x - w, y + h)], 0.0, True
+    if template == 'O':
+        w, h = params[0], params[1]
+        r = min(w, h) / 2
+        if w > h:
+            return [(x - w / 2 + r, y), (x + w / 2 - r, y)], r, False
+        return [(x, y - h / 2 + r), (x, y + h / 2 - r)], r, False
+    if template in layer.macros:
+        for code, p in gerber.eval_macro(layer.macros[template], params):
+            if code == 5 and int(p[1]) <= NV:
+                # regular polygon: exposure, vertices, x, y, diameter, rotation
+                n, cx, cy, d, rot = int(p[1]), p[2], p[3], p[4], p[5]
+                pts = [(x + cx + d / 2 * math.cos(math.radians(rot + 360 * k / n)),
+                    y + cy + d / 2 * math.sin(math.radians(rot + 360 * k / n))) for k in range(n)]
+                return pts, 0.0, True
+    # anything else is approximated by a circle of its nominal size
+    return [(x, y)], layer.aperture_size(dcode) / 2, False
+
+def layer_shapes(layer):
+    cores = []
+    radius = []
+    area = []
+    ops = []
+    for i in np.nonzero((layer.op != gerber.OP_MOVE) & layer.polarity)[0]:
+        dcode = int(layer.aperture[i])
+        if layer.aperture_size(dcode) <= 0:
+            continue
+        if layer.op[i] == gerber.OP_FLASH:
+            pts, r, a = aperture_core(layer, dcode, layer.x1[i], layer.y1[i])
+        else:
+            # draws are made with round apertures in practice; others are
+            # treated as round with their smaller dimension
+            pts = [(layer.x0[i], layer.y0[i]), (layer.x1[i], layer.y1[i])]
+            r, a = layer.aperture_size(dcode) / 2, False
+        cores.append(_repeat(pts))
+        radius.append(r)
+        area.append(a)
+        ops.append(i)
+    return Shapes(cores, radius, area, ops)
+
+def _point_segment(p, a, b):
+    # distance from points p to segments a-b; all (..., 2)
+    ab = b - a
+    ap = p - a
+    len2 = (ab * ab).sum(-1)
+    t = np.clip((ap * ab).sum(-1) / np.where(len2 > 0, len2, 1), 0, 1)
+    d = ap - t[..., None] * ab
+    return np.sqrt((d * d).sum(-1))
+
+def _cross(o, a, b):
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+def _inside(p, poly):
+    # whether points p (m, 2) are inside the convex polygons poly (m, NV, 2)
+    a = poly
+    b = np.roll(poly, -1, axis=1)
+    c = _cross(a, b, p[:, None, :])
+    return (c >= -EPS).all(axis=1) | (c <= EPS).all(axis=1)
+
+def core_distance(A, B, areaA, areaB):
+    # distance between the convex cores A and B, (m, NV, 2) each; zero if
+    # they touch, cross or one contains the other
+    A1 = np.roll(A, -1, axis=1)
+    B1 = np.roll(B, -1, axis=1)
+    # vertices of one against edges of the other
+    d1 = _point_segment(A[:, :, None, :], B[:, None, :, :], B1[:, None, :, :]).min(axis=(1, 2))
+    d2 = _point_segment(B[:, :, None, :], A[:, None, :, :], A1[:, None, :, :]).min(axis=(1, 2))
+    d = np.minimum(d1, d2)
+    # proper crossings of an edge of A with an edge of B
+    a0, a1 = A[:, :, None, :], A1[:, :, None, :]
+    b0, b1 = B[:, None, :, :], B1[:, None, :, :]
+    cross = ((_cross(a0, a1, b0) * _cross(a0, a1, b1) < 0) & (_cross(b0, b1, a0) * _cross(b0, b1, a1) < 0)).any(axis=(1, 2))
+    # containment, only meaningful for cores with area
+    contained = (areaB & _inside(A[:, 0], B)) | (areaA & _inside(B[:, 0], A))
+    d[cross | contained] = 0.0
+    return d
+
+def gaps(sa, ia, sb, ib):
+    # edge-to-edge gap between shapes sa[ia] and sb[ib], in batches
+    out = np.empty(len(ia))
+    for k in range(0, len(ia), BATCH):
+        a = ia[k:k + BATCH]
+        b = ib[k:k + BATCH]
+        d = core_distance(sa.cores[a], sb.cores[b], sa.area[a], sb.area[b])
+        out[k:k + BATCH] = d - sa.radius[a] - sb.radius[b]
+    return out
+
+def cross_pairs(sa, sb, maxdist):
+    # candidate pairs (i in sa, j in sb) with boxes within maxdist
+    index = spatial.GridIndex(sb.boxes, spatial.cell_size(sb.boxes))
+    ii = []
+    jj = []
+    for i, (x0, y0, x1, y1) in enumerate(sa.boxes):
+        idx = index.query(x0 - maxdist, y0 - maxdist, x1 + maxdist, y1 + maxdist)
+        ii.append(np.full(len(idx), i))
+        jj.append(idx)
+    if not ii:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(ii), np.concatenate(jj)
+
+def find_nets(n, ii, jj):
+    # union-find over the touching pairs; returns the net of each shape
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(ii.tolist(), jj.tolist()):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(n)])
+
+def _where(sa, i, sb, j):
+    # a point between two shapes, to say where an error is
+    a, b = sa.boxes[i], sb.boxes[j]
+    x = 0.5 * (max(a[0], b[0]) + min(a[2], b[2]))
+    y = 0.5 * (max(a[1], b[1]) + min(a[3], b[3]))
+    return x, y
+
+def _desc(layer, shapes, i):
+    k = shapes.op[i]
+    kind = 'flash' if layer.op[k] == gerber.OP_FLASH else 'draw'
+    return '%s D%d' % (kind, layer.aperture[k])
+
+def check_clearance(prefix, name, limit):
+    layer = gerber.read('%s.%s' % (prefix, name))
+    s = layer_shapes(layer)
+    index = spatial.GridIndex(s.boxes, spatial.cell_size(s.boxes))
+    ii, jj = index.pairs(limit)
+    g = gaps(s, ii, s, jj)
+    touch = g <= EPS
+    net = find_nets(len(s), ii[touch], jj[touch])
+    bad = np.nonzero(~touch & (g < limit) & (net[ii] != net[jj]))[0]
+    errors = []
+    for k in bad[np.argsort(g[bad])]:
+        i, j = ii[k], jj[k]
+        x, y = _where(s, i, s, j)
+        errors.append((x, y, 'clearance %.4f < %.4f between %s and %s' % (
+            g[k], limit, _desc(layer, s, i), _desc(layer, s, j))))
+    return ('clearance', name, len(np.unique(net)), errors)
+
+def check_annular(prefix, name, drill_file, limit):
+    layer = gerber.read('%s.%s' % (prefix, name))
+    drill = excellon.read(drill_file)
+    s = layer_shapes(layer)
+    xy, tool = drill.all_hits()
+    index = spatial.GridIndex(s.boxes, spatial.cell_size(s.boxes))
+    errors = []
+    for (x, y), t in zip(xy, tool):
+        hole_r = drill.tools[t] / 2
+        # any copper over the hole counts, as Eagle strokes long pads
+        idx = index.query(x, y, x, y)
+        best = -math.inf
+        if len(idx):
+            # inner distance from the hole centre to the pad edge
+            p = np.tile((x, y), (len(idx), 1))
+            core = s.cores[idx]
+            edge = _point_segment(p[:, None, :], core, np.roll(core, -1, axis=1)).min(axis=1)
+            inside = s.area[idx] & _inside(p, core)
+            reach = s.radius[idx] + np.where(inside, edge, -edge)
+            best = float(reach.max()) - hole_r
+        if best == -math.inf or best <= 0:
+            errors.append((x, y, 'T%02d hole (%.4f) has no pad' % (t, 2 * hole_r)))
+        elif best < limit:
+            errors.append((x, y, 'T%02d hole (%.4f) annular ring %.4f < %.4f' % (t, 2 * hole_r, best, limit)))
+    return ('annular', name, len(xy), errors)
+
+def check_silk(prefix, silk_name, mask_name, limit):
+    silk = gerber.read('%s.%s' % (prefix, silk_name))
+    mask = gerber.read('%s.%s' % (prefix, mask_name))
+    ss = layer_shapes(silk)
+    sm = layer_shapes(mask)
+    ii, jj = cross_pairs(ss, sm, max(limit, 0))
+    g = gaps(ss, ii, sm, jj)
+    bad = np.nonzero(g < limit)[0] if limit > 0 else np.nonzero(g < -EPS)[0]
+    errors = []
+    # one report per mask opening
+    for j in np.unique(jj[bad]):
+        k = bad[jj[bad] == j]
+        k = k[np.argmin(g[k])]
+        x, y = _where(ss, ii[k], sm, j)
+        errors.append((x, y, 'silk over pad (%s), %d silk shapes, overlap %.4f' % (
+            _desc(mask, sm, j), (jj[bad] == j).sum(), -g[k])))
+    return ('silk', '%s/%s' % (silk_name, mask_name), len(sm), errors)
+
+def run_task(task):
+    func = globals()[task[0]]
+    return func(*task[1:])
+
+def tasks(prefix, drill_file, clearance, ring, silk):
+    t = []
+    for name in ('top', 'bot'):
+        if os.path.exists('%s.%s' % (prefix, name)):
+            t.append(('check_clearance', prefix, name, clearance))
+            if os.path.exists(drill_file):
+                t.append(('check_annular', prefix, name, drill_file, ring))
+    for silk_name, mask_name in (('sst', 'smt'), ('ssb', 'smb')):
+        if os.path.exists('%s.%s' % (prefix, silk_name)) and os.path.exists('%s.%s' % (prefix, mask_name)):
+            t.append(('check_silk', prefix, silk_name, mask_name, silk))
+    return t
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Design-rule check of Gerber and drill files.')
+    cmd_parser.add_argument('-p', '--prefix', default='../gerber/pybv3', help='path and basename of the Gerber files')
+    cmd_parser.add_argument('-d', '--drill', default=None, help='drill file (default: <prefix>.drd)')
+    cmd_parser.add_argument('--clearance', type=float, default=0.006, help='minimum copper clearance (default 0.006)')
+    cmd_parser.add_argument('--ring', type=float, default=0.005, help='minimum annular ring (default 0.005)')
+    cmd_parser.add_argument('--silk', type=float, default=0.0, help='minimum silk to pad clearance (default 0: no overlap)')
+    cmd_parser.add_argument('-n', '--max-errors', type=int, default=20, help='errors to list per check (default 20)')
+    cmd_parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of cores)')
+    args = cmd_parser.parse_args()
+
+    todo = tasks(args.prefix, args.drill or args.prefix + '.drd', args.clearance, args.ring, args.silk)
+    with multiprocessing.Pool(args.jobs) as pool:
+        results = pool.map(run_task, todo)
+
+    total = 0
+    for check, name, count, errors in results:
+        what = {'clearance': 'nets', 'annular': 'holes', 'silk': 'pads'}[check]
+        print('%s %s: %d %s, %d error%s' % (check, name, count, what, len(errors), '' if len(errors) == 1 else 's'))
+        for x, y, msg in errors[:args.max_errors]:
+            print('    %8.4f %8.4f  %s' % (x, y, msg))
+        if len(errors) > args.max_errors:
+            print('    ...')
+        total += len(errors)
+    if total:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Loader for Eagle schematic (.sch) and board (.brd) files.
+
+The XML is streamed with ElementTree.iterparse and elements are cleared as
+soon as they have been read, so only the compact indexes are kept:
+
+    schematic: parts, net -> pins, (part, pin) -> net, part -> pin -> net,
+               part -> pin -> pads
+    board:     elements, package pads, signal -> pads, (element, pad) ->
+               signal, wires, vias, and the board outline
+
+The indexes are stored in the on-disk cache keyed on the file content, so
+later loads of an unchanged file skip XML parsing entirely.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import math
+import xml.etree.ElementTree as ET
+
+import cache
+
+class Schematic:
+    def __init__(self):
+        # part name -> (library, deviceset, device, value)
+        self.parts = {}
+        # net name -> list of (part, pin)
+        self.nets = {}
+        # (part, pin) -> net name
+        self.pin_net = {}
+        # part name -> {pin: net name}
+        self.part_pins = {}
+        # (library, deviceset, device) -> {pin: (pad, ...)}
+        self.connects = {}
+
+    def net_pins(self, net):
+        return self.nets.get(net, [])
+
+    def part_pads(self, part):
+        # {pin: (pad, ...)} for the given part
+        library, deviceset, device, _ = self.parts[part]
+        return self.connects.get((library, deviceset, device), {})
+
+    def part_nets(self, part):
+        # {pin: net} for the pins of the part that are connected
+        return self.part_pins.get(part, {})
+
+class Board:
+    def __init__(self):
+        # element name -> (library, package, value, x, y, rot)
+        self.elements = {}
+        # (library, package) -> {pad: (x, y, drill, dx, dy, layer, rot)};
+        # drill is None for an smd pad, and dx, dy, layer None for a pad
+        self.packages = {}
+        # signal name -> list of (element, pad)
+        self.signals = {}
+        # (element, pad) -> signal name
+        self.pad_signal = {}
+        # (signal, x1, y1, x2, y2, width, layer) for each track
+        self.wires = []
+        # (signal, x, y, drill, extent) for each via
+        self.vias = []
+        # (x1, y1, x2, y2) for each wire on the dimension layer
+        self.outline = []
+
+    def signal_pads(self, signal):
+        return self.signals.get(signal, [])
+
+    def element_pads(self, element):
+        # {pad: (x, y, drill, dx, dy, layer)} in board coordinates, with the
+        # element placement (position, rotation, mirroring) applied
+        library, package, value, ex, ey, rot = self.elements[element]
+        mirror, angle = parse_rot(rot)
+        c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        pads = {}
+        for name, (x, y, drill, dx, dy, layer, prot) in self.packages.get((library, package), {}).items():
+            if mirror:
+                x = -x
+                if layer == 1:
+                    layer = 16
+            px = ex + c * x - s * y
+            py = ey + s * x + c * y
+            if dx is not None and (parse_rot(prot)[1] + angle) % 180 == 90:
+                dx, dy = dy, dx
+            pads[name] = (px, py, drill, dx, dy, layer)
+        return pads
+
+def parse_rot(rot):
+    # "MR90" -> (True, 90.0)
+    if not rot:
+        return (False, 0.0)
+    mirror = 'M' in rot
+    angle = float(rot.lstrip('SM').lstrip('R') or 0)
+    return (mirror, angle)
+
+def _float(attrib, name, default=None):
+    v = attrib.get(name)
+    return default if v is None else float(v)
+
+def parse_schematic(filename):
+    sch = Schematic()
+    library = deviceset = device = None
+    net = None
+    for event, elem in ET.iterparse(filename, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == 'library':
+                library = elem.get('name')
+            elif tag == 'deviceset':
+                deviceset = elem.get('name')
+            elif tag == 'device':
+                device = elem.get('name')
+                sch.connects[(library, deviceset, device)] = {}
+            elif tag == 'net':
+                net = elem.get('name')
+                sch.nets[net] = []
+            continue
+
+        if tag == 'connect':
+            pads = tuple(elem.get('pad').split())
+            sch.connects[(library, deviceset, device)][elem.get('pin')] = pads
+        elif tag == 'part':
+            sch.parts[elem.get('name')] = (elem.get('library'), elem.get('deviceset'), elem.get('device'), elem.get('value'))
+        elif tag == 'pinref' and net is not None:
+            ref = (elem.get('part'), elem.get('pin'))
+            sch.nets[net].append(ref)
+            sch.pin_net[ref] = net
+            sch.part_pins.setdefault(ref[0], {})[ref[1]] = net
+        elif tag == 'library':
+            library = None
+        elif tag == 'net':
+            net = None
+        # drop everything that has been read; containers are cleared too
+        elem.clear()
+    return sch
+
+def parse_board(filename):
+    brd = Board()
+    library = package = None
+    signal = None
+    in_plain = False
+    for event, elem in ET.iterparse(filename, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == 'library':
+                library = elem.get('name')
+            elif tag == 'package' and library is not None:
+                package = elem.get('name')
+                brd.packages[(library, package)] = {}
+            elif tag == 'signal':
+                signal = elem.get('name')
+                brd.signals[signal] = []
+            elif tag == 'plain':
+                in_plain = True
+            continue
+
+        a = elem.attrib
+        if tag == 'pad' and package is not None:
+            brd.packages[(library, package)][a['name']] = (
+                float(a['x']), float(a['y']), _float(a, 'drill'), None, None, None, a.get('rot'))
+        elif tag == 'smd' and package is not None:
+            brd.packages[(library, package)][a['name']] = (
+                float(a['x']), float(a['y']), None, float(a['dx']), float(a['dy']), int(a['layer']), a.get('rot'))
+        elif tag == 'element':
+            brd.elements[a['name']] = (a['library'], a['package'], a.get('value'), float(a['x']), float(a['y']), a.get('rot'))
+        elif tag == 'contactref' and signal is not None:
+            ref = (a['element'], a['pad'])
+            brd.signals[signal].append(ref)
+            brd.pad_signal[ref] = signal
+        elif tag == 'wire':
+            if signal is not None:
+                brd.wires.append((signal, float(a['x1']), float(a['y1']), float(a['x2']), float(a['y2']), float(a['width']), int(a['layer'])))
+            elif in_plain and a.get('layer') == '20':
+                brd.outline.append((float(a['x1']), float(a['y1']), float(a['x2']), float(a['y2'])))
+        elif tag == 'via' and signal is not None:
+            brd.vias.append((signal, float(a['x']), float(a['y']), float(a['drill']), a.get('extent')))
+        elif tag == 'library':
+            library = None
+        elif tag == 'package':
+            package = None
+        elif tag == 'signal':
+            signal = None
+        elif tag == 'plain':
+            in_plain = False
+        elem.clear()
+    return brd
+
+def load(filename):
+    # load a .sch or .brd file, from the cache if it is unchanged
+    if filename.endswith('.sch'):
+        kind, cls, parser = 'eagle-sch', Schematic, parse_schematic
+    elif filename.endswith('.brd'):
+        kind, cls, parser = 'eagle-brd', Board, parse_board
+    else:
+        raise ValueError('not an Eagle schematic or board: %s' % filename)
+    key = cache.hash_files(filename)
+    state = cache.load(kind, key)
+    if state is None:
+        obj = parser(filename)
+        cache.store(kind, key, obj.__dict__)
+    else:
+        obj = cls()
+        obj.__dict__.update(state)
+    return obj
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Query Eagle schematic and board files.')
+    cmd_parser.add_argument('file', help='.sch or .brd file')
+    cmd_parser.add_argument('--net', help='list the pins (schematic) or pads (board) on a net')
+    cmd_parser.add_argument('--part', help='list the nets of a part (schematic) or its pads (board)')
+    args = cmd_parser.parse_args()
+
+    obj = load(args.file)
+    if isinstance(obj, Schematic):
+        if args.net:
+            for part, pin in obj.net_pins(args.net):
+                print('%s.%s' % (part, pin))
+        elif args.part:
+            for pin, net in sorted(obj.part_nets(args.part).items()):
+                print(pin, net)
+        else:
+            print('%d parts, %d nets, %d pinrefs' % (len(obj.parts), len(obj.nets), len(obj.pin_net)))
+    else:
+        if args.net:
+            for element, pad in obj.signal_pads(args.net):
+                print('%s.%s' % (element, pad))
+        elif args.part:
+            for pad, (x, y, drill, dx, dy, layer) in sorted(obj.element_pads(args.part).items()):
+                print(pad, '%.3f %.3f' % (x, y), obj.pad_signal.get((args.part, pad), ''))
+        else:
+            print('%d elements, %d signals, %d contactrefs, %d wires, %d vias' % (
+                len(obj.elements), len(obj.signals), len(obj.pad_signal), len(obj.wires), len(obj.vias)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Reader and statistics for Excellon drill files, such as gerber/pybv3.drd.
+
+Hits are loaded into one NumPy (n, 2) array per tool.  The report gives
+hole counts per tool, the distribution of nearest-neighbour hole spacing
+(using a grid index rather than checking all pairs), the board extent
+covered by holes, and the spindle travel before and after reordering the
+hits of each tool into a shorter path.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import math
+import re
+
+import numpy as np
+
+import spatial
+
+_tool_def_re = re.compile(r'T(\d+)(?:F\d+|S\d+)*C([0-9.]+)')
+_tool_sel_re = re.compile(r'T(\d+)$')
+_hit_re = re.compile(r'(?:X([-+]?[0-9.]+))?(?:Y([-+]?[0-9.]+))?$')
+
+class ExcellonError(Exception):
+    pass
+
+class Drill:
+    def __init__(self):
+        self.units = 'in'
+        self.zeros = 'L'
+        self.digits = (2, 4)
+        self.tools = {}
+        self.hits = {}
+
+    def all_hits(self):
+        # (n, 2) array of every hit, and an array of the tool for each
+        if not self.hits:
+            return np.zeros((0, 2)), np.zeros(0, dtype=int)
+        xy = np.concatenate(list(self.hits.values()))
+        tool = np.concatenate([np.full(len(h), t) for t, h in self.hits.items()])
+        return xy, tool
+
+    def extent(self):
+        xy, _ = self.all_hits()
+        if len(xy) == 0:
+            return None
+        return (xy[:, 0].min(), xy[:, 1].min(), xy[:, 0].max(), xy[:, 1].max())
+
+def _coord(drill, value):
+    if '.' in value:
+        return float(value)
+    if drill.zeros == 'T':
+        # trailing zeros suppressed: the number is left-aligned
+        sign = value[0] if value[0] in '+-' else ''
+        value = sign + value.lstrip('+-').ljust(sum(drill.digits), '0')
+    return int(value) / 10 ** drill.digits[1]
+
+def parse(f):
+    drill = Drill()
+    hits = {}
+    tool = None
+    x = y = 0.0
+    in_header = False
+    for line in f:
+        line = line.strip()
+        if not line or line.startswith(';'):
+            continue
+        if line == 'M48':
+            in_header = True
+            continue
+        if line == '%' or line == 'M95':
+            in_header = False
+            continue
+        if line in ('M71', 'METRIC') or line.startswith('METRIC,'):
+            drill.units = 'mm'
+            drill.digits = (3, 3)
+        elif line in ('M72', 'INCH') or line.startswith('INCH,'):
+            drill.units = 'in'
+            drill.digits = (2, 4)
+        if ',' in line and line.split(',')[0] in ('INCH', 'METRIC'):
+            for opt in line.split(',')[1:]:
+                if opt == 'LZ':
+                    # leading zeros present, so trailing ones are suppressed
+                    drill.zeros = 'T'
+                elif opt == 'TZ':
+                    drill.zeros = 'L'
+            continue
+        if line in ('M71', 'M72', 'METRIC', 'INCH'):
+            continue
+        if in_header:
+            m = _tool_def_re.match(line)
+            if m:
+                drill.tools[int(m.group(1))] = float(m.group(2))
+            continue
+        if line in ('M30', 'M00'):
+            break
+        m = _tool_sel_re.match(line)
+        if m:
+            tool = int(m.group(1))
+            if tool != 0 and tool not in drill.tools:
+                raise ExcellonError('undefined tool T%02d' % tool)
+            continue
+        if line[0] in 'XY':
+            m = _hit_re.match(line)
+            if m is None:
+                raise ExcellonError('unsupported line %r' % line)
+            if tool is None:
+                raise ExcellonError('hit before tool selection')
+            if m.group(1) is not None:
+                x = _coord(drill, m.group(1))
+            if m.group(2) is not None:
+                y = _coord(drill, m.group(2))
+            hits.setdefault(tool, []).append((x, y))
+            continue
+        if line[0] in 'GM':
+            # G05 drill mode, M-codes for pattern/stop are not used by Eagle
+            continue
+        raise ExcellonError('unsupported line %r' % line)
+    for t, h in hits.items():
+        drill.hits[t] = np.array(h, dtype=float).reshape(-1, 2)
+    return drill
+
+def read(filename):
+    with open(filename) as f:
+        return parse(f)
+
+def write(f, drill, hits=None):
+    # write the drill file back out, optionally with reordered hits
+    if hits is None:
+        hits = drill.hits
+    ndec = drill.digits[1]
+    f.write('%\nM48\n')
+    f.write('M72\n' if drill.units == 'in' else 'M71\n')
+    for t, d in sorted(drill.tools.items()):
+        f.write('T%02dC%.4f\n' % (t, d))
+    f.write('%\n')
+    for t, h in hits.items():
+        f.write('T%02d\n' % t)
+        for x, y in np.round(h * 10 ** ndec).astype(np.int64):
+            f.write('X%dY%d\n' % (x, y))
+    f.write('M30\n')
+
+def nearest_spacing(xy):
+    # centre-to-centre distance from each hole to its nearest neighbour
+    n = len(xy)
+    if n < 2:
+        return np.zeros(0)
+    boxes = spatial.points(xy)
+    index = spatial.GridIndex(boxes, spatial.cell_size(boxes))
+    mask = np.zeros(n, dtype=bool)
+    dist = np.empty(n)
+    for i in range(n):
+        mask[i] = True
+        dist[i] = index.nearest(xy[i, 0], xy[i, 1], mask)[1]
+        mask[i] = False
+    return dist
+
+def path_length(xy, start=(0.0, 0.0)):
+    if len(xy) == 0:
+        return 0.0
+    pts = np.vstack((start, xy))
+    return float(np.hypot(np.diff(pts[:, 0]), np.diff(pts[:, 1])).sum())
+
+def order_hits(xy, start=(0.0, 0.0)):
+    # greedy nearest-neighbour path from start, using a grid index, then
+    # improved with 2-opt; returns the permutation of the hits
+    n = len(xy)
+    if n < 3:
+        return np.arange(n)
+    boxes = spatial.points(xy)
+    index = spatial.GridIndex(boxes, spatial.cell_size(boxes))
+    visited = np.zeros(n, dtype=bool)
+    order = np.empty(n, dtype=np.int64)
+    x, y = start
+    for k in range(n):
+        i, _ = index.nearest(x, y, visited)
+        order[k] = i
+        visited[i] = True
+        x, y = xy[i]
+    return two_opt(xy, order, start)
+
+def two_opt(xy, order, start=(0.0, 0.0), max_passes=20):
+    # reverse the sub-path that most shortens the total path, one segment
+    # at a time; each step is vectorised over the other end point
+    pts = np.vstack((start, xy[order]))
+    n = len(pts)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 2):
+            a = pts[i]
+            b = pts[i + 1]
+            c = pts[i + 2:]
+            d = np.vstack((pts[i + 3:], [[np.nan, np.nan]]))
+            d_ab = math.hypot(*(b - a))
+            d_cd = np.hypot(*(d - c).T)
+            d_ac = np.hypot(*(c - a).T)
+            d_bd = np.hypot(*(d - b).T)
+            # the last point has no successor, so the path is open there
+            d_cd[-1] = 0.0
+            d_bd[-1] = 0.0
+            delta = d_ac + d_bd - d_ab - d_cd
+            j = np.argmin(delta)
+            if delta[j] < -1e-9:
+                pts[i + 1:i + 3 + j] = pts[i + 1:i + 3 + j][::-1].copy()
+                order[i:i + 2 + j] = order[i:i + 2 + j][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+def report(drill, optimise=True):
+    lines = []
+    units = drill.units
+    xy, _ = drill.all_hits()
+    lines.append('holes: %d' % len(xy))
+    for t, d in sorted(drill.tools.items()):
+        lines.append('  T%02d %.4f%s: %d' % (t, d, units, len(drill.hits.get(t, ()))))
+    ext = drill.extent()
+    if ext is not None:
+        lines.append('extent: %.4f,%.4f - %.4f,%.4f (%.4f x %.4f %s)' % (
+            ext + (ext[2] - ext[0], ext[3] - ext[1], units)))
+
+    dist = nearest_spacing(xy)
+    if len(dist):
+        lines.append('nearest-neighbour spacing (%s): min %.4f, p5 %.4f, median %.4f, p95 %.4f, max %.4f' % (
+            (units,) + tuple(np.percentile(dist, (0, 5, 50, 95, 100)))))
+        counts, edges = np.histogram(dist, bins=8)
+        for c, lo, hi in zip(counts, edges[:-1], edges[1:]):
+            lines.append('  %.4f - %.4f: %s %d' % (lo, hi, '#' * int(round(40 * c / counts.max())), c))
+
+    if optimise:
+        before = after = 0.0
+        pos = (0.0, 0.0)
+        pos_opt = (0.0, 0.0)
+        orders = {}
+        for t, h in drill.hits.items():
+            before += path_length(h, pos)
+            pos = h[-1]
+            orders[t] = order_hits(h, pos_opt)
+            after += path_length(h[orders[t]], pos_opt)
+            pos_opt = h[orders[t]][-1]
+        lines.append('spindle travel: %.3f%s in file order, %.3f%s reordered (%.1f%% shorter)' % (
+            before, units, after, units, 100 * (1 - after / before) if before else 0))
+        return lines, orders
+    return lines, None
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Report hole statistics for an Excellon drill file.')
+    cmd_parser.add_argument('file', help='Excellon drill file')
+    cmd_parser.add_argument('-o', '--output', help='write the drill file with reordered hits')
+    cmd_parser.add_argument('--no-optimise', action='store_true', help='skip the drill-order optimisation')
+    args = cmd_parser.parse_args()
+
+    drill = read(args.file)
+    lines, orders = report(drill, not args.no_optimise)
+    print('\n'.join(lines))
+    if args.output and orders is not None:
+        with open(args.output, 'w') as f:
+            write(f, drill, {t: drill.hits[t][o] for t, o in orders.items()})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""
+Reader for RS-274X Gerber files, such as the layers in gerber/.
+
+The file is tokenized in a single streaming pass.  The D01/D02/D03
+operations are collected into columnar NumPy arrays (operation, aperture,
+polarity, start and end coordinates) rather than one Python object per
+operation, so large layers load without per-object overhead.
+
+Step-and-repeat blocks (%SR) are expanded as they are closed: the
+operations of the block are appended again for each further copy, moved
+by the step, so a panel reads the same as one drawn out in full.
+
+Apertures are kept as (template, params) tuples, eg ('C', (0.0165,)) or
+('OC8', (0.064,)), and aperture macros as lists of primitive strings that
+can be evaluated with eval_macro.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import re
+from array import array
+
+import numpy as np
+
+# operation codes, as in the D01/D02/D03 commands
+OP_DRAW = 1
+OP_MOVE = 2
+OP_FLASH = 3
+
+_word_re = re.compile(r'([A-Z])([-+]?[0-9.]+)')
+_fs_re = re.compile(r'FS([LT])([AI])X(\d)(\d)Y(\d)(\d)$')
+_ad_re = re.compile(r'ADD(\d+)([A-Za-z_.$][^,]*)(?:,(.*))?$')
+_sr_re = re.compile(r'SR(?:X(\d+)Y(\d+)(?:I([-+]?[0-9.]+))?(?:J([-+]?[0-9.]+))?)?$')
+
+class GerberError(Exception):
+    pass
+
+class Layer:
+    def __init__(self):
+        self.units = 'in'
+        self.zeros = 'L'
+        self.digits = (2, 4)
+        self.apertures = {}
+        self.macros = {}
+        self.op = None
+        self.aperture = None
+        self.polarity = None
+        self.x0 = None
+        self.y0 = None
+        self.x1 = None
+        self.y1 = None
+
+    def __len__(self):
+        return len(self.op)
+
+    def draws(self):
+        return self.op == OP_DRAW
+
+    def flashes(self):
+        return self.op == OP_FLASH
+
+    def bounds(self):
+        # (xmin, ymin, xmax, ymax) of all draw and flash end points, not
+        # including aperture size
+        sel = self.op != OP_MOVE
+        if not sel.any():
+            return None
+        xs = np.concatenate((self.x0[sel], self.x1[sel]))
+        ys = np.concatenate((self.y0[sel], self.y1[sel]))
+        return (xs.min(), ys.min(), xs.max(), ys.max())
+
+    def aperture_size(self, dcode):
+        # nominal diameter/width of an aperture, for clearance checks
+        template, params = self.apertures[dcode]
+        if template in ('C', 'P'):
+            return params[0]
+        if template in ('R', 'O'):
+            return min(params[0], params[1])
+        if params:
+            return params[0]
+        return 0.0
+
+def tokenize(f):
+    # yield ('ext', statement) for each statement of an extended (%...%)
+    # block and ('cmd', statement) for each ordinary word command; an
+    # aperture macro is yielded whole as a single 'ext' statement
+    in_ext = False
+    buf = ''
+    ext = []
+    for line in f:
+        segs = line.strip().split('%')
+        for i, seg in enumerate(segs):
+            if i > 0:
+                # a '%' opens or closes an extended block
+                if in_ext:
+                    if buf:
+                        ext.append(buf)
+                    ext = [s for s in ext if s]
+                    if ext and ext[0].startswith('AM'):
+                        yield ('ext', '*'.join(ext))
+                    else:
+                        for stmt in ext:
+                            yield ('ext', stmt)
+                    ext = []
+                elif buf:
+                    raise GerberError('unterminated command %r' % buf)
+                buf = ''
+                in_ext = not in_ext
+            parts = seg.split('*')
+            parts[0] = buf + parts[0]
+            buf = parts.pop()
+            if in_ext:
+                ext.extend(parts)
+            else:
+                for stmt in parts:
+                    if stmt:
+                        yield ('cmd', stmt)
+    if in_ext or buf:
+        raise GerberError('unexpected end of file')
+
+def eval_expr(expr, args):
+    # evaluate an aperture macro expression such as "1.08239X$1"; Gerber
+    # uses "x" (or "X") for multiplication
+    tokens = re.findall(r'\$\d+|\d*\.\d+|\d+|[-+xX/()]', expr.replace(' ', ''))
+    pos = 0
+
+    def bad():
+        return GerberError('bad macro expression %r' % expr)
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def atom():
+        nonlocal pos
+        t = peek()
+        pos += 1
+        if t is None or t in (')', 'x', 'X', '/'):
+            raise bad()
+        if t == '(':
+            v = add()
+            if peek() != ')':
+                raise bad()
+            pos += 1
+            return v
+        if t == '-':
+            return -atom()
+        if t == '+':
+            return atom()
+        if t.startswith('$'):
+            i = int(t[1:]) - 1
+            return args[i] if i < len(args) else 0.0
+        return float(t)
+
+    def mul():
+        nonlocal pos
+        v = atom()
+        while peek() in ('x', 'X', '/'):
+            t = peek()
+            pos += 1
+            if t == '/':
+                v /= atom()
+            else:
+                v *= atom()
+        return v
+
+    def add():
+        nonlocal pos
+        v = mul()
+        while peek() in ('+', '-'):
+            t = peek()
+            pos += 1
+            if t == '+':
+                v += mul()
+            else:
+                v -= mul()
+        return v
+
+    v = add()
+    if pos != len(tokens):
+        raise bad()
+    return v
+
+def eval_macro(macro, args):
+    # evaluate the primitives of a macro for the given aperture parameters;
+    # returns a list of (primitive code, [params]), skipping comments
+    args = list(args)
+    prims = []
+    for stmt in macro:
+        if stmt.startswith('0'):
+            continue
+        if stmt.startswith('$'):
+            var, expr = stmt.split('=', 1)
+            i = int(var[1:]) - 1
+            while len(args) <= i:
+                args.append(0.0)
+            args[i] = eval_expr(expr, args)
+            continue
+        fields = stmt.split(',')
+        prims.append((int(fields[0]), [eval_expr(p, args) for p in fields[1:]]))
+    return prims
+
+def _repeat(block, op, aperture, polarity, coords):
+    # append copies of the operations from block's start, for a closed
+    # step-and-repeat block (start, nx, ny, step x, step y), in the order
+    # of the steps, x first; each array is copied whole with NumPy
+    start, nx, ny, sx, sy = block
+    n = len(op)
+    steps = np.array([(i * sx, j * sy) for j in range(ny) for i in range(nx)][1:], dtype=np.float64)
+    if n == start or not len(steps):
+        return
+    copies = len(steps)
+    op.frombytes(np.tile(np.frombuffer(op[start:n], dtype=np.int8), copies).tobytes())
+    aperture.frombytes(np.tile(np.frombuffer(aperture[start:n], dtype=np.int16), copies).tobytes())
+    polarity.frombytes(np.tile(np.frombuffer(polarity[start:n], dtype=np.int8), copies).tobytes())
+    xy = np.frombuffer(coords[4 * start:4 * n], dtype=np.float64).reshape(-1, 4)
+    moved = xy[np.newaxis, :, :] + steps[:, [0, 1, 0, 1]][:, np.newaxis, :]
+    coords.frombytes(moved.tobytes())
+
+def parse(f):
+    layer = Layer()
+    op = array('b')
+    aperture = array('h')
+    polarity = array('b')
+    coords = array('d')
+
+    scale = 10 ** layer.digits[1]
+    x = y = 0.0
+    dcode = 0
+    dark = 1
+    # the open step-and-repeat block, if any
+    block = None
+
+    for kind, stmt in tokenize(f):
+        if kind == 'ext':
+            if stmt.startswith('FS'):
+                m = _fs_re.match(stmt)
+                if m is None or m.group(2) != 'A':
+                    raise GerberError('unsupported format %r' % stmt)
+                layer.zeros = m.group(1)
+                layer.digits = (int(m.group(3)), int(m.group(4)))
+                scale = 10 ** layer.digits[1]
+            elif stmt.startswith('MO'):
+                layer.units = 'in' if stmt == 'MOIN' else 'mm'
+            elif stmt.startswith('AD'):
+                m = _ad_re.match(stmt)
+                if m is None:
+                    raise GerberError('bad aperture definition %r' % stmt)
+                params = m.group(3)
+                params = tuple(float(p) for p in params.split('X')) if params else ()
+                layer.apertures[int(m.group(1))] = (m.group(2), params)
+            elif stmt.startswith('AM'):
+                name, *prims = stmt.split('*')
+                layer.macros[name[2:]] = [p for p in prims if p]
+            elif stmt.startswith('LP'):
+                dark = 1 if stmt == 'LPD' else 0
+            elif stmt.startswith('SR'):
+                m = _sr_re.match(stmt)
+                if m is None:
+                    raise GerberError('bad step and repeat %r' % stmt)
+                # an SR closes the open block and opens the next, if any
+                if block is not None:
+                    _repeat(block, op, aperture, polarity, coords)
+                    block = None
+                if m.group(1) is not None:
+                    nx, ny = int(m.group(1)), int(m.group(2))
+                    sx, sy = float(m.group(3) or 0), float(m.group(4) or 0)
+                    if nx > 1 or ny > 1:
+                        block = (len(op), nx, ny, sx, sy)
+            elif stmt.startswith(('OF', 'IP', 'SF', 'IN', 'LN', 'MI', 'IR', 'AS')):
+                # image parameters that Eagle always writes with their
+                # default values
+                pass
+            else:
+                raise GerberError('unsupported extended command %r' % stmt)
+            continue
+
+        if stmt.startswith('G04'):
+            continue
+        d = None
+        new_x, new_y = x, y
+        for letter, value in _word_re.findall(stmt):
+            if letter == 'X' or letter == 'Y':
+                if layer.zeros == 'T':
+                    ndigits = sum(layer.digits)
+                    sign = value[0] if value[0] in '+-' else ''
+                    value = sign + value.lstrip('+-').ljust(ndigits, '0')
+                v = int(value) / scale
+                if letter == 'X':
+                    new_x = v
+                else:
+                    new_y = v
+            elif letter == 'D':
+                d = int(value)
+            elif letter == 'G':
+                g = int(value)
+                if g in (2, 3, 36, 37):
+                    raise GerberError('unsupported command %r' % stmt)
+            elif letter == 'M':
+                pass
+            else:
+                raise GerberError('unsupported command %r' % stmt)
+        if d is None:
+            if new_x != x or new_y != y:
+                raise GerberError('coordinates without operation %r' % stmt)
+            continue
+        if d >= 10:
+            if d not in layer.apertures:
+                raise GerberError('undefined aperture D%d' % d)
+            dcode = d
+            continue
+        if d not in (OP_DRAW, OP_MOVE, OP_FLASH):
+            raise GerberError('unsupported operation %r' % stmt)
+        op.append(d)
+        aperture.append(dcode)
+        polarity.append(dark)
+        if d == OP_FLASH:
+            coords.extend((new_x, new_y, new_x, new_y))
+        else:
+            coords.extend((x, y, new_x, new_y))
+        x, y = new_x, new_y
+
+    if block is not None:
+        _repeat(block, op, aperture, polarity, coords)
+    layer.op = np.frombuffer(op, dtype=np.int8).copy() if op else np.zeros(0, np.int8)
+    layer.aperture = np.frombuffer(aperture, dtype=np.int16).copy() if aperture else np.zeros(0, np.int16)
+    layer.polarity = np.frombuffer(polarity, dtype=np.int8).astype(bool) if polarity else np.zeros(0, bool)
+    xy = np.frombuffer(coords, dtype=np.float64).reshape(-1, 4) if coords else np.zeros((0, 4))
+    layer.x0, layer.y0, layer.x1, layer.y1 = (xy[:, i].copy() for i in range(4))
+    return layer
+
+def read(filename):
+    with open(filename) as f:
+        return parse(f)
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Summarise Gerber layers.')
+    cmd_parser.add_argument('files', nargs='+', help='Gerber files to read')
+    args = cmd_parser.parse_args()
+
+    for filename in args.files:
+        layer = read(filename)
+        print('%s: %d draws, %d flashes, %d moves, %d apertures, %d macros' % (
+            filename, layer.draws().sum(), layer.flashes().sum(), (layer.op == OP_MOVE).sum(),
+            len(layer.apertures), len(layer.macros)))
+        b = layer.bounds()
+        if b is not None:
+            print('    extent %.4f,%.4f - %.4f,%.4f %s' % (b + (layer.units,)))
+
+if __name__ == '__main__':
+    main()
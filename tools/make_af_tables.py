@@ -0,0 +1,374 @@
+"""
+Generate C pin and alternate-function tables for the pyboard firmware.
+
+From the AF CSV and the board's pin_info this writes <prefix>.h and
+<prefix>.c with:
+
+    pyb_af_signal_names   the AF signals used by the board's pins, with an
+                          enum PYB_AF_SIG_<name> of their numbers
+    pyb_af_entries        every (AF, signal) of every pin packed in a
+                          uint16 as af << 12 | signal, grouped by pin
+    pyb_cpu_pins          per CPU pin: GPIO port and pin number, a bitmask
+                          of the AF numbers it has, and its entries
+    pyb_board_pins        board pins (X1, Y12, P2, ...) and their CPU pin,
+                          stored in the slots of a minimal perfect hash
+
+so pyb_board_pin_find("X9") is one hash, one table read and one compare,
+and whether a pin has an AF is one bit test.  The hash is FNV-1a with a
+seed, and the perfect hash is hash-and-displace: the seedless hash picks a
+bucket, the bucket's displacement is the seed for the hash that picks the
+slot.
+
+Before writing, the tables are checked by decoding them the way the C
+code does and comparing with a fresh parse of the CSV.  With --bench a C
+test program is written too, which checks every lookup against a list
+made from the CSV and times the hash lookup against a linear search;
+--run also compiles it with $CC (default cc) and runs it.
+
+    python make_af_tables.py -o build/pyb_af --bench --run
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+import afdb
+import pyb_pins
+
+MAX_SIGNALS = 1 << 12
+
+def fnv1a(s, seed):
+    # must match pyb_pin_hash in the generated C
+    h = 2166136261 ^ seed
+    for c in s.encode():
+        h = ((h ^ c) * 16777619) & 0xffffffff
+    return h
+
+def perfect_hash(keys):
+    # (displacements, slots): slots[fnv1a(k, disp[fnv1a(k, 0) % r]) % n]
+    # is k for every key; buckets are placed largest first
+    n = len(keys)
+    r = max(1, (n + 1) // 2)
+    buckets = [[] for _ in range(r)]
+    for k in keys:
+        buckets[fnv1a(k, 0) % r].append(k)
+    disp = [0] * r
+    slots = [None] * n
+    for b in sorted(range(r), key=lambda b: -len(buckets[b])):
+        if not buckets[b]:
+            continue
+        for d in range(1, 1 << 16):
+            pos = [fnv1a(k, d) % n for k in buckets[b]]
+            if len(set(pos)) == len(pos) and all(slots[p] is None for p in pos):
+                break
+        else:
+            raise ValueError('no perfect hash found')
+        disp[b] = d
+        for k, p in zip(buckets[b], pos):
+            slots[p] = k
+    return disp, slots
+
+def c_ident(signal):
+    return re.sub(r'[^A-Za-z0-9]', '_', signal)
+
+def split_cpu(cpu):
+    # "B11" -> (1, 11)
+    return ord(cpu[0]) - ord('A'), int(cpu[1:])
+
+class Tables:
+    def __init__(self, table):
+        # board pins with a CPU pin, and the CPU pins in header order
+        self.board = [(name, cpu) for name, (label, cpu) in table['board'].items() if cpu]
+        self.cpu_pins = []
+        for _, cpu in self.board:
+            if cpu not in self.cpu_pins:
+                self.cpu_pins.append(cpu)
+        afs = {cpu: [(af, sig) for af, sig in table['cpu'][cpu] if af is not None] for cpu in self.cpu_pins}
+        self.signals = sorted({sig for entries in afs.values() for _, sig in entries})
+        if len(self.signals) > MAX_SIGNALS:
+            raise ValueError('too many signals for the packed entries')
+        sig_id = {sig: i for i, sig in enumerate(self.signals)}
+        self.entries = []
+        # per cpu pin: (port, pin, af mask, first entry, count)
+        self.cpu = []
+        for cpu in self.cpu_pins:
+            first = len(self.entries)
+            mask = 0
+            for af, sig in sorted(afs[cpu]):
+                self.entries.append(af << 12 | sig_id[sig])
+                mask |= 1 << af
+            port, pin = split_cpu(cpu)
+            self.cpu.append((port, pin, mask, first, len(self.entries) - first))
+        self.disp, slots = perfect_hash([name for name, _ in self.board])
+        cpu_of = dict(self.board)
+        self.slots = [(name, self.cpu_pins.index(cpu_of[name])) for name in slots]
+
+    def find(self, name):
+        # Python version of pyb_board_pin_find
+        if not 0 < len(name) < 4:
+            return None
+        d = self.disp[fnv1a(name, 0) % len(self.disp)]
+        slot = self.slots[fnv1a(name, d) % len(self.slots)]
+        return slot if slot[0] == name else None
+
+    def sizes(self):
+        # bytes of each table on a 32-bit target
+        disp_size = 1 if max(self.disp) < 256 else 2
+        return {
+            'pyb_af_entries': 2 * len(self.entries),
+            'pyb_cpu_pins': 8 * len(self.cpu),
+            'pyb_board_pins': 5 * len(self.slots),
+            'pyb_board_pin_disp': disp_size * len(self.disp),
+        }
+
+def verify(tables, csv_file):
+    # decode the tables as the C code does and compare with the CSV
+    db = afdb.parse(csv_file)
+    errors = []
+    for name, cpu in tables.board:
+        slot = tables.find(name)
+        if slot is None or tables.cpu_pins[slot[1]] != cpu:
+            errors.append('%s: perfect hash gives %r' % (name, slot))
+            continue
+        port, pin, mask, first, count = tables.cpu[slot[1]]
+        if (port, pin) != split_cpu(cpu):
+            errors.append('%s: CPU pin %d.%d, expected %s' % (name, port, pin, cpu))
+        got = sorted((e >> 12, tables.signals[e & 0xfff]) for e in tables.entries[first:first + count])
+        want = sorted(db.pin_afs(cpu))
+        if got != want:
+            errors.append('%s: AFs %r, expected %r' % (name, got, want))
+        want_mask = 0
+        for af, _ in want:
+            want_mask |= 1 << af
+        if mask != want_mask:
+            errors.append('%s: AF mask %04x, expected %04x' % (name, mask, want_mask))
+    for name in ('', 'X13', 'Y16', 'P1', 'x1', 'X99', 'Z1', 'X1 '):
+        if tables.find(name) is not None:
+            errors.append('%r: found, but is not a pin with a CPU pin' % name)
+    return errors
+
+def write_header(f, tables, name):
+    guard = c_ident(os.path.basename(name)).upper() + '_H'
+    f.write('// Generated by tools/make_af_tables.py, do not edit.\n\n')
+    f.write('#ifndef %s\n#define %s\n\n#include <stddef.h>\n#include <stdint.h>\n\n' % (guard, guard))
+    f.write('#define PYB_NUM_AF_SIGNALS (%d)\n' % len(tables.signals))
+    f.write('#define PYB_NUM_CPU_PINS (%d)\n' % len(tables.cpu))
+    f.write('#define PYB_NUM_BOARD_PINS (%d)\n' % len(tables.slots))
+    f.write('#define PYB_BOARD_PIN_BUCKETS (%d)\n\n' % len(tables.disp))
+    f.write('enum {\n')
+    for i, sig in enumerate(tables.signals):
+        f.write('    PYB_AF_SIG_%s = %d,\n' % (c_ident(sig), i))
+    f.write('};\n\n')
+    f.write('typedef struct _pyb_cpu_pin_t {\n')
+    f.write('    uint8_t port; // 0 is GPIOA\n    uint8_t pin;\n')
+    f.write('    uint16_t af_mask; // bit n set if the pin has AFn\n')
+    f.write('    uint16_t af_first; // index of its first entry in pyb_af_entries\n')
+    f.write('    uint8_t af_count;\n} pyb_cpu_pin_t;\n\n')
+    f.write('typedef struct _pyb_board_pin_t {\n    char name[4];\n    uint8_t cpu; // index in pyb_cpu_pins\n} pyb_board_pin_t;\n\n')
+    f.write('extern const char *const pyb_af_signal_names[PYB_NUM_AF_SIGNALS];\n')
+    f.write('extern const uint16_t pyb_af_entries[%d];\n' % len(tables.entries))
+    f.write('extern const pyb_cpu_pin_t pyb_cpu_pins[PYB_NUM_CPU_PINS];\n')
+    f.write('extern const pyb_board_pin_t pyb_board_pins[PYB_NUM_BOARD_PINS];\n\n')
+    f.write('#define PYB_AF_ENTRY_AF(e) ((e) >> 12)\n#define PYB_AF_ENTRY_SIGNAL(e) ((e) & 0xfff)\n\n')
+    f.write('static inline int pyb_cpu_pin_has_af(const pyb_cpu_pin_t *pin, unsigned int af) {\n')
+    f.write('    return (pin->af_mask >> af) & 1;\n}\n\n')
+    f.write('uint32_t pyb_pin_hash(const char *s, size_t len, uint32_t seed);\n')
+    f.write('// the board pin with the given name, or NULL\n')
+    f.write('const pyb_board_pin_t *pyb_board_pin_find(const char *name, size_t len);\n')
+    f.write('// the AF number that connects the signal to the pin, or -1\n')
+    f.write('int pyb_cpu_pin_af(const pyb_cpu_pin_t *pin, unsigned int signal);\n\n')
+    f.write('#endif // %s\n' % guard)
+
+def write_source(f, tables, name):
+    f.write('// Generated by tools/make_af_tables.py, do not edit.\n\n')
+    f.write('#include <string.h>\n\n#include "%s.h"\n\n' % os.path.basename(name))
+    f.write('const char *const pyb_af_signal_names[PYB_NUM_AF_SIGNALS] = {\n')
+    for sig in tables.signals:
+        f.write('    "%s",\n' % sig)
+    f.write('};\n\n')
+    f.write('// af << 12 | signal, grouped by pin and sorted by AF\n')
+    f.write('const uint16_t pyb_af_entries[%d] = {\n' % len(tables.entries))
+    for port, pin, mask, first, count in tables.cpu:
+        f.write('    %s // P%c%d\n' % (' '.join('0x%04x,' % e for e in tables.entries[first:first + count]), chr(ord('A') + port), pin))
+    f.write('};\n\n')
+    f.write('const pyb_cpu_pin_t pyb_cpu_pins[PYB_NUM_CPU_PINS] = {\n')
+    for port, pin, mask, first, count in tables.cpu:
+        f.write('    {%d, %d, 0x%04x, %d, %d}, // P%c%d\n' % (port, pin, mask, first, count, chr(ord('A') + port), pin))
+    f.write('};\n\n')
+    f.write('// in perfect hash order\n')
+    f.write('const pyb_board_pin_t pyb_board_pins[PYB_NUM_BOARD_PINS] = {\n')
+    for board_name, cpu in tables.slots:
+        f.write('    {"%s", %d},\n' % (board_name, cpu))
+    f.write('};\n\n')
+    disp_type = 'uint8_t' if max(tables.disp) < 256 else 'uint16_t'
+    f.write('static const %s pyb_board_pin_disp[PYB_BOARD_PIN_BUCKETS] = {\n    %s\n};\n\n' % (
+        disp_type, ', '.join(str(d) for d in tables.disp)))
+    f.write('// FNV-1a with a seed\n')
+    f.write('uint32_t pyb_pin_hash(const char *s, size_t len, uint32_t seed) {\n')
+    f.write('    uint32_t h = 2166136261u ^ seed;\n')
+    f.write('    while (len--) {\n        h = (h ^ (uint8_t)*s++) * 16777619u;\n    }\n    return h;\n}\n\n')
+    f.write('const pyb_board_pin_t *pyb_board_pin_find(const char *name, size_t len) {\n')
+    f.write('    if (len == 0 || len >= sizeof(pyb_board_pins[0].name)) {\n        return NULL;\n    }\n')
+    f.write('    uint32_t d = pyb_board_pin_disp[pyb_pin_hash(name, len, 0) % PYB_BOARD_PIN_BUCKETS];\n')
+    f.write('    const pyb_board_pin_t *p = &pyb_board_pins[pyb_pin_hash(name, len, d) % PYB_NUM_BOARD_PINS];\n')
+    f.write('    if (strncmp(p->name, name, len) != 0 || p->name[len] != \'\\0\') {\n        return NULL;\n    }\n')
+    f.write('    return p;\n}\n\n')
+    f.write('int pyb_cpu_pin_af(const pyb_cpu_pin_t *pin, unsigned int signal) {\n')
+    f.write('    const uint16_t *e = &pyb_af_entries[pin->af_first];\n')
+    f.write('    for (unsigned int i = 0; i < pin->af_count; i++) {\n')
+    f.write('        if (PYB_AF_ENTRY_SIGNAL(e[i]) == signal) {\n            return PYB_AF_ENTRY_AF(e[i]);\n        }\n    }\n')
+    f.write('    return -1;\n}\n')
+
+def write_bench(f, tables, csv_file, name):
+    # a host test: every (board pin, cpu pin, af, signal) from the CSV must
+    # be found through the tables, then the two lookups are timed
+    db = afdb.parse(csv_file)
+    f.write('// Generated by tools/make_af_tables.py, do not edit.\n')
+    f.write('// Host check and benchmark of the tables in %s.c.\n\n' % os.path.basename(name))
+    f.write('#include <stdio.h>\n#include <string.h>\n#include <time.h>\n\n#include "%s.h"\n\n' % os.path.basename(name))
+    f.write('typedef struct { const char *pin; int port; int num; int af; const char *signal; } expect_t;\n\n')
+    f.write('static const expect_t expected[] = {\n')
+    for board_name, cpu in tables.board:
+        port, pin = split_cpu(cpu)
+        for af, sig in db.pin_afs(cpu):
+            f.write('    {"%s", %d, %d, %d, "%s"},\n' % (board_name, port, pin, af, sig))
+    f.write('};\n\n')
+    f.write('static const char *const misses[] = {"", "X13", "Y16", "P1", "x1", "X99", "Z1", "X1 ", "X100"};\n\n')
+    f.write('''static const pyb_board_pin_t *linear_find(const char *name, size_t len) {
+    for (int i = 0; i < PYB_NUM_BOARD_PINS; i++) {
+        if (strncmp(pyb_board_pins[i].name, name, len) == 0 && pyb_board_pins[i].name[len] == '\\0') {
+            return &pyb_board_pins[i];
+        }
+    }
+    return NULL;
+}
+
+static int signal_number(const char *signal) {
+    for (int i = 0; i < PYB_NUM_AF_SIGNALS; i++) {
+        if (strcmp(pyb_af_signal_names[i], signal) == 0) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+static double now(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + t.tv_nsec * 1e-9;
+}
+
+static double bench(const pyb_board_pin_t *(*find)(const char *, size_t), const char *const *names, const size_t *lens, int n, int rounds) {
+    volatile uintptr_t sink = 0;
+    double t0 = now();
+    for (int r = 0; r < rounds; r++) {
+        for (int i = 0; i < n; i++) {
+            sink += (uintptr_t)find(names[i], lens[i]);
+        }
+    }
+    (void)sink;
+    return (now() - t0) / ((double)rounds * n) * 1e9;
+}
+
+int main(void) {
+    int errors = 0;
+    size_t n_expected = sizeof(expected) / sizeof(expected[0]);
+    int counts[PYB_NUM_CPU_PINS] = {0};
+    for (size_t i = 0; i < n_expected; i++) {
+        const expect_t *x = &expected[i];
+        const pyb_board_pin_t *b = pyb_board_pin_find(x->pin, strlen(x->pin));
+        int sig = signal_number(x->signal);
+        if (b == NULL) {
+            printf("%s: not found\\n", x->pin);
+            errors++;
+            continue;
+        }
+        const pyb_cpu_pin_t *c = &pyb_cpu_pins[b->cpu];
+        if (c->port != x->port || c->pin != x->num) {
+            printf("%s: CPU pin %d.%d, expected %d.%d\\n", x->pin, c->port, c->pin, x->port, x->num);
+            errors++;
+        }
+        if (sig < 0 || pyb_cpu_pin_af(c, sig) != x->af || !pyb_cpu_pin_has_af(c, x->af)) {
+            printf("%s: %s is not AF%d\\n", x->pin, x->signal, x->af);
+            errors++;
+        }
+        counts[b->cpu]++;
+    }
+    for (int i = 0; i < PYB_NUM_BOARD_PINS; i++) {
+        const pyb_board_pin_t *b = &pyb_board_pins[i];
+        if (pyb_board_pin_find(b->name, strlen(b->name)) != b) {
+            printf("%s: not found at its slot\\n", b->name);
+            errors++;
+        }
+        if (counts[b->cpu] != pyb_cpu_pins[b->cpu].af_count) {
+            printf("%s: %d AF entries, expected %d\\n", b->name, pyb_cpu_pins[b->cpu].af_count, counts[b->cpu]);
+            errors++;
+        }
+        counts[b->cpu] = pyb_cpu_pins[b->cpu].af_count;
+    }
+    for (size_t i = 0; i < sizeof(misses) / sizeof(misses[0]); i++) {
+        if (pyb_board_pin_find(misses[i], strlen(misses[i])) != NULL) {
+            printf("\\"%s\\": found\\n", misses[i]);
+            errors++;
+        }
+    }
+    printf("%zu AF entries checked, %d errors\\n", n_expected, errors);
+
+    const char *names[PYB_NUM_BOARD_PINS];
+    size_t lens[PYB_NUM_BOARD_PINS];
+    for (int i = 0; i < PYB_NUM_BOARD_PINS; i++) {
+        names[i] = pyb_board_pins[i].name;
+        lens[i] = strlen(names[i]);
+    }
+    int rounds = 200000;
+    printf("perfect hash lookup: %.1f ns\\n", bench(pyb_board_pin_find, names, lens, PYB_NUM_BOARD_PINS, rounds));
+    printf("linear search:       %.1f ns\\n", bench(linear_find, names, lens, PYB_NUM_BOARD_PINS, rounds));
+    return errors != 0;
+}
+''')
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Generate C pin and AF tables for the pyboard firmware.')
+    cmd_parser.add_argument('-o', '--output', default='pyb_af', help='output path without extension (default pyb_af)')
+    cmd_parser.add_argument('--board', default='pybv10b', choices=sorted(pyb_pins.boards), help='board (default pybv10b)')
+    cmd_parser.add_argument('--bench', action='store_true', help='also write <output>_bench.c, a host check and benchmark')
+    cmd_parser.add_argument('--run', action='store_true', help='compile and run the host check (implies --bench)')
+    args = cmd_parser.parse_args()
+
+    tables = Tables(pyb_pins.load_table(args.board))
+    csv_file = pyb_pins.sources(args.board)[1]
+    errors = verify(tables, csv_file)
+    if errors:
+        for e in errors:
+            print(e, file=sys.stderr)
+        sys.exit(1)
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.output + '.h', 'w') as f:
+        write_header(f, tables, args.output)
+    with open(args.output + '.c', 'w') as f:
+        write_source(f, tables, args.output)
+    sizes = tables.sizes()
+    print('%d board pins, %d CPU pins, %d signals, %d AF entries; %d bytes of tables plus %d of signal names' % (
+        len(tables.slots), len(tables.cpu), len(tables.signals), len(tables.entries),
+        sum(sizes.values()), sum(len(s) + 1 for s in tables.signals)))
+
+    if args.bench or args.run:
+        bench = args.output + '_bench.c'
+        with open(bench, 'w') as f:
+            write_bench(f, tables, csv_file, args.output)
+        if args.run:
+            exe = args.output + '_bench'
+            cc = os.environ.get('CC', 'cc')
+            subprocess.check_call([cc, '-O2', '-Wall', '-o', exe, bench, args.output + '.c'])
+            sys.exit(subprocess.call([os.path.abspath(exe)]))
+
+if __name__ == '__main__':
+    main()
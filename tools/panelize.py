@@ -0,0 +1,483 @@
+"""
+Make a panel of boards from a set of Gerber layers and an Excellon drill
+file, such as gerber/pybv3.*.
+
+The panel is cols x rows copies of the board with a gap between them,
+breakaway rails on two (or four) sides, fiducials on the rails and
+mouse-bite tabs joining every board edge to the board or rail beside it.
+A tab is a break in the routed outline of the board, and in the edge of
+the board or rail facing it, with a row of small non-plated holes along
+the board edge across it.
+
+Gerber layers are streamed a line at a time and never loaded whole (the
+drill file is small and is read once with excellon.py).  Coordinates are
+rewritten to %FSLAX24Y24*% and moved so the first board sits inside the
+rails, and the board is then repeated with the Gerber step-and-repeat
+command (%SR), so each panel layer is about the size of the board layer.
+Layers that already use %SR (it cannot be nested), or all layers with
+--no-sr, get an explicit copy of the board for each position instead.
+Drill files have no step-and-repeat that fabs reliably accept, so the
+hits are written out for each board, a tool at a time.  With --check,
+each panel layer is then read back with gerber.py, which expands every
+copy, and checked to hold the board's draws and flashes at every
+position.
+
+The panel additions go on the layers by extension: fiducial pads on top
+and bot, fiducial mask openings on smt and smb, the panel outline and
+rail edges on mil, mouse-bite holes in the drill file.  With tabs, the
+board outline (the zero-width draws of mil) is taken out of the repeated
+board and drawn for each board instead, broken at its tabs.
+
+    python panelize.py -c 3 -r 2 -o panel ../gerber/pybv3
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+import excellon
+import gerber
+
+# all sizes are in inches
+FIDUCIAL = 0.0394
+FIDUCIAL_MASK = 0.0787
+
+_fs_re = re.compile(r'%FS([LT])([AI])X(\d)(\d)Y(\d)(\d)\*%')
+_ad_re = re.compile(r'%ADD(\d+)')
+_coord_re = re.compile(r'([XY])([-+]?\d+)')
+_header_re = re.compile(r'(G0?4|G7[0-5]|G9[01])\b')
+_d_re = re.compile(r'D(\d+)')
+
+def _cut(a0, a1, gaps):
+    # the parts of the interval a0..a1 outside the (lo, hi) gaps
+    parts = [(min(a0, a1), max(a0, a1))]
+    for g0, g1 in gaps:
+        parts = [q for lo, hi in parts for q in ((lo, min(hi, g0)), (max(lo, g1), hi)) if q[1] - q[0] > 1e-6]
+    return parts
+
+class Panel:
+    def __init__(self, bounds, cols, rows, gap, rail, rails):
+        # bounds is the board outline (xmin, ymin, xmax, ymax) in inches
+        bx0, by0, bx1, by1 = bounds
+        self.cols, self.rows = cols, rows
+        self.board_w, self.board_h = bx1 - bx0, by1 - by0
+        self.gap, self.rail, self.rails = gap, rail, rails
+        self.pitch = (self.board_w + gap, self.board_h + gap)
+        left = rail + gap if 'l' in rails else 0.0
+        bottom = rail + gap if 'b' in rails else 0.0
+        right = rail + gap if 'r' in rails else 0.0
+        top = rail + gap if 't' in rails else 0.0
+        self.width = left + cols * self.board_w + (cols - 1) * gap + right
+        self.height = bottom + rows * self.board_h + (rows - 1) * gap + top
+        # moves the board from its own coordinates to the first position
+        self.offset = (left - bx0, bottom - by0)
+        self.origin = (left, bottom)
+
+    def positions(self):
+        # lower left corner of each board, row by row
+        for j in range(self.rows):
+            for i in range(self.cols):
+                yield (self.origin[0] + i * self.pitch[0], self.origin[1] + j * self.pitch[1])
+
+    def fiducials(self):
+        # three fiducials, not symmetric, so the panel cannot be placed
+        # rotated; on the top/bottom rails if there are any
+        r, w, h = self.rail, self.width, self.height
+        if 'b' in self.rails and 't' in self.rails:
+            return [(0.3, r / 2), (w - 0.3, r / 2), (0.3, h - r / 2)]
+        if 'l' in self.rails and 'r' in self.rails:
+            return [(r / 2, 0.3), (r / 2, h - 0.3), (w - r / 2, 0.3)]
+        return []
+
+    def tabs(self, count, width):
+        # the tab gaps of each board, as {(i, j): [(kind, at, lo, hi)]}: for
+        # each board edge that faces another board or a rail, count gaps of
+        # the given width on the edge line ('h' at y = at, or 'v' at x = at)
+        out = {}
+        for j in range(self.rows):
+            for i in range(self.cols):
+                x0 = self.origin[0] + i * self.pitch[0]
+                y0 = self.origin[1] + j * self.pitch[1]
+                x1, y1 = x0 + self.board_w, y0 + self.board_h
+                sides = []
+                if j > 0 or 'b' in self.rails:
+                    sides.append(('h', y0, x0, x1))
+                if j < self.rows - 1 or 't' in self.rails:
+                    sides.append(('h', y1, x0, x1))
+                if i > 0 or 'l' in self.rails:
+                    sides.append(('v', x0, y0, y1))
+                if i < self.cols - 1 or 'r' in self.rails:
+                    sides.append(('v', x1, y0, y1))
+                gaps = out[(i, j)] = []
+                for kind, at, a0, a1 in sides:
+                    for t in range(count):
+                        c = a0 + (a1 - a0) * (t + 0.5) / count
+                        gaps.append((kind, at, c - width / 2, c + width / 2))
+        return out
+
+    def rail_edges(self, tabs=None):
+        # the inner edge of each rail, as (x0, y0, x1, y1), broken where a
+        # board is tabbed to the rail
+        r, w, h = self.rail, self.width, self.height
+        gaps = [g for gs in (tabs or {}).values() for g in gs]
+
+        def cut(kind, edge, length):
+            # the edge of a rail from 0 to length, without the tabs on the
+            # board edge line facing it
+            return _cut(0, length, [(lo, hi) for k, at, lo, hi in gaps if k == kind and abs(at - edge) < 1e-6])
+
+        x0, y0 = self.origin
+        x1 = x0 + (self.cols - 1) * self.pitch[0] + self.board_w
+        y1 = y0 + (self.rows - 1) * self.pitch[1] + self.board_h
+        edges = []
+        if 'b' in self.rails:
+            edges += [(a, r, b, r) for a, b in cut('h', y0, w)]
+        if 't' in self.rails:
+            edges += [(a, h - r, b, h - r) for a, b in cut('h', y1, w)]
+        if 'l' in self.rails:
+            edges += [(r, a, r, b) for a, b in cut('v', x0, h)]
+        if 'r' in self.rails:
+            edges += [(w - r, a, w - r, b) for a, b in cut('v', x1, h)]
+        return edges
+
+    def outlines(self, segments, tabs):
+        # the board outline segments (board coordinates, inches) at every
+        # position, with the parts on a tabbed board edge cut at the tabs
+        out = []
+        for j in range(self.rows):
+            for i in range(self.cols):
+                dx = self.offset[0] + i * self.pitch[0]
+                dy = self.offset[1] + j * self.pitch[1]
+                gaps = tabs.get((i, j), [])
+                for x0, y0, x1, y1 in segments:
+                    x0, y0, x1, y1 = x0 + dx, y0 + dy, x1 + dx, y1 + dy
+                    if abs(y0 - y1) < 1e-6:
+                        cut = [(lo, hi) for kind, at, lo, hi in gaps if kind == 'h' and abs(at - y0) < 1e-6]
+                        out += [(a, y0, b, y0) for a, b in _cut(x0, x1, cut)]
+                    elif abs(x0 - x1) < 1e-6:
+                        cut = [(lo, hi) for kind, at, lo, hi in gaps if kind == 'v' and abs(at - x0) < 1e-6]
+                        out += [(x0, a, x0, b) for a, b in _cut(y0, y1, cut)]
+                    else:
+                        out.append((x0, y0, x1, y1))
+        return out
+
+    def bites(self, tabs, holes, pitch):
+        # mouse-bite hole centres: a row of holes along the board edge line
+        # in the middle of each tab
+        out = []
+        span = (holes - 1) * pitch
+        for gaps in tabs.values():
+            for kind, at, lo, hi in gaps:
+                c = 0.5 * (lo + hi)
+                for k in range(holes):
+                    s = c - span / 2 + k * pitch
+                    out.append((s, at) if kind == 'h' else (at, s))
+        return out
+
+def _to_24(value, zeros, digits):
+    # a coordinate string in the input format -> integer in 1e-4 units
+    if zeros == 'T':
+        sign = value[0] if value[0] in '+-' else ''
+        value = sign + value.lstrip('+-').ljust(sum(digits), '0')
+    v = int(value)
+    if digits[1] <= 4:
+        return v * 10 ** (4 - digits[1])
+    return int(round(v / 10 ** (digits[1] - 4)))
+
+def _fmt_24(v):
+    return '-%06d' % -v if v < 0 else '%06d' % v
+
+def _line(op, x, y):
+    return 'X%sY%sD%02d*\n' % (_fmt_24(int(round(x * 1e4))), _fmt_24(int(round(y * 1e4))), op)
+
+def gerber_header(filename):
+    # (header lines, format, units, highest D-code, uses %SR) from a pass
+    # over the file; the header is everything before the first operation
+    header = []
+    fmt = ('L', (2, 4))
+    units = 'in'
+    dmax = 9
+    uses_sr = False
+    in_ext = False
+    in_header = True
+    with open(filename) as f:
+        for line in f:
+            s = line.strip()
+            if in_ext or s.startswith('%'):
+                in_ext = not (s.endswith('%') and (in_ext or len(s) > 1))
+                if s.startswith('%FS'):
+                    m = _fs_re.match(s)
+                    # incremental coordinates are relative to the last point, so
+                    # adding the board offset to each would corrupt them
+                    if m is None or m.group(2) != 'A':
+                        raise gerber.GerberError('%s: unsupported format %r' % (filename, s))
+                    fmt = (m.group(1), (int(m.group(3)), int(m.group(4))))
+                    line = '%FSLAX24Y24*%\n'
+                m = _ad_re.match(s)
+                if m:
+                    dmax = max(dmax, int(m.group(1)))
+                if s.startswith('%MOMM'):
+                    units = 'mm'
+                if s.startswith('%SR'):
+                    uses_sr = True
+            elif in_header and s and not _header_re.match(s):
+                in_header = False
+            if in_header:
+                header.append(line)
+    return header, fmt, units, dmax, uses_sr
+
+def gerber_body(filename, nheader, fmt, dx, dy, cut=()):
+    # the lines after the header up to M02, with X and Y moved by (dx, dy)
+    # in 1e-4 units; draws and flashes with an aperture in cut are turned
+    # into moves, so the current point is still where the file expects
+    zeros, digits = fmt
+    dcode = None
+
+    def move(m):
+        v = _to_24(m.group(2), zeros, digits) + (dx if m.group(1) == 'X' else dy)
+        return m.group(1) + _fmt_24(v)
+
+    def op(m):
+        nonlocal dcode
+        d = int(m.group(1))
+        if d >= 10:
+            dcode = d
+        elif d in (1, 3) and dcode in cut:
+            return 'D02'
+        return m.group(0)
+
+    in_ext = False
+    with open(filename) as f:
+        for n, line in enumerate(f):
+            if n < nheader:
+                continue
+            s = line.strip()
+            if in_ext or s.startswith('%'):
+                # extended commands, including macro bodies, are left alone
+                in_ext = not (s.endswith('%') and (in_ext or len(s) > 1))
+                yield line
+            elif s.startswith('M02'):
+                break
+            elif s.startswith('G04'):
+                yield line
+            else:
+                line = _coord_re.sub(move, line)
+                yield _d_re.sub(op, line) if cut else line
+
+def panel_gerber(filename, out, panel, use_sr=True, routes=None, cut=()):
+    # routes replaces the rail edges drawn on mil, and cut is the apertures
+    # of the board layer to leave out (see gerber_body)
+    header, fmt, units, dmax, uses_sr = gerber_header(filename)
+    ext = os.path.splitext(filename)[1][1:].lower()
+    k = 25.4 if units == 'mm' else 1.0
+    # the panel additions and their apertures for this layer
+    flashes = []
+    draws = []
+    if ext in ('top', 'bot'):
+        flashes = [(FIDUCIAL, xy) for xy in panel.fiducials()]
+    elif ext in ('smt', 'smb'):
+        flashes = [(FIDUCIAL_MASK, xy) for xy in panel.fiducials()]
+    elif ext == 'mil':
+        w, h = panel.width, panel.height
+        draws = [(0, 0, w, 0), (w, 0, w, h), (w, h, 0, h), (0, h, 0, 0)]
+        draws += panel.rail_edges() if routes is None else routes
+    apertures = {}
+    for size, _ in flashes:
+        apertures.setdefault(size, dmax + 1 + len(apertures))
+    if draws:
+        apertures.setdefault(0.0, dmax + 1 + len(apertures))
+
+    for line in header:
+        out.write(line)
+    for size, d in sorted(apertures.items(), key=lambda a: a[1]):
+        out.write('%%ADD%dC,%.4f*%%\n' % (d, size * k))
+
+    dx = int(round(panel.offset[0] * k * 1e4))
+    dy = int(round(panel.offset[1] * k * 1e4))
+    if use_sr and not uses_sr:
+        out.write('%%SRX%dY%dI%.4fJ%.4f*%%\n' % (panel.cols, panel.rows, panel.pitch[0] * k, panel.pitch[1] * k))
+        for line in gerber_body(filename, len(header), fmt, dx, dy, cut):
+            out.write(line)
+        out.write('%SR*%\n')
+    else:
+        for x, y in panel.positions():
+            sx = dx + int(round((x - panel.origin[0]) * k * 1e4))
+            sy = dy + int(round((y - panel.origin[1]) * k * 1e4))
+            # each copy starts from its own origin, as the first one does
+            out.write(_line(2, sx / 1e4, sy / 1e4))
+            for line in gerber_body(filename, len(header), fmt, sx, sy, cut):
+                out.write(line)
+
+    out.write('%LPD*%\n')
+    if draws:
+        out.write('D%d*\n' % apertures[0.0])
+        for x0, y0, x1, y1 in draws:
+            out.write(_line(2, x0 * k, y0 * k))
+            out.write(_line(1, x1 * k, y1 * k))
+    for size, (x, y) in flashes:
+        out.write('D%d*\n' % apertures[size])
+        out.write(_line(3, x * k, y * k))
+    out.write('M02*\n')
+    return len(draws), len(flashes)
+
+def _board_offsets(panel, k):
+    # offset of each board from its own coordinates, in 1e-4 file units,
+    # rounded as panel_gerber rounds them
+    dx = int(round(panel.offset[0] * k * 1e4))
+    dy = int(round(panel.offset[1] * k * 1e4))
+    for x, y in panel.positions():
+        yield dx + int(round((x - panel.origin[0]) * k * 1e4)), dy + int(round((y - panel.origin[1]) * k * 1e4))
+
+def _rows(layer, sel):
+    # the draws or flashes of a layer as sorted rows of (x0, y0, x1, y1) in
+    # 1e-4 file units, the resolution of the panel files
+    xy = np.column_stack((layer.x0[sel], layer.y0[sel], layer.x1[sel], layer.y1[sel]))
+    return np.round(xy * 1e4).astype(np.int64)
+
+def _sorted(rows):
+    return rows[np.lexsort(rows.T[::-1])]
+
+def check_gerber(src, dst, panel, added, cut=()):
+    # read the panel layer back and check that it has the board's draws
+    # and flashes, other than those with an aperture in cut, at every
+    # position, and added (draws, flashes) more; returns a list of problems
+    board = gerber.read(src)
+    layer = gerber.read(dst)
+    k = 25.4 if board.units == 'mm' else 1.0
+    kept = ~np.isin(board.aperture, list(cut))
+    problems = []
+    for name, sel_b, sel_p, extra in (('draws', board.draws() & kept, layer.draws(), added[0]),
+            ('flashes', board.flashes() & kept, layer.flashes(), added[1])):
+        b = _rows(board, sel_b)
+        want = np.concatenate([b + (dx, dy, dx, dy) for dx, dy in _board_offsets(panel, k)])
+        got = _rows(layer, sel_p)
+        if len(got) != len(want) + extra:
+            problems.append('%s: %d %s, expected %d' % (dst, len(got), name, len(want) + extra))
+        elif not np.array_equal(_sorted(got[:len(want)]), _sorted(want)):
+            problems.append('%s: %s not where the boards are' % (dst, name))
+    return problems
+
+def panel_drill(filename, out, panel, bites, bite_drill):
+    # the drill file is read whole, once: its hits are a few small arrays
+    drill = excellon.read(filename)
+    k = 25.4 if drill.units == 'mm' else 1.0
+    scale = 10 ** drill.digits[1]
+    tools = dict(drill.tools)
+    bite_tool = max(tools, default=0) + 1
+    if bites:
+        tools[bite_tool] = bite_drill * k
+    out.write('%\nM48\n')
+    out.write('M72\n' if drill.units == 'in' else 'M71\n')
+    for t, d in sorted(tools.items()):
+        out.write('T%02dC%.4f\n' % (t, d))
+    out.write('%\n')
+    for t in sorted(drill.tools):
+        out.write('T%02d\n' % t)
+        hits = drill.hits.get(t, np.zeros((0, 2)))
+        # the hits of each board together, which is the shorter path for
+        # the drill
+        for x0, y0 in panel.positions():
+            dx = (x0 - panel.origin[0] + panel.offset[0]) * k
+            dy = (y0 - panel.origin[1] + panel.offset[1]) * k
+            for x, y in np.round((hits + (dx, dy)) * scale).astype(np.int64):
+                out.write('X%dY%d\n' % (x, y))
+    if bites:
+        out.write('T%02d\n' % bite_tool)
+        for x, y in bites:
+            out.write('X%dY%d\n' % (round(x * k * scale), round(y * k * scale)))
+    out.write('M30\n')
+
+def board_outline(filename):
+    # (segments, apertures) of the board outline in the mil (or any)
+    # layer: its zero-width draws as (x0, y0, x1, y1) rows in inches, and
+    # their D-codes; every draw and flash if it has no zero-width aperture
+    layer = gerber.read(filename)
+    zero = [d for d in layer.apertures if layer.aperture_size(d) == 0]
+    sel = (layer.op != gerber.OP_MOVE) & np.isin(layer.aperture, zero) if zero else layer.op != gerber.OP_MOVE
+    k = 1 / 25.4 if layer.units == 'mm' else 1.0
+    segments = np.column_stack((layer.x0[sel], layer.y0[sel], layer.x1[sel], layer.y1[sel])) * k
+    return segments, zero
+
+def board_bounds(segments):
+    xs = np.concatenate((segments[:, 0], segments[:, 2]))
+    ys = np.concatenate((segments[:, 1], segments[:, 3]))
+    return (xs.min(), ys.min(), xs.max(), ys.max())
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Panelise Gerber and Excellon files.')
+    cmd_parser.add_argument('prefix', nargs='?', default='../gerber/pybv3', help='path and basename of the board files')
+    cmd_parser.add_argument('-o', '--outdir', default='panel', help='output directory (default panel)')
+    cmd_parser.add_argument('-c', '--cols', type=int, default=2, help='boards across (default 2)')
+    cmd_parser.add_argument('-r', '--rows', type=int, default=2, help='boards down (default 2)')
+    cmd_parser.add_argument('--gap', type=float, default=0.1, help='routed gap between boards, inches (default 0.1)')
+    cmd_parser.add_argument('--rail', type=float, default=0.2, help='rail width, inches (default 0.2)')
+    cmd_parser.add_argument('--rails', default='tb', help='sides with rails, any of t, b, l, r (default tb)')
+    cmd_parser.add_argument('--tabs', type=int, default=2, help='mouse-bite tabs per board edge (default 2)')
+    cmd_parser.add_argument('--tab-width', type=float, default=None, help='length of the break in the route at a tab, inches (default: the row of holes end to end)')
+    cmd_parser.add_argument('--bite-drill', type=float, default=0.02, help='mouse-bite hole size, inches (default 0.02)')
+    cmd_parser.add_argument('--bite-pitch', type=float, default=0.03, help='mouse-bite hole spacing, inches (default 0.03)')
+    cmd_parser.add_argument('--bite-holes', type=int, default=5, help='holes per tab (default 5)')
+    cmd_parser.add_argument('--no-sr', action='store_true', help='copy the board instead of using %%SR')
+    cmd_parser.add_argument('--check', action='store_true', help='read each panel layer back and check it against the board')
+    args = cmd_parser.parse_args()
+
+    if set(args.rails) - set('tblr'):
+        cmd_parser.error('--rails takes any of t, b, l and r, not %r' % args.rails)
+    tab_width = args.tab_width
+    if tab_width is None:
+        tab_width = (args.bite_holes - 1) * args.bite_pitch + args.bite_drill
+
+    directory, base = os.path.split(args.prefix)
+    files = sorted(f for f in os.listdir(directory or '.') if f.startswith(base + '.'))
+    outline = args.prefix + '.mil'
+    routed = os.path.exists(outline)
+    if not routed:
+        outline = args.prefix + '.top'
+    segments, zero = board_outline(outline)
+    panel = Panel(board_bounds(segments), args.cols, args.rows, args.gap, args.rail, args.rails)
+    if not panel.fiducials():
+        print('warning: no fiducials; they need rails on t and b, or on l and r', file=sys.stderr)
+    if args.tabs * tab_width >= min(panel.board_w, panel.board_h):
+        cmd_parser.error('%d tabs of %.3f in do not fit on a board edge' % (args.tabs, tab_width))
+
+    bites = []
+    routes = None
+    cut = ()
+    if args.tabs > 0:
+        tabs = panel.tabs(args.tabs, tab_width)
+        bites = panel.bites(tabs, args.bite_holes, args.bite_pitch)
+        if routed and zero:
+            routes = panel.rail_edges(tabs) + panel.outlines(segments, tabs)
+            cut = set(zero)
+        else:
+            print('warning: no zero-width board outline on a mil layer, so the route is not broken at the tabs', file=sys.stderr)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    problems = []
+    for name in files:
+        src = os.path.join(directory, name)
+        dst = os.path.join(args.outdir, name)
+        with open(dst, 'w') as out:
+            if name.endswith('.drd'):
+                panel_drill(src, out, panel, bites, args.bite_drill)
+                continue
+            mil = name.endswith('.mil')
+            added = panel_gerber(src, out, panel, not args.no_sr, routes if mil else None, cut if mil else ())
+        if args.check:
+            # read the layer back, as the other tools (and a fab) will
+            problems += check_gerber(src, dst, panel, added, cut if mil else ())
+    print('%d x %d panel, %.3f x %.3f in, %d files in %s' % (
+        args.cols, args.rows, panel.width, panel.height, len(files), args.outdir))
+    for p in problems:
+        print(p)
+    if problems:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
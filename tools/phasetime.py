@@ -0,0 +1,102 @@
+"""
+Phase timing for the pinout generators.
+
+A phase is a named block of work, timed with
+
+    with phasetime.phase('png decode'):
+        ...
+
+Wall-clock and CPU time are accumulated per name, along with the number of
+times the phase ran, so a phase can be entered many times (eg once per
+label).  count_sites() wraps a function so each call is timed under the
+line it was called from, which splits label drawing by call site.
+
+Timing a phase costs two clock reads each for wall and CPU time, so it is
+always on; the report is only printed or saved when asked for.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+
+class Timings:
+    def __init__(self):
+        # name -> [wall seconds, cpu seconds, calls], in first-seen order
+        self.phases = {}
+
+    def add(self, name, wall, cpu):
+        p = self.phases.get(name)
+        if p is None:
+            self.phases[name] = [wall, cpu, 1]
+        else:
+            p[0] += wall
+            p[1] += cpu
+            p[2] += 1
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        c0 = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, time.process_time() - c0)
+
+    def count_sites(self, func, prefix):
+        # func, timed under "prefix file:line" of each caller
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            f = sys._getframe(1)
+            name = '%s %s:%d' % (prefix, os.path.basename(f.f_code.co_filename), f.f_lineno)
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def merge(self, d):
+        # add timings from as_dict(), eg sent back by a worker process
+        for name, t in d.items():
+            self.add(name, t['wall'], t['cpu'])
+            self.phases[name][2] += t['calls'] - 1
+
+    def clear(self):
+        self.phases.clear()
+
+    def as_dict(self):
+        return {name: {'wall': w, 'cpu': c, 'calls': n} for name, (w, c, n) in self.phases.items()}
+
+    def report(self, f=sys.stderr):
+        width = max([len(name) for name in self.phases] + [5])
+        print('%-*s %10s %10s %7s' % (width, 'phase', 'wall ms', 'cpu ms', 'calls'), file=f)
+        for name, (w, c, n) in sorted(self.phases.items(), key=lambda p: -p[1][0]):
+            print('%-*s %10.2f %10.2f %7d' % (width, name, 1e3 * w, 1e3 * c, n), file=f)
+
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+            f.write('\n')
+
+timings = Timings()
+
+def phase(name):
+    return timings.phase(name)
+
+@contextlib.contextmanager
+def profiled(filename):
+    # run the block under cProfile and dump the stats to filename, if given
+    if not filename:
+        yield
+        return
+    import cProfile
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        prof.dump_stats(filename)
@@ -0,0 +1,104 @@
+"""
+Derive the header-pin to MCU-pin mapping by tracing nets in the Eagle files.
+
+Given the header pins of a board as (connector part, pin) pairs, each one is
+traced through the schematic netlist to a pin of the MCU.  The trace passes
+through zero-ohm links, so a header that is strapped to the MCU with a 0R
+resistor still resolves.  If the board file is given as well, the same
+trace is done over the board signals (connector pad to MCU pad) and the two
+must agree.
+
+The derived table is cached keyed on the Eagle files and the header list.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import re
+
+import cache
+import eagle
+
+# only GPIO pins of the MCU count; supply pins (VDD, VSS) are not mapped
+_io_re = re.compile(r'P[A-K]\d+$')
+
+class PinMapError(Exception):
+    pass
+
+def _is_link(sch, part):
+    # a two-pin part with a value of 0 (ohms) just joins its two nets
+    p = sch.parts.get(part)
+    return p is not None and p[3] == '0' and len(sch.part_nets(part)) == 2
+
+def trace_schematic(sch, part, pin, mcu):
+    # returns (net, mcu pin), or (net, None) if the net reaches no mcu GPIO
+    start = sch.pin_net.get((part, pin))
+    if start is None:
+        return (None, None)
+    seen = {start}
+    todo = [start]
+    while todo:
+        net = todo.pop()
+        for p, q in sch.net_pins(net):
+            if p == mcu and _io_re.match(q):
+                return (start, q)
+            if _is_link(sch, p):
+                for other in sch.part_nets(p).values():
+                    if other not in seen:
+                        seen.add(other)
+                        todo.append(other)
+    return (start, None)
+
+def trace_board(brd, sch, part, pin, mcu):
+    # same as trace_schematic, but following board signals from pads; the
+    # schematic is only used to turn pin names into pad names and back
+    pads = sch.part_pads(part).get(pin, (pin,))
+    signal = brd.pad_signal.get((part, pads[0]))
+    if signal is None:
+        return (None, None)
+    pad_pin = {pad: q for q, pads in sch.part_pads(mcu).items() for pad in pads}
+    for element, pad in brd.signal_pads(signal):
+        if element == mcu and _io_re.match(pad_pin.get(pad, '')):
+            return (signal, pad_pin[pad])
+    return (signal, None)
+
+def derive(sch_file, headers, brd_file=None, mcu='IC1'):
+    # headers is a sequence of (part, pin); returns {(part, pin): (net, mcu pin)}
+    files = [sch_file] + ([brd_file] if brd_file else [])
+    key = cache.hash_bytes(cache.hash_files(*files).encode(), repr((list(headers), mcu)).encode())
+    table = cache.load('pinmap', key)
+    if table is not None:
+        return table
+
+    sch = eagle.load(sch_file)
+    brd = eagle.load(brd_file) if brd_file else None
+    table = {}
+    for part, pin in headers:
+        net, cpu = trace_schematic(sch, part, pin, mcu)
+        if brd is not None:
+            signal, cpu_brd = trace_board(brd, sch, part, pin, mcu)
+            if cpu_brd != cpu:
+                raise PinMapError('%s.%s: schematic gives %s, board gives %s' % (part, pin, cpu, cpu_brd))
+        table[(part, pin)] = (net, cpu)
+    cache.store('pinmap', key, table)
+    return table
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Trace header pins to MCU pins in Eagle files.')
+    cmd_parser.add_argument('sch', help='Eagle schematic')
+    cmd_parser.add_argument('--brd', help='Eagle board, to cross-check the trace')
+    cmd_parser.add_argument('--mcu', default='IC1', help='name of the MCU part')
+    cmd_parser.add_argument('header', nargs='+', help='connector parts to trace, eg JLEFT')
+    args = cmd_parser.parse_args()
+
+    sch = eagle.load(args.sch)
+    headers = []
+    for part in args.header:
+        pins = sorted(sch.part_nets(part), key=lambda q: (len(q), q))
+        headers.extend((part, q) for q in pins)
+    for (part, pin), (net, cpu) in derive(args.sch, headers, args.brd, args.mcu).items():
+        print('%s.%s %s %s' % (part, pin, net or '-', cpu or '-'))
+
+if __name__ == '__main__':
+    main()
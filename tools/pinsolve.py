@@ -0,0 +1,305 @@
+"""
+Peripheral pin-assignment solver for the pyboard headers.
+
+Given a set of requested peripherals, eg
+
+    pinsolve.py uart=2 spi=1 pwm=4 adc=3
+
+find assignments of header pins (X1.., Y1.., P2..) such that no pin is
+used twice, no peripheral instance is used twice and, for pwm, every
+channel is on a different timer.  Every candidate placement of a
+peripheral instance is encoded as an integer bitset of header pins, so
+conflicts are a single AND and pruning uses the OR of what is left.
+
+The search either finds the cheapest solutions (by how versatile the pins
+they use are, branch-and-bound, with the bound recomputed from the options
+still free at each node), or the first N in search order, or reports that
+no assignment exists.  Large requests are cut off after a number of search
+nodes (--max-nodes), and then the best solutions found so far are shown.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import heapq
+import importlib.util
+import itertools
+import os
+import re
+import sys
+
+import afdb
+
+top_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# signals needed by one instance of each kind of peripheral: instance name
+# pattern, and the signal suffixes that must all be routed
+kinds = {
+    'uart': (r'U(S)?ART\d$', ('TX', 'RX')),
+    'spi': (r'SPI\d$', ('SCK', 'MISO', 'MOSI')),
+    'i2c': (r'I2C\d$', ('SCL', 'SDA')),
+    'can': (r'CAN\d$', ('RX', 'TX')),
+    'pwm': (r'TIM\d+$', None),
+    'adc': (None, None),
+    'dac': (None, None),
+}
+
+# analog functions that are not in the AF table
+dac_pins = {'DAC_OUT1': 'A4', 'DAC_OUT2': 'A5'}
+
+_ch_re = re.compile(r'CH\d$')
+
+def load_pins(board_dir):
+    # the pin table of a board, without importing its (cairo) generator
+    spec = importlib.util.spec_from_file_location('pins', os.path.join(board_dir, 'pins.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod.pin_info
+
+class Problem:
+    def __init__(self, db, pin_info):
+        self.names = [p.name for p in pin_info if p.cpu is not None]
+        self.bit = {}
+        for i, p in enumerate(p for p in pin_info if p.cpu is not None):
+            self.bit[p.cpu] = 1 << i
+        self.db = db
+        # cost of a pin is how many peripherals could use it, so the ranking
+        # prefers leaving versatile pins free
+        self.cost = [0] * len(self.names)
+        for cpu, b in self.bit.items():
+            periphs = set(afdb.peripheral(s) for _, s in db.pin_afs(cpu))
+            self.cost[b.bit_length() - 1] = len(periphs) + len(db.extra.get(cpu, ()))
+
+    def _pins(self, signal):
+        # bitset of each header pin that can carry the signal
+        return [self.bit[pin] for pin, _ in self.db.pins_for(signal) if pin in self.bit]
+
+    def options(self, kind):
+        # list of (mask, instance) for every placement of one peripheral
+        pattern, signals = kinds[kind]
+        opts = []
+        if kind == 'adc':
+            for cpu, b in self.bit.items():
+                if any(s.startswith('ADC') for s in self.db.extra.get(cpu, ())):
+                    opts.append((b, cpu))
+        elif kind == 'dac':
+            for sig, cpu in sorted(dac_pins.items()):
+                if cpu in self.bit:
+                    opts.append((self.bit[cpu], sig))
+        elif kind == 'pwm':
+            for inst in sorted(self.db.by_peripheral):
+                if not re.match(pattern, inst):
+                    continue
+                for pin, af, sig in self.db.by_peripheral[inst]:
+                    if pin in self.bit and _ch_re.search(sig):
+                        opts.append((self.bit[pin], inst))
+        else:
+            for inst in sorted(self.db.by_peripheral):
+                if not re.match(pattern, inst):
+                    continue
+                choices = [self._pins('%s_%s' % (inst, s)) for s in signals]
+                for combo in itertools.product(*choices):
+                    mask = 0
+                    for b in combo:
+                        mask |= b
+                    if bin(mask).count('1') == len(combo):
+                        opts.append((mask, inst))
+        # remove duplicates (a signal in two AF slots of the same pin)
+        return sorted(set(opts), key=lambda o: (self.mask_cost(o[0]), o[1], o[0]))
+
+    def mask_cost(self, mask):
+        c = 0
+        while mask:
+            low = mask & -mask
+            c += self.cost[low.bit_length() - 1]
+            mask ^= low
+        return c
+
+    def pin_names(self, mask):
+        return [self.names[i] for i in range(len(self.names)) if mask >> i & 1]
+
+def solve(problem, demands, limit=None, best=None, max_nodes=None):
+    # demands is {kind: count}; returns (solutions, complete), solutions
+    # being a list of (cost, solution), cheapest first, where a solution is
+    # a list of (kind, instance, mask).  With limit the search stops after
+    # that many solutions; with best only the best cheapest solutions are
+    # kept, and branches that cannot beat them are cut.  With max_nodes the
+    # search gives up after visiting that many nodes, returning what it has
+    # found so far with complete False
+    slots = []
+    for kind, count in demands.items():
+        opts = [(mask, inst, problem.mask_cost(mask)) for mask, inst in problem.options(kind)]
+        for k in range(count):
+            slots.append((kind, k, opts))
+    # most constrained kind first
+    slots.sort(key=lambda s: (len(s[2]), s[0], s[1]))
+    n = len(slots)
+    # lower bound on the cost of the slots from i on, from the cheapest
+    # option of each; cheap enough to cut the loop over options
+    lower = [0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        opts = slots[i][2]
+        lower[i] = lower[i + 1] + (opts[0][2] if opts else 0)
+
+    results = []
+    chosen = [None] * n
+    nodes = [0]
+
+    def bound(i, used, instances, start):
+        # None if the slots from i on cannot be filled, else a lower bound
+        # on their cost: the m slots left of a kind need m free options on
+        # different pins and instances, so they cost at least the m
+        # cheapest free options with distinct masks.  Slot i, if it is not
+        # the first of its kind, only takes options from start on.  Finally
+        # the union of the free options must have a pin per slot
+        free = 0
+        total = 0
+        j = i
+        while j < n:
+            kind, _, opts = slots[j]
+            m = 1
+            while j + m < n and slots[j + m][0] == kind:
+                m += 1
+            ok = 0
+            masks = set()
+            insts = set()
+            costs = 0
+            for mask, inst, c in opts[start if j == i else 0:]:
+                if mask & used or (kind, inst) in instances:
+                    continue
+                ok |= mask
+                insts.add(inst)
+                if mask not in masks and len(masks) < m:
+                    masks.add(mask)
+                    costs += c
+            if len(masks) < m or len(insts) < m:
+                return None
+            free |= ok
+            total += costs
+            j += m
+        if bin(free).count('1') < n - i:
+            return None
+        return total
+
+    def search(i, used, instances, start, cost):
+        # returns True when the search should stop
+        nodes[0] += 1
+        if max_nodes is not None and nodes[0] > max_nodes:
+            return True
+        if i == n:
+            sol = [(slots[k][0], chosen[k][1], chosen[k][0]) for k in range(n)]
+            if best is None:
+                results.append((cost, sol))
+            else:
+                heapq.heappush(results, (-cost, len(results), sol))
+                if len(results) > best:
+                    heapq.heappop(results)
+            return limit is not None and len(results) >= limit
+        kind, k, opts = slots[i]
+        # identical slots take options in increasing order, so each set of
+        # choices is visited once
+        for j in range(start if k > 0 else 0, len(opts)):
+            mask, inst, c = opts[j]
+            full = best is not None and len(results) == best
+            if full and cost + c + lower[i + 1] >= -results[0][0]:
+                # options are sorted by cost, so the rest are no better
+                break
+            if mask & used or (kind, inst) in instances:
+                continue
+            # an instance is used at most once per kind, so two uart slots
+            # get different UARTs and pwm slots get different timers
+            inst_used = instances | {(kind, inst)}
+            nxt = j + 1 if i + 1 < n and slots[i + 1][0] == kind else 0
+            rest = bound(i + 1, used | mask, inst_used, nxt)
+            if rest is None or full and cost + c + rest >= -results[0][0]:
+                continue
+            chosen[i] = (mask, inst)
+            if search(i + 1, used | mask, inst_used, nxt, cost + c):
+                return True
+        return False
+
+    search(0, 0, frozenset(), 0, 0)
+    complete = max_nodes is None or nodes[0] <= max_nodes
+    if best is not None:
+        results = [(-c, sol) for c, _, sol in results]
+    results.sort(key=lambda r: r[0])
+    return results, complete
+
+def explain(problem, demands, max_nodes=None):
+    # reasons why the demands cannot be met: first each kind on its own,
+    # then the pin count, then which single request conflicts with the rest;
+    # each of those searches gets the same node budget as the main one
+    reasons = []
+    need = 0
+    for kind, count in demands.items():
+        opts = problem.options(kind)
+        insts = set(inst for _, inst in opts)
+        if len(insts) < count:
+            reasons.append('%s: %d requested, only %d usable on the headers (%s)' % (
+                kind, count, len(insts), ', '.join(sorted(insts)) or 'none'))
+        if opts:
+            need += count * min(bin(mask).count('1') for mask, _ in opts)
+    if reasons:
+        return reasons
+    if need > len(problem.names):
+        return ['%d pins needed, the headers have %d' % (need, len(problem.names))]
+    for kind in demands:
+        rest = dict(demands)
+        rest[kind] -= 1
+        solutions, complete = solve(problem, rest, limit=1, max_nodes=max_nodes)
+        if solutions:
+            reasons.append('possible with one %s fewer' % kind)
+        elif not complete:
+            reasons.append('with one %s fewer: search limit reached after %d nodes' % (kind, max_nodes))
+    return reasons or ['the requested peripherals conflict over the header pins']
+
+def parse_demands(args):
+    demands = {}
+    for a in args:
+        m = re.match(r'(?:(\d+)[x*])?([a-z0-9]+)(?:=(\d+))?$', a.lower())
+        if m is None or m.group(2) not in kinds:
+            raise ValueError('bad request %r; use eg uart=2 or 2xuart, kinds: %s' % (a, ', '.join(kinds)))
+        demands[m.group(2)] = demands.get(m.group(2), 0) + int(m.group(1) or m.group(3) or 1)
+    return demands
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Assign pyboard header pins to peripherals.')
+    cmd_parser.add_argument('request', nargs='+', help='peripherals, eg uart=2 spi=1 pwm=4 adc=3')
+    cmd_parser.add_argument('-n', '--first', type=int, default=None, help='stop after the first N solutions found, without ranking the whole space')
+    cmd_parser.add_argument('--top', type=int, default=10, help='find the N cheapest solutions (default 10)')
+    cmd_parser.add_argument('--max-nodes', type=int, default=1000000, help='give up the search after this many nodes, 0 for no limit (default 1000000)')
+    cmd_parser.add_argument('--board', default=os.path.join(top_dir, 'pinout', 'pybv10b'), help='board directory with pins.py')
+    cmd_parser.add_argument('--af', default=None, help='AF table (default: stm32f4xx_af.csv in the board directory)')
+    args = cmd_parser.parse_args()
+
+    try:
+        demands = parse_demands(args.request)
+    except ValueError as er:
+        cmd_parser.error(str(er))
+    db = afdb.load(args.af or os.path.join(args.board, 'stm32f4xx_af.csv'))
+    problem = Problem(db, load_pins(args.board))
+
+    solutions, complete = solve(problem, demands, limit=args.first, best=None if args.first else args.top, max_nodes=args.max_nodes or None)
+    if not solutions and not complete:
+        print('no assignment found in %d search nodes' % args.max_nodes)
+        sys.exit(1)
+    if not solutions:
+        print('no assignment exists')
+        for r in explain(problem, demands, args.max_nodes or None):
+            print('  ' + r)
+        sys.exit(1)
+
+    if not complete:
+        print('search stopped after %d nodes; best %d solutions found so far' % (args.max_nodes, len(solutions)))
+    elif args.first:
+        print('first %d solutions found' % len(solutions))
+    else:
+        print('%d cheapest solutions' % len(solutions))
+    for rank, (cost, sol) in enumerate(solutions, 1):
+        print('#%d cost %d' % (rank, cost))
+        for kind, inst, mask in sorted(sol):
+            print('  %-4s %-8s %s' % (kind, inst, ' '.join(problem.pin_names(mask))))
+
+if __name__ == '__main__':
+    main()
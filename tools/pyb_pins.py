@@ -0,0 +1,148 @@
+"""
+Query the pins of a pyboard and what they can do, without rendering.
+
+    python pyb_pins.py X7              what X7 (CPU pin A6) can do
+    python pyb_pins.py X7 Y1 A13       several pins, board or CPU names
+    python pyb_pins.py --signal UART4_TX
+    python pyb_pins.py --signal TIM8   every signal of a peripheral
+    python pyb_pins.py --json X7       machine-readable output
+
+The answers come from a pin table made from the board's pins.py and the
+AF CSV: board pin -> (label, CPU pin), CPU pin -> AFs and other signals,
+and signal -> pins.  The table is built once and kept in the on-disk cache
+keyed on the content of those files; after that a query only hashes the
+two files and unpickles a few dicts.  Building the table uses afdb (and so
+NumPy), but a query imports neither that nor cairo.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import os
+import sys
+
+import cache
+
+top_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# boards with a pin table: board -> AF CSV file name
+boards = {'pybv10b': 'stm32f4xx_af.csv'}
+
+def sources(board):
+    board_dir = os.path.join(top_dir, 'pinout', board)
+    return os.path.join(board_dir, 'pins.py'), os.path.join(board_dir, boards[board])
+
+def build_table(board):
+    # the pin table as plain dicts, from pins.py and the AF CSV
+    import importlib.util
+    import afdb
+    pins_file, csv_file = sources(board)
+    spec = importlib.util.spec_from_file_location('%s_pins' % board, pins_file)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    db = afdb.load(csv_file)
+    table = {
+        # board pin -> (label, cpu pin or None), in header order
+        'board': {p.name: (p.label, p.cpu) for p in mod.pin_info},
+        # cpu pin -> [(af, signal)], with af None for non-AF functions
+        'cpu': {},
+        # signal -> [(cpu pin, af)]
+        'signal': {},
+    }
+    for pin in sorted(db.pins()):
+        table['cpu'][pin] = db.pin_afs(pin) + [(None, sig) for sig in db.extra.get(pin, ())]
+    for sig, where in db.by_signal.items():
+        table['signal'][sig] = sorted(where, key=lambda w: (w[0], -1 if w[1] is None else w[1]))
+    # cpu pin -> board pin, for the reverse lookups
+    table['header'] = {cpu: name for name, (label, cpu) in table['board'].items() if cpu}
+    return table
+
+def load_table(board):
+    key = cache.hash_files(*sources(board))
+    table = cache.load('pintable-%s' % board, key)
+    if table is None:
+        table = build_table(board)
+        cache.store('pintable-%s' % board, key, table)
+    return table
+
+def find_pin(table, name):
+    # (board pin or None, cpu pin or None) for a board name (X7), cpu name
+    # (A6) or port name (PA6); raises KeyError if it is none of those
+    name = name.upper()
+    if name in table['board']:
+        return name, table['board'][name][1]
+    cpu = name[1:] if name.startswith('P') and name[1:] in table['cpu'] else name
+    if cpu in table['cpu']:
+        return table['header'].get(cpu), cpu
+    raise KeyError(name)
+
+def pin_info(table, name):
+    board_pin, cpu = find_pin(table, name)
+    label = table['board'][board_pin][0] if board_pin else None
+    return {'pin': board_pin, 'label': label, 'cpu': cpu,
+        'functions': [{'af': af, 'signal': sig} for af, sig in table['cpu'].get(cpu, [])]}
+
+def signal_pins(table, signal, all_pins=False):
+    # [(signal, board pin, cpu pin, af)] for a signal, or for every signal
+    # of a peripheral (eg TIM8); only header pins unless all_pins
+    signal = signal.upper()
+    if signal in table['signal']:
+        signals = [signal]
+    else:
+        signals = sorted(s for s in table['signal'] if s.split('_', 1)[0] == signal)
+    out = []
+    for sig in signals:
+        for cpu, af in table['signal'][sig]:
+            board_pin = table['header'].get(cpu)
+            if board_pin or all_pins:
+                out.append((sig, board_pin, cpu, af))
+    return out
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Query pyboard pins and their functions.')
+    cmd_parser.add_argument('pins', nargs='*', help='board pins (X7) or CPU pins (A6, PA6)')
+    cmd_parser.add_argument('-s', '--signal', action='append', default=[], help='list the pins that can carry a signal or peripheral')
+    cmd_parser.add_argument('-a', '--all', action='store_true', help='include CPU pins that are not on the headers')
+    cmd_parser.add_argument('--board', default='pybv10b', choices=sorted(boards), help='board (default pybv10b)')
+    cmd_parser.add_argument('--json', action='store_true', help='print JSON')
+    args = cmd_parser.parse_args()
+    if not args.pins and not args.signal:
+        cmd_parser.error('give pins or --signal')
+
+    table = load_table(args.board)
+    result = {'pins': [], 'signals': {}}
+    status = 0
+    for name in args.pins:
+        try:
+            result['pins'].append(pin_info(table, name))
+        except KeyError:
+            print('unknown pin %s' % name, file=sys.stderr)
+            status = 1
+    for sig in args.signal:
+        found = signal_pins(table, sig, args.all)
+        if not found:
+            print('no pin can carry %s' % sig, file=sys.stderr)
+            status = 1
+        result['signals'][sig] = [{'signal': s, 'pin': p, 'cpu': c, 'af': af} for s, p, c, af in found]
+
+    if args.json:
+        import json
+        json.dump(result, sys.stdout, indent=1)
+        print()
+        sys.exit(status)
+
+    for info in result['pins']:
+        name = info['pin'] or '-'
+        if info['label'] and info['label'] != info['pin']:
+            name += ' (%s)' % info['label']
+        print('%s  CPU %s' % (name, info['cpu'] or 'none'))
+        for f in info['functions']:
+            print('    %-5s %s' % ('' if f['af'] is None else 'AF%d' % f['af'], f['signal']))
+    for sig, found in result['signals'].items():
+        for f in found:
+            print('%-12s %-4s %-4s %s' % (f['signal'], f['pin'] or '-', f['cpu'], '' if f['af'] is None else 'AF%d' % f['af']))
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Render the Gerber layers in gerber/ to PNG at a chosen DPI.
+
+The image is split into tiles that are rendered with cairo in a pool of
+worker processes.  Tiles are collected one band (row of tiles) at a time
+and streamed into the PNG encoder, so memory use is bounded by the tile
+size rather than by the size of the output image.
+
+Either a single layer can be rendered, or the layers can be composited
+into a view of the front or back of the board.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import math
+import multiprocessing
+import struct
+import zlib
+
+import cairo
+import numpy as np
+
+import gerber
+
+# layer name is the file suffix of the Eagle CAM output
+layer_names = ('top', 'bot', 'smt', 'smb', 'sst', 'mil')
+
+# layers of each composite view, bottom first, with the colour to draw them
+views = {
+    'front': (
+        ('top', (0.20, 0.50, 0.20)),
+        ('smt', (0.85, 0.70, 0.30)),
+        ('sst', (1.00, 1.00, 1.00)),
+    ),
+    'back': (
+        ('bot', (0.20, 0.50, 0.20)),
+        ('smb', (0.85, 0.70, 0.30)),
+    ),
+}
+substrate_rgb = (0.05, 0.30, 0.10)
+background_rgb = (1.0, 1.0, 1.0)
+layer_rgb = (1.0, 1.0, 1.0)
+margin = 0.05 # inches around the board outline
+
+# layers loaded by each worker process
+_layers = {}
+
+def _init_worker(prefix):
+    for name in layer_names:
+        _layers[name] = gerber.read('%s.%s' % (prefix, name))
+
+def board_extent(layers):
+    # the board outline is the bounding box of the milling layer
+    xmin, ymin, xmax, ymax = layers['mil'].bounds()
+    return (xmin - margin, ymin - margin, xmax + margin, ymax + margin)
+
+def _aperture_path(cr, layer, dcode, x, y):
+    template, params = layer.apertures[dcode]
+    if template == 'C':
+        cr.move_to(x + 0.5 * params[0], y)
+        cr.arc(x, y, 0.5 * params[0], 0, 2 * math.pi)
+    elif template == 'R':
+        w, h = params[0], params[1]
+        cr.rectangle(x - 0.5 * w, y - 0.5 * h, w, h)
+    elif template == 'O':
+        w, h = params[0], params[1]
+        r = 0.5 * min(w, h)
+        dx, dy = 0.5 * w - r, 0.5 * h - r
+        cr.new_sub_path()
+        cr.arc(x + dx, y + dy, r, 0, 0.5 * math.pi)
+        cr.arc(x - dx, y + dy, r, 0.5 * math.pi, math.pi)
+        cr.arc(x - dx, y - dy, r, math.pi, 1.5 * math.pi)
+        cr.arc(x + dx, y - dy, r, 1.5 * math.pi, 2 * math.pi)
+        cr.close_path()
+    elif template in layer.macros:
+        for code, p in gerber.eval_macro(layer.macros[template], params):
+            if code == 1:
+                # circle: exposure, diameter, x, y
+                cr.move_to(x + p[2] + 0.5 * p[1], y + p[3])
+                cr.arc(x + p[2], y + p[3], 0.5 * p[1], 0, 2 * math.pi)
+            elif code == 5:
+                # regular polygon: exposure, vertices, x, y, diameter, rotation
+                n = int(p[1])
+                r = 0.5 * p[4]
+                rot = math.radians(p[5])
+                cr.new_sub_path()
+                for i in range(n):
+                    a = rot + 2 * math.pi * i / n
+                    cr.line_to(x + p[2] + r * math.cos(a), y + p[3] + r * math.sin(a))
+                cr.close_path()
+            elif code in (20, 21):
+                # vector line / centre line: drawn as their bounding rectangle
+                if code == 20:
+                    w = p[1]
+                    x0, y0, x1, y1 = p[2], p[3], p[4], p[5]
+                    cr.rectangle(x + min(x0, x1), y + min(y0, y1) - 0.5 * w, abs(x1 - x0), abs(y1 - y0) + w)
+                else:
+                    cr.rectangle(x + p[3] - 0.5 * p[1], y + p[4] - 0.5 * p[2], p[1], p[2])
+    else:
+        raise gerber.GerberError('cannot render aperture %s' % template)
+
+def _draw_ops(cr, layer, visible):
+    # tracks are stroked per aperture so that cairo sees one path per
+    # stroke width
+    for dcode in np.unique(layer.aperture[visible]):
+        sel = visible & (layer.aperture == dcode)
+        draws = np.nonzero(sel & (layer.op == gerber.OP_DRAW))[0]
+        if len(draws):
+            width = layer.aperture_size(dcode)
+            if width > 0:
+                for i in draws:
+                    cr.move_to(layer.x0[i], layer.y0[i])
+                    cr.line_to(layer.x1[i], layer.y1[i])
+                cr.set_line_width(width)
+                cr.stroke()
+        flashes = np.nonzero(sel & (layer.op == gerber.OP_FLASH))[0]
+        if len(flashes):
+            for i in flashes:
+                _aperture_path(cr, layer, dcode, layer.x1[i], layer.y1[i])
+            cr.fill()
+
+def draw_layer(cr, layer, rect):
+    # draw the operations of the layer that touch rect (in board units),
+    # using the current source
+    xmin, ymin, xmax, ymax = rect
+    pad = max([layer.aperture_size(d) for d in layer.apertures] + [0.0])
+    lo_x = np.minimum(layer.x0, layer.x1)
+    hi_x = np.maximum(layer.x0, layer.x1)
+    lo_y = np.minimum(layer.y0, layer.y1)
+    hi_y = np.maximum(layer.y0, layer.y1)
+    visible = (layer.op != gerber.OP_MOVE) & (hi_x >= xmin - pad) & (lo_x <= xmax + pad) & (hi_y >= ymin - pad) & (lo_y <= ymax + pad)
+
+    cr.set_line_cap(cairo.LINE_CAP_ROUND)
+    cr.set_line_join(cairo.LINE_JOIN_ROUND)
+    if layer.polarity.all():
+        _draw_ops(cr, layer, visible)
+        return
+
+    # the layer has clear (%LPC) regions: draw it into a group of its own,
+    # erasing clear regions from what was drawn before them, so they cut
+    # this layer but not the layers underneath.  Operations are drawn in
+    # runs of one polarity to keep their order.
+    cr.save()
+    cr.push_group()
+    edges = np.nonzero(np.diff(layer.polarity.astype(np.int8)))[0] + 1
+    bounds = [0] + list(edges) + [len(layer.polarity)]
+    index = np.arange(len(layer.polarity))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if layer.polarity[start]:
+            cr.set_operator(cairo.OPERATOR_OVER)
+        else:
+            cr.set_operator(cairo.OPERATOR_CLEAR)
+        _draw_ops(cr, layer, visible & (index >= start) & (index < end))
+    cr.pop_group_to_source()
+    cr.set_operator(cairo.OPERATOR_OVER)
+    cr.paint()
+    cr.restore()
+
+def render_tile(task):
+    view, dpi, extent, tx, ty, tw, th = task
+    xmin, ymin, xmax, ymax = extent
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, tw, th)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(*background_rgb)
+    cr.paint()
+
+    # map board coordinates (inches, y up) to the pixels of this tile
+    cr.translate(-tx, -ty)
+    if view == 'back':
+        cr.scale(-dpi, -dpi)
+        cr.translate(-xmax, -ymax)
+    else:
+        cr.scale(dpi, -dpi)
+        cr.translate(-xmin, -ymax)
+
+    # board area covered by this tile, to cull operations outside it
+    x0, y0 = cr.device_to_user(tx, ty)
+    x1, y1 = cr.device_to_user(tx + tw, ty + th)
+    rect = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+    if view in views:
+        bxmin, bymin, bxmax, bymax = board_extent(_layers)
+        cr.set_source_rgb(*substrate_rgb)
+        cr.rectangle(bxmin + margin, bymin + margin, bxmax - bxmin - 2 * margin, bymax - bymin - 2 * margin)
+        cr.fill()
+        for name, rgb in views[view]:
+            cr.set_source_rgb(*rgb)
+            draw_layer(cr, _layers[name], rect)
+    else:
+        cr.set_source_rgb(0, 0, 0)
+        cr.paint()
+        cr.set_source_rgb(*layer_rgb)
+        draw_layer(cr, _layers[view], rect)
+
+    surface.flush()
+    # cairo RGB24 is stored as native-endian 32-bit words; convert to RGB bytes
+    data = np.ndarray((th, surface.get_stride() // 4), dtype='<u4', buffer=surface.get_data())[:, :tw]
+    rgb = np.empty((th, tw, 3), dtype=np.uint8)
+    rgb[..., 0] = data >> 16
+    rgb[..., 1] = data >> 8
+    rgb[..., 2] = data
+    surface.finish()
+    return rgb.tobytes()
+
+class PNGWriter:
+    # minimal streaming writer for 8-bit RGB PNG files
+    def __init__(self, f, width, height):
+        self.f = f
+        self.width = width
+        self.comp = zlib.compressobj(6)
+        f.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, tag, data):
+        self.f.write(struct.pack('>I', len(data)))
+        self.f.write(tag)
+        self.f.write(data)
+        self.f.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    def write_rows(self, rows):
+        # rows is the bytes of one or more complete rows
+        stride = 3 * self.width
+        out = []
+        for i in range(0, len(rows), stride):
+            out.append(b'\x00')
+            out.append(rows[i:i + stride])
+        data = self.comp.compress(b''.join(out))
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.comp.flush())
+        self._chunk(b'IEND', b'')
+
+def render(prefix, view, dpi, filename, tile=512, jobs=None):
+    _init_worker(prefix)
+    extent = board_extent(_layers)
+    width = int(math.ceil((extent[2] - extent[0]) * dpi))
+    height = int(math.ceil((extent[3] - extent[1]) * dpi))
+
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(prefix,)) as pool, open(filename, 'wb') as f:
+        png = PNGWriter(f, width, height)
+        for ty in range(0, height, tile):
+            th = min(tile, height - ty)
+            tasks = [(view, dpi, extent, tx, ty, min(tile, width - tx), th) for tx in range(0, width, tile)]
+            tiles = pool.map(render_tile, tasks)
+            # stitch the tiles of the band together side by side
+            band = np.concatenate([np.frombuffer(data, np.uint8).reshape(th, -1) for data in tiles], axis=1)
+            png.write_rows(band.tobytes())
+        png.close()
+    return width, height
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Render Gerber layers to PNG.')
+    cmd_parser.add_argument('view', choices=layer_names + tuple(views), help='single layer, or composite view of the board')
+    cmd_parser.add_argument('-p', '--prefix', default='../gerber/pybv3', help='path and basename of the Gerber files')
+    cmd_parser.add_argument('-d', '--dpi', type=float, default=600, help='resolution in dots per inch')
+    cmd_parser.add_argument('-t', '--tile', type=int, default=512, help='tile size in pixels')
+    cmd_parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of cores)')
+    cmd_parser.add_argument('-o', '--output', default=None, help='output PNG file (default: <view>.png)')
+    args = cmd_parser.parse_args()
+
+    filename = args.output or '%s.png' % args.view
+    w, h = render(args.prefix, args.view, args.dpi, filename, args.tile, args.jobs)
+    print('wrote %s, %dx%d' % (filename, w, h))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Long-lived render server for the pinout generators.
+
+The server imports the pybv10b and pybv3 generators once, so cairo, the
+decoded PNG assets, the static background layers and the AF database stay
+in memory between requests.  Rendered images are kept in an LRU cache
+bounded by total size; identical requests that arrive while a render is in
+progress wait for that render instead of starting another.
+
+The protocol is one JSON request per line, eg
+
+    {"board": "pybv10b", "highlight": ["X9", "X10"], "width": 1200, "format": "svg"}
+
+answered by one JSON header line, then the image bytes:
+
+    {"ok": true, "size": 123456, "cached": false}
+
+or {"ok": false, "error": "..."} with no body.  Listen on localhost with
+--port (default 8742) or on a Unix socket with --unix.  The same file is
+also a client:
+
+    render_server.py serve --unix /tmp/pinout.sock
+    render_server.py get --unix /tmp/pinout.sock -o x9.svg pybv10b X9 X10
+
+Width (pixels, or points for SVG and PDF; at most 4000) and format (png,
+svg or pdf) are optional; the default is the generator's own size, as PNG.
+Highlight is a list of pin names (X9) or peripheral names (SPI(1), for
+all of its pins); an unknown name is an error.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import importlib.util
+import io
+import json
+import os
+import socket
+import stat
+import sys
+from collections import OrderedDict
+
+top_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_PORT = 8742
+
+# board -> logical size of its drawing
+boards = {'pybv10b': (2000, 1500), 'pybv3': (1600, 1150)}
+formats = ('png', 'svg', 'pdf')
+# largest width a client may ask for: a raster render and the static layer
+# it is drawn over are about 4 bytes per pixel each, so 4000 wide is some
+# 100 MB per render, and the generator keeps a few static layers
+MAX_WIDTH = 4000
+
+class ResultCache:
+    # LRU of rendered images, bounded by the total number of bytes
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.maxbytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.maxbytes:
+            _, old = self._entries.popitem(last=False)
+            self.size -= len(old)
+
+class Renderer:
+    # the generator modules, imported once; renders run one at a time on a
+    # single thread because the generators read assets relative to the
+    # current directory and share their layer caches
+    def __init__(self):
+        self.modules = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def _module(self, board):
+        mod = self.modules.get(board)
+        if mod is None:
+            board_dir = os.path.join(top_dir, 'pinout', board)
+            sys.path.insert(0, board_dir)
+            spec = importlib.util.spec_from_file_location('%s_pinout' % board, os.path.join(board_dir, 'pinout.py'))
+            mod = importlib.util.module_from_spec(spec)
+            os.chdir(board_dir)
+            spec.loader.exec_module(mod)
+            self.modules[board] = mod
+        return mod
+
+    def render(self, board, highlight, fmt, width):
+        # runs on the render thread; returns the image bytes
+        mod = self._module(board)
+        os.chdir(os.path.join(top_dir, 'pinout', board))
+        scale = 1.0 if width is None else width / boards[board][0]
+        out = io.BytesIO()
+        if board == 'pybv10b':
+            mod.make_pinout(out, None if highlight is None else frozenset(highlight), fmt, scale)
+        else:
+            mod.do_work(out, fmt, scale)
+        return out.getvalue()
+
+    def highlight_pins(self, board, names):
+        # runs on the render thread; the sorted pin names that names (pins
+        # or peripherals) stand for
+        mod = self._module(board)
+        pins = {pin.name for pin in mod.pin_info}
+        groups = mod.periph_groups()
+        out = set()
+        for name in names:
+            if name in pins:
+                out.add(name)
+            elif name in groups:
+                out.update(groups[name])
+            else:
+                raise ValueError('unknown pin or peripheral %r' % name)
+        return tuple(sorted(out))
+
+def parse_request(line):
+    # returns (board, highlight, format, width), with highlight a tuple of
+    # names, not yet checked against the board, or None
+    req = json.loads(line)
+    if not isinstance(req, dict):
+        raise ValueError('request must be a JSON object')
+    board = req.get('board', 'pybv10b')
+    if board not in boards:
+        raise ValueError('unknown board %r' % board)
+    highlight = req.get('highlight')
+    if highlight is not None:
+        if board != 'pybv10b':
+            raise ValueError('highlight is only supported for pybv10b')
+        if not isinstance(highlight, list) or not all(isinstance(p, str) for p in highlight):
+            raise ValueError('highlight must be a list of pin or peripheral names')
+        highlight = tuple(highlight)
+    fmt = req.get('format', 'png')
+    if fmt not in formats:
+        raise ValueError('unknown format %r' % fmt)
+    width = req.get('width')
+    if width is not None and not (isinstance(width, int) and not isinstance(width, bool) and 0 < width <= MAX_WIDTH):
+        raise ValueError('width must be an integer from 1 to %d' % MAX_WIDTH)
+    return board, highlight, fmt, width
+
+class Server:
+    def __init__(self, cache_bytes):
+        self.cache = ResultCache(cache_bytes)
+        self.renderer = Renderer()
+        # key -> future of a render in progress
+        self.pending = {}
+
+    async def resolve(self, key):
+        # the request with its highlight names turned into pins, so that
+        # requests for the same image share a cache entry
+        board, highlight, fmt, width = key
+        if highlight is not None:
+            loop = asyncio.get_running_loop()
+            highlight = await loop.run_in_executor(self.renderer.executor, self.renderer.highlight_pins, board, highlight)
+        return board, highlight, fmt, width
+
+    async def get(self, key):
+        # returns (data, cached)
+        data = self.cache.get(key)
+        if data is not None:
+            return data, True
+        fut = self.pending.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self.renderer.executor, self.renderer.render, *key)
+            self.pending[key] = fut
+            try:
+                data = await fut
+            finally:
+                del self.pending[key]
+            self.cache.put(key, data)
+            return data, False
+        return await fut, False
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    key = await self.resolve(parse_request(line))
+                    data, cached = await self.get(key)
+                except Exception as er:
+                    writer.write(json.dumps({'ok': False, 'error': str(er)}).encode() + b'\n')
+                else:
+                    writer.write(json.dumps({'ok': True, 'size': len(data), 'cached': cached}).encode() + b'\n')
+                    writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(args):
+    server = Server(args.cache_mb * 1024 * 1024)
+    if args.unix:
+        # a stale socket from an earlier run is removed, but nothing else
+        if os.path.exists(args.unix):
+            if not stat.S_ISSOCK(os.stat(args.unix).st_mode):
+                raise SystemExit('error: %s exists and is not a socket' % args.unix)
+            os.remove(args.unix)
+        srv = await asyncio.start_unix_server(server.handle, args.unix)
+        where = args.unix
+    else:
+        srv = await asyncio.start_server(server.handle, '127.0.0.1', args.port)
+        where = '127.0.0.1:%d' % args.port
+    # warm up, so the first request does not pay for imports
+    for board in boards:
+        await asyncio.get_running_loop().run_in_executor(server.renderer.executor, server.renderer._module, board)
+    print('serving on', where)
+    async with srv:
+        await srv.serve_forever()
+
+def request(req, port=DEFAULT_PORT, unix=None):
+    # client: send one request, return the image bytes or raise RuntimeError
+    if unix:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(unix)
+    else:
+        s = socket.create_connection(('127.0.0.1', port))
+    with s, s.makefile('rwb') as f:
+        f.write(json.dumps(req).encode() + b'\n')
+        f.flush()
+        header = json.loads(f.readline())
+        if not header['ok']:
+            raise RuntimeError(header['error'])
+        return f.read(header['size'])
+
+def main():
+    # the socket options are shared by both commands and given after them
+    socket_parser = argparse.ArgumentParser(add_help=False)
+    socket_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port on localhost (default %d)' % DEFAULT_PORT)
+    socket_parser.add_argument('--unix', metavar='PATH', help='listen on (or connect to) a Unix socket instead')
+    cmd_parser = argparse.ArgumentParser(description='Pinout render server.')
+    sub = cmd_parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('serve', parents=[socket_parser], help='run the server')
+    p.add_argument('--cache-mb', type=int, default=256, help='size of the result cache in MB')
+    p = sub.add_parser('get', parents=[socket_parser], help='request an image from a running server')
+    p.add_argument('board', choices=boards)
+    p.add_argument('highlight', nargs='*', help='pins to highlight (pybv10b)')
+    p.add_argument('-o', '--output', default='pinout.png', help='output file; its extension sets the format')
+    p.add_argument('--width', type=int, help='width in pixels (png) or points')
+    args = cmd_parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        req = {'board': args.board, 'format': os.path.splitext(args.output)[1][1:].lower() or 'png'}
+        if args.width:
+            req['width'] = args.width
+        if args.highlight:
+            req['highlight'] = args.highlight
+        try:
+            data = request(req, args.port, args.unix)
+        except (OSError, RuntimeError) as er:
+            print('error:', er, file=sys.stderr)
+            sys.exit(1)
+        with open(args.output, 'wb') as f:
+            f.write(data)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Uniform grid index over axis-aligned boxes (points are boxes of zero size).
+
+Used by the fabrication tools for nearest-neighbour and clearance queries,
+so that they cost roughly O(n) instead of checking all pairs.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import math
+
+import numpy as np
+
+class GridIndex:
+    def __init__(self, boxes, cell):
+        # boxes is an (n, 4) array of xmin, ymin, xmax, ymax
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.cell = float(cell)
+        self.cells = {}
+        n = len(self.boxes)
+        if n == 0:
+            return
+
+        # expand each box into the (cx, cy) cells it covers, then group the
+        # box indices by cell
+        c = np.floor(self.boxes / self.cell).astype(np.int64)
+        nx = c[:, 2] - c[:, 0] + 1
+        ny = c[:, 3] - c[:, 1] + 1
+        counts = nx * ny
+        idx = np.repeat(np.arange(n), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rnx = np.repeat(nx, counts)
+        cx = np.repeat(c[:, 0], counts) + k % rnx
+        cy = np.repeat(c[:, 1], counts) + k // rnx
+        order = np.lexsort((cy, cx))
+        cx, cy, idx = cx[order], cy[order], idx[order]
+        split = np.nonzero((np.diff(cx) != 0) | (np.diff(cy) != 0))[0] + 1
+        for group in np.split(np.arange(len(idx)), split):
+            self.cells[(int(cx[group[0]]), int(cy[group[0]]))] = idx[group]
+        self._cell_range = (int(cx.min()), int(cy.min()), int(cx.max()), int(cy.max()))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def query(self, xmin, ymin, xmax, ymax):
+        # indices of the boxes that may overlap the given rectangle
+        cx0, cy0 = math.floor(xmin / self.cell), math.floor(ymin / self.cell)
+        cx1, cy1 = math.floor(xmax / self.cell), math.floor(ymax / self.cell)
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                c = self.cells.get((cx, cy))
+                if c is not None:
+                    found.append(c)
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def distance(self, x, y, idx):
+        # distance from (x, y) to each of the given boxes
+        b = self.boxes[idx]
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0)
+        return np.hypot(dx, dy)
+
+    def nearest(self, x, y, exclude=None):
+        # (index, distance) of the box nearest to (x, y), searching rings of
+        # cells outwards until no closer box can exist; exclude is an
+        # optional boolean mask of boxes to skip; (None, inf) if none found
+        if not self.cells:
+            return (None, math.inf)
+        cx, cy = math.floor(x / self.cell), math.floor(y / self.cell)
+        best_i, best_d = None, math.inf
+        max_r = self._max_ring(cx, cy)
+        r = 0
+        while r <= max_r:
+            found = []
+            for dx in range(-r, r + 1):
+                for dy in range(-r, r + 1):
+                    if max(abs(dx), abs(dy)) != r:
+                        continue
+                    c = self.cells.get((cx + dx, cy + dy))
+                    if c is not None:
+                        found.append(c)
+            if found:
+                idx = np.unique(np.concatenate(found))
+                if exclude is not None:
+                    idx = idx[~exclude[idx]]
+                if len(idx):
+                    d = self.distance(x, y, idx)
+                    j = np.argmin(d)
+                    if d[j] < best_d:
+                        best_i, best_d = int(idx[j]), float(d[j])
+            # anything in ring r + 1 is at least r * cell away
+            if best_d <= r * self.cell:
+                break
+            r += 1
+        return (best_i, best_d)
+
+    def _max_ring(self, cx, cy):
+        # ring beyond which there are no more occupied cells
+        x0, y0, x1, y1 = self._cell_range
+        return max(cx - x0, x1 - cx, cy - y0, y1 - cy, 0)
+
+    def pairs(self, maxdist):
+        # candidate pairs (i, j), i < j, of boxes whose bounding boxes are
+        # within maxdist of each other; the caller does the exact test
+        ii = []
+        jj = []
+        for i, (x0, y0, x1, y1) in enumerate(self.boxes):
+            idx = self.query(x0 - maxdist, y0 - maxdist, x1 + maxdist, y1 + maxdist)
+            idx = idx[idx > i]
+            b = self.boxes[idx]
+            gap_x = np.maximum(b[:, 0] - x1, x0 - b[:, 2])
+            gap_y = np.maximum(b[:, 1] - y1, y0 - b[:, 3])
+            idx = idx[np.hypot(np.maximum(gap_x, 0), np.maximum(gap_y, 0)) <= maxdist]
+            ii.append(np.full(len(idx), i))
+            jj.append(idx)
+        if not ii:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(ii), np.concatenate(jj)
+
+def points(xy):
+    # boxes for an (n, 2) array of points
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    return np.hstack((xy, xy))
+
+def cell_size(boxes, per_cell=2):
+    # a cell size giving roughly per_cell boxes per cell over their extent
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    if len(boxes) == 0:
+        return 1.0
+    w = boxes[:, 2].max() - boxes[:, 0].min()
+    h = boxes[:, 3].max() - boxes[:, 1].min()
+    size = math.sqrt(max(w * h, 1e-12) * per_cell / len(boxes))
+    # cells should not be smaller than the typical box
+    return max(size, float(np.median(np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]))), 1e-6)
@@ -0,0 +1,68 @@
+"""
+Output surfaces for the pinout generators.
+
+The generators draw in fixed logical units (eg 2000x1500 for pybv10b).
+create() makes a PNG, SVG or PDF surface for that drawing at any scale:
+the scale is set as the cairo device scale, so the drawing code, including
+its identity_matrix() calls, is the same for every output.  Vector outputs
+are written as they are drawn, straight to a file or a file object.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import math
+import os
+import sys
+
+import cairo
+
+formats = ('png', 'svg', 'pdf')
+
+def format_for(filename, default='png'):
+    # output format from a file name extension
+    if isinstance(filename, str):
+        ext = os.path.splitext(filename)[1][1:].lower()
+        if ext in formats:
+            return ext
+    return default
+
+def open_target(filename):
+    # '-' is stdout; anything else is passed to cairo as it is
+    if filename == '-':
+        return sys.stdout.buffer
+    return filename
+
+def is_vector(surface):
+    return not isinstance(surface, cairo.ImageSurface)
+
+def create(fmt, target, width, height, scale=1.0):
+    # a surface for a width x height logical drawing, scaled by scale
+    if fmt == 'png':
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(math.ceil(width * scale)), int(math.ceil(height * scale)))
+    elif fmt == 'svg':
+        surface = cairo.SVGSurface(target, width * scale, height * scale)
+    elif fmt == 'pdf':
+        surface = cairo.PDFSurface(target, width * scale, height * scale)
+    else:
+        raise ValueError('unknown output format %r' % fmt)
+    surface.set_device_scale(scale, scale)
+    return surface
+
+def finish(surface, fmt, target):
+    # PNG is encoded at the end; vector surfaces have been writing all along
+    if fmt == 'png':
+        surface.write_to_png(target)
+    surface.finish()
+    if target is sys.stdout.buffer:
+        target.flush()
+
+def layer(vector, width, height, scale=1.0):
+    # an offscreen surface for a layer that is drawn once and painted into
+    # many outputs: a recording (so it stays vector) for vector outputs,
+    # otherwise an image at the output resolution
+    if vector:
+        return cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA, cairo.Rectangle(0, 0, width, height))
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(math.ceil(width * scale)), int(math.ceil(height * scale)))
+    surface.set_device_scale(scale, scale)
+    return surface
@@ -0,0 +1,88 @@
+"""
+Text layout cache for the pinout generators.
+
+Labels such as "GND", "VIN" and the TIMx_CHy strings are drawn many times
+over, and each time cairo has to shape the text again.  This caches the
+text extents and the glyph run for each (font face, font size, text), so a
+label is only shaped once, and is then drawn with show_glyphs.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+from collections import OrderedDict
+
+import cairo
+
+class TextCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _key(self, cr, text):
+        # None if the font cannot be keyed: pycairo returns a new wrapper
+        # from each get_font_face(), so only toy faces, known by family,
+        # slant and weight, can be recognised again
+        face = cr.get_font_face()
+        if not isinstance(face, cairo.ToyFontFace):
+            return None
+        face = (face.get_family(), face.get_slant(), face.get_weight())
+        m = cr.get_font_matrix()
+        # the glyph positions also depend on the rotation/scale of the ctm,
+        # but not on its translation, and on the device scale and the font
+        # options via hinting; the surface type is kept too, as image and
+        # vector surfaces default to different hint metrics
+        ctm = cr.get_matrix()
+        target = cr.get_target()
+        dev = target.get_device_scale()
+        options = cr.get_scaled_font().get_font_options().hash()
+        return (face, m.xx, m.yx, m.xy, m.yy, ctm.xx, ctm.yx, ctm.xy, ctm.yy, dev,
+            target.get_type(), options, text)
+
+    def lookup(self, cr, text):
+        # returns (extents, glyphs), with glyphs positioned relative to (0, 0)
+        key = self._key(cr, text)
+        if key is None:
+            glyphs = cr.get_scaled_font().text_to_glyphs(0, 0, text, False)
+            return cr.text_extents(text), glyphs
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        glyphs = cr.get_scaled_font().text_to_glyphs(0, 0, text, False)
+        entry = (cr.text_extents(text), glyphs)
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def text_extents(self, cr, text):
+        return self.lookup(cr, text)[0]
+
+    def show_text(self, cr, text):
+        # like cr.show_text, including advancing the current point
+        ext, glyphs = self.lookup(cr, text)
+        x, y = cr.get_current_point()
+        cr.show_glyphs([cairo.Glyph(g.index, x + g.x, y + g.y) for g in glyphs])
+        cr.move_to(x + ext.x_advance, y + ext.y_advance)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+# shared cache used by the generators
+text_cache = TextCache()
+
+def text_extents(cr, text):
+    return text_cache.text_extents(cr, text)
+
+def show_text(cr, text):
+    text_cache.show_text(cr, text)
@@ -0,0 +1,168 @@
+"""
+Cut images into a Deep Zoom tile pyramid for a zoomable web viewer.
+
+For an image name.png this writes name.dzi (the Deep Zoom descriptor) and
+name_files/<level>/<column>_<row>.png, where the highest level is the full
+image and each level below is half the size of the one above, down to a
+single pixel.  Each level is made by averaging 2x2 blocks of the level
+above (in premultiplied ARGB, so transparent edges do not darken), not by
+scaling the original again.
+
+Tiles are encoded and written by a pool of worker processes.  The content
+hash of every tile is kept in name_files/manifest.json; a tile whose hash
+has not changed since the last run is not encoded or written again, so
+regenerating after a small change only rewrites the tiles it touched.
+
+    python tiles.py -o tiles ../pinout/pybv10b/pinout.png ../images/PYBv10b-render-*.png
+
+For the pinout, rendering it larger first (pinout.py --scale 2) gives more
+levels to zoom into.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+
+import cairo
+import numpy as np
+
+def load(filename):
+    # (h, w) array of cairo ARGB32 pixels, premultiplied, native endian
+    surface = cairo.ImageSurface.create_from_png(filename)
+    if surface.get_format() != cairo.FORMAT_ARGB32:
+        # RGB24 and the rest: paint onto an ARGB32 surface first
+        argb = cairo.ImageSurface(cairo.FORMAT_ARGB32, surface.get_width(), surface.get_height())
+        cr = cairo.Context(argb)
+        cr.set_source_surface(surface, 0, 0)
+        cr.paint()
+        surface = argb
+    surface.flush()
+    w, h = surface.get_width(), surface.get_height()
+    data = np.ndarray((h, surface.get_stride() // 4), dtype=np.uint32, buffer=surface.get_data())
+    return data[:, :w].copy()
+
+def halve(img):
+    # next level down: each pixel is the rounded mean of a 2x2 block, with
+    # the last row/column repeated when the size is odd
+    h, w = img.shape
+    if h % 2:
+        img = np.concatenate((img, img[-1:]), axis=0)
+    if w % 2:
+        img = np.concatenate((img, img[:, -1:]), axis=1)
+    c = img.view(np.uint8).reshape(img.shape[0], img.shape[1], 4).astype(np.uint16)
+    s = c[0::2, 0::2] + c[1::2, 0::2] + c[0::2, 1::2] + c[1::2, 1::2]
+    out = ((s + 2) >> 2).astype(np.uint8)
+    return np.ascontiguousarray(out).view(np.uint32).reshape(out.shape[0], out.shape[1])
+
+def num_levels(w, h):
+    return int(math.ceil(math.log2(max(w, h)))) + 1
+
+def level_tiles(img, tile, overlap):
+    # yields (column, row, pixels) covering the level, each tile extended by
+    # overlap pixels into its neighbours as Deep Zoom expects
+    h, w = img.shape
+    for row in range(int(math.ceil(h / tile))):
+        for col in range(int(math.ceil(w / tile))):
+            x0 = max(col * tile - overlap, 0)
+            y0 = max(row * tile - overlap, 0)
+            x1 = min((col + 1) * tile + overlap, w)
+            y1 = min((row + 1) * tile + overlap, h)
+            yield col, row, img[y0:y1, x0:x1]
+
+def write_tile(task):
+    # worker: encode one tile as PNG, writing to a temporary file first
+    path, w, h, data = task
+    buf = bytearray(data)
+    surface = cairo.ImageSurface.create_for_data(buf, cairo.FORMAT_ARGB32, w, h, 4 * w)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    surface.write_to_png(tmp)
+    surface.finish()
+    os.replace(tmp, path)
+    return path
+
+def write_dzi(filename, w, h, tile, overlap):
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="%d" Overlap="%d" Format="png">\n' % (tile, overlap))
+        f.write('  <Size Width="%d" Height="%d"/>\n' % (w, h))
+        f.write('</Image>\n')
+
+def make_pyramid(filename, outdir, pool, tile=256, overlap=1):
+    # returns (tiles written, tiles unchanged)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    files_dir = os.path.join(outdir, name + '_files')
+    manifest_file = os.path.join(files_dir, 'manifest.json')
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get('tile') != [tile, overlap]:
+        manifest = {}
+    hashes = manifest.get('hashes', {})
+    new_hashes = {}
+
+    img = load(filename)
+    h, w = img.shape
+    levels = num_levels(w, h)
+    tasks = []
+    skipped = 0
+    for level in range(levels - 1, -1, -1):
+        level_dir = os.path.join(files_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for col, row, pixels in level_tiles(img, tile, overlap):
+            rel = '%d/%d_%d.png' % (level, col, row)
+            data = np.ascontiguousarray(pixels).tobytes()
+            digest = hashlib.sha1(b'%d %d ' % pixels.shape[::-1] + data).hexdigest()
+            new_hashes[rel] = digest
+            path = os.path.join(files_dir, rel)
+            if hashes.get(rel) == digest and os.path.exists(path):
+                skipped += 1
+                continue
+            tasks.append((path, pixels.shape[1], pixels.shape[0], data))
+        if level:
+            img = halve(img)
+
+    # encode the changed tiles in parallel; the manifest is written last,
+    # so an interrupted run is redone next time
+    written = 0
+    for _ in pool.imap_unordered(write_tile, tasks, chunksize=8):
+        written += 1
+
+    # tiles of levels that no longer exist (the image got smaller)
+    for rel in set(hashes) - set(new_hashes):
+        try:
+            os.remove(os.path.join(files_dir, rel))
+        except OSError:
+            pass
+
+    write_dzi(os.path.join(outdir, name + '.dzi'), w, h, tile, overlap)
+    tmp = manifest_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'tile': [tile, overlap], 'size': [w, h], 'hashes': new_hashes}, f, indent=0, sort_keys=True)
+    os.replace(tmp, manifest_file)
+    return written, skipped
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description='Make Deep Zoom tile pyramids from PNG images.')
+    cmd_parser.add_argument('image', nargs='+', help='PNG images')
+    cmd_parser.add_argument('-o', '--outdir', default='tiles', help='output directory (default tiles)')
+    cmd_parser.add_argument('-t', '--tile', type=int, default=256, help='tile size in pixels (default 256)')
+    cmd_parser.add_argument('--overlap', type=int, default=1, help='pixels of overlap between tiles (default 1)')
+    cmd_parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of cores)')
+    args = cmd_parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    with multiprocessing.Pool(args.jobs) as pool:
+        for filename in args.image:
+            written, skipped = make_pyramid(filename, args.outdir, pool, args.tile, args.overlap)
+            print('%s: %d tiles written, %d unchanged' % (filename, written, skipped))
+
+if __name__ == '__main__':
+    main()
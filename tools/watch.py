@@ -0,0 +1,236 @@
+"""
+Watch mode for the pinout generators.
+
+run() keeps the generator loaded and renders again whenever one of its
+inputs changes, so an edit to a label position costs a render of what
+changed rather than Python startup, the cairo import, CSV parsing and a
+full render:
+
+    data files (CSV, PNG, Eagle)   module.refresh(changed) drops or reloads
+                                   what depends on them
+    the generator itself, pins.py  the generator module is loaded again
+    or a tools/ module             (after reloading the changed modules);
+                                   the new module takes over the caches
+                                   that are still valid with
+                                   adopt(old, changed)
+
+Changes are picked up with inotify (through ctypes, on Linux), watching
+the directories of the inputs so editors that save by renaming are seen
+too, or by polling the files where inotify is not available.  Each image
+is rendered to a temporary file and renamed over the output, so a viewer
+never sees a partial file.  An error in a render or in the edited code is
+printed and the previous image is left in place until the next change.
+
+This file is part of the Micro Python project, http://micropython.org/
+Licensed under the The MIT License
+"""
+
+import ctypes
+import ctypes.util
+import importlib
+import importlib.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+import types
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_CLOEXEC = 0o2000000
+
+_event = struct.Struct('iIII')
+
+# quiet time that ends a burst of events, eg an editor writing a backup
+SETTLE = 0.05
+
+class Watcher:
+    # wait() returns the set of watched paths that changed since the last
+    # wait(), including while the caller was busy between waits
+    def __init__(self, paths, interval=0.2):
+        self.paths = set()
+        self.interval = interval
+        self.fd = None
+        self.stats = {}
+        try:
+            self._init_inotify()
+        except (OSError, AttributeError):
+            self.fd = None
+        self.update(paths)
+
+    def _init_inotify(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.dirs = {}
+        self.fd = fd
+
+    def update(self, paths):
+        # watch these paths from now on; changes to paths that were watched
+        # before are kept until the next wait()
+        self.paths = {os.path.abspath(p) for p in paths}
+        if self.fd is not None:
+            for d in sorted({os.path.dirname(p) for p in self.paths} - set(self.dirs.values())):
+                wd = self._libc.inotify_add_watch(self.fd, d.encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), 'inotify_add_watch %s' % d)
+                self.dirs[wd] = d
+        else:
+            for p in self.paths - set(self.stats):
+                self.stats[p] = self._stat(p)
+
+    @property
+    def method(self):
+        return 'polling' if self.fd is None else 'inotify'
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read_events(self, timeout):
+        changed = set()
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r:
+            return changed
+        buf = os.read(self.fd, 65536)
+        i = 0
+        while i < len(buf):
+            wd, mask, cookie, n = _event.unpack_from(buf, i)
+            name = buf[i + _event.size:i + _event.size + n].rstrip(b'\0').decode(errors='replace')
+            i += _event.size + n
+            path = os.path.join(self.dirs.get(wd, ''), name)
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+    def wait(self):
+        if self.fd is not None:
+            changed = set()
+            while not changed:
+                changed = self._read_events(None)
+            # take the rest of the burst
+            while True:
+                more = self._read_events(SETTLE)
+                if not more:
+                    return changed
+                changed |= more
+        while True:
+            time.sleep(self.interval)
+            changed = set()
+            for p in self.paths:
+                s = self._stat(p)
+                if s != self.stats[p]:
+                    self.stats[p] = s
+                    changed.add(p)
+            if changed:
+                return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def code_key(func, namespace=None):
+    # a fingerprint of what a function does: its bytecode and constants
+    # (not line numbers, so edits elsewhere in the file do not change it)
+    # and, given its module namespace, the values of the plain globals it
+    # uses and the code of the functions it calls there
+    def key(code):
+        consts = tuple(key(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts)
+        return (code.co_code, consts, code.co_names)
+
+    k = [key(func.__code__)]
+    if namespace is not None:
+        for name in func.__code__.co_names:
+            v = namespace.get(name)
+            if isinstance(v, types.FunctionType):
+                k.append((name, key(v.__code__)))
+            elif isinstance(v, (int, float, str, tuple, list, dict)):
+                k.append((name, repr(v)))
+    return tuple(k)
+
+def reload_module(module, changed=()):
+    # a fresh copy of the module, run from its (edited) source; it takes
+    # over the old module's still valid caches if it has adopt(), which is
+    # given the changed source files
+    name = module.__name__
+    if name == '__main__':
+        # a script: do not run its main() again
+        name = os.path.splitext(os.path.basename(module.__file__))[0]
+    spec = importlib.util.spec_from_file_location(name, module.__file__)
+    new = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(new)
+    if hasattr(new, 'adopt'):
+        new.adopt(module, changed)
+    return new
+
+def write_atomic(filename, render):
+    # render(tmp) then rename over filename
+    base, ext = os.path.splitext(filename)
+    tmp = '%s.%d.tmp%s' % (base, os.getpid(), ext)
+    try:
+        render(tmp)
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _loaded_module(path):
+    # the module in sys.modules that was loaded from path, if any
+    for mod in list(sys.modules.values()):
+        if os.path.abspath(getattr(mod, '__file__', None) or '') == path:
+            return mod
+    return None
+
+def run(module, render, output):
+    # render(module, filename) makes the image; module has build_sources()
+    # and optionally refresh(changed) and adopt(old, changed)
+    if output == '-':
+        raise ValueError('--watch needs an output file')
+    main_file = os.path.abspath(module.__file__)
+
+    def render_now():
+        t0 = time.perf_counter()
+        write_atomic(output, lambda tmp: render(module, tmp))
+        print('wrote %s in %.0f ms' % (output, 1e3 * (time.perf_counter() - t0)))
+        sys.stdout.flush()
+
+    # one watcher for the session, started before the first render, so a
+    # file saved during a render is seen by the next wait()
+    watcher = Watcher(module.build_sources())
+    try:
+        render_now()
+        print('watching %d files (%s), ^C to stop' % (len(watcher.paths), watcher.method))
+        sys.stdout.flush()
+        while True:
+            changed = watcher.wait()
+            print('changed:', ', '.join(sorted(os.path.basename(p) for p in changed)))
+            try:
+                code = sorted(p for p in changed if p.endswith('.py'))
+                data = {p for p in changed if not p.endswith('.py')}
+                if code:
+                    for path in code:
+                        mod = _loaded_module(path)
+                        if mod is not None and path != main_file:
+                            importlib.reload(mod)
+                    module = reload_module(module, code)
+                if data and hasattr(module, 'refresh'):
+                    module.refresh(data)
+                render_now()
+            except Exception:
+                traceback.print_exc()
+                print('keeping the previous image')
+            # the sources may have changed with the code
+            watcher.update(module.build_sources())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()